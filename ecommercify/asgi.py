@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommercify.settings')
+# Async views run their queries on sync_to_async threads, each of which
+# would keep its own persistent connection: close connections after each
+# request unless DB_CONN_MAX_AGE says otherwise (see settings.DATABASES)
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
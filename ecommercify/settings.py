@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 from pathlib import Path
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -44,10 +46,13 @@ INSTALLED_APPS = [
     'corsheaders',
     'rest_framework',
     'rest_framework.authtoken',
+    'django_filters',
     'panel'
 ]
 
 MIDDLEWARE = [
+    # First, so its measurements cover the whole stack
+    'panel.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Add here
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -83,17 +88,196 @@ TEMPLATES = [
 WSGI_APPLICATION = 'ecommercify.wsgi.application'
 
 
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+REST_FRAMEWORK = {
+    # Keyset pagination keeps list endpoints flat regardless of table size;
+    # clients may ask for up to StableCursorPagination.max_page_size rows.
+    'DEFAULT_PAGINATION_CLASS': 'panel.pagination.StableCursorPagination',
+    'PAGE_SIZE': int(os.environ.get('API_PAGE_SIZE', 50)),
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'panel.authentication.CachedTokenAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+    'DEFAULT_FILTER_BACKENDS': [
+        'django_filters.rest_framework.DjangoFilterBackend',
+        'rest_framework.filters.SearchFilter',
+        'panel.filters.StableOrderingFilter',
+    ],
+}
+
+
+# In-process token -> user cache used by CachedTokenAuthentication. Revoked
+# tokens and deactivated users are dropped at once by the worker making the
+# change, other workers may accept them for up to TTL seconds (at most 5).
+# SHARED_CACHE names an entry of CACHES shared by all workers to share hits
+# for SHARED_TTL seconds; revocations remove them from it right away.
+TOKEN_AUTH_CACHE = {
+    'MAX_SIZE': 10_000,
+    'TTL': 5,
+    'SHARED_CACHE': os.environ.get('TOKEN_AUTH_SHARED_CACHE') or None,
+    'SHARED_TTL': 300,
+}
+
+
+# Seconds a user's accessible stores and roles stay cached (panel.tenancy),
+# in the TENANT_SCOPE_CACHE entry of CACHES when it is shared by all workers.
+# Staff and Store changes invalidate the affected entries right away. Without
+# a shared cache scopes stay in each process for at most 5 seconds, so other
+# workers may serve a fired staff member or miss a new store that long.
+TENANT_SCOPE_TTL = int(os.environ.get('TENANT_SCOPE_TTL', 300))
+
+TENANT_SCOPE_CACHE = os.environ.get('TENANT_SCOPE_CACHE') or None
+
+
+# Default lease, in seconds, of orders claimed from a work queue
+# (POST /api/orders/claim/); unfinished orders then go back to the queue.
+ORDER_CLAIM_LEASE = int(os.environ.get('ORDER_CLAIM_LEASE', 900))
+
+
+# In-process code -> promo code cache used to validate codes. Redemption
+# always checks the database; TTL bounds how stale validation may be.
+PROMO_CODE_CACHE = {
+    'MAX_SIZE': 10_000,
+    'TTL': int(os.environ.get('PROMO_CODE_CACHE_TTL', 30)),
+}
+
+
+# Per-route latency / SQL / serialization histograms (panel.middleware),
+# exposed at /api/metrics/. SAMPLE_RATE is the share of requests measured;
+# SERVER_TIMING adds a `Server-Timing` header to measured responses.
+PERFORMANCE_METRICS = {
+    'SAMPLE_RATE': float(os.environ.get('PERF_SAMPLE_RATE', 0.1)),
+    'SERVER_TIMING': os.environ.get('PERF_SERVER_TIMING', '1' if DEBUG else '0') == '1',
+    'MAX_ROUTES': 200,
+}
+
+
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+#
+# DB_ENGINE picks the profile: 'sqlite' (default, local and edge deployments)
+# or 'postgresql' (production).
+#
+# DB_CONN_MAX_AGE defaults to 60 (persistent connections) under WSGI and to 0
+# under ASGI (ecommercify.asgi sets it before loading the settings): there
+# each sync_to_async thread would otherwise hold a connection of its own.
+# Under ASGI use the PostgreSQL pool (DB_POOL) rather than raising it.
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    # Django's psycopg pool (needs psycopg[pool]) replaces persistent
+    # connections, so CONN_MAX_AGE stays 0 with it. Set DB_POOL=0 behind an
+    # external pooler such as PgBouncer to keep persistent connections instead.
+    DB_POOL = os.environ.get('DB_POOL', '1') == '1'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'ecommercify'),
+            'USER': os.environ.get('DB_USER', 'ecommercify'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+                    'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+                    'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+                } if DB_POOL else False,
+            },
+        }
+    }
+elif DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Run on every new connection: WAL lets readers work alongside the
+                # writer, busy_timeout queues writers instead of failing with
+                # "database is locked", and NORMAL syncs on checkpoints only.
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    f'PRAGMA busy_timeout={int(os.environ.get("DB_BUSY_TIMEOUT", 5000))};'
+                    'PRAGMA synchronous=NORMAL'
+                ),
+                # Take the write lock at BEGIN, so a transaction that reads and then
+                # writes waits on busy_timeout rather than failing to upgrade its lock
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
     }
+else:
+    raise ImproperlyConfigured(f"DB_ENGINE must be 'sqlite' or 'postgresql', not {DB_ENGINE!r}.")
+
+# Read replicas: DB_REPLICAS is a comma-separated list of replica SQLite files
+# or PostgreSQL hosts, exposed as the aliases replica, replica2, ... Safe list,
+# retrieve, export and stats requests read from them (see
+# panel.views.replica_views); a user who writes reads from the primary for
+# READ_YOUR_WRITES_WINDOW seconds afterwards. That pin is kept in the
+# READ_YOUR_WRITES_CACHE entry of CACHES, which must be shared by all workers
+# once replicas are configured (see SHARED_CACHE_* below).
+REPLICA_DATABASES = []
+for index, replica in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), 1):
+    alias = 'replica' if index == 1 else f'replica{index}'
+    DATABASES[alias] = {**DATABASES['default'], ('HOST' if DB_ENGINE == 'postgresql' else 'NAME'): replica.strip()}
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['panel.db_routers.ReplicaRouter']
+
+READ_YOUR_WRITES_WINDOW = int(os.environ.get('READ_YOUR_WRITES_WINDOW', 5))
+
+READ_YOUR_WRITES_CACHE = os.environ.get('READ_YOUR_WRITES_CACHE', 'default')
+
+
+# Seconds between runs of the periodic subscription expiry sweep, scheduled by
+# the task worker (manage.py run_tasks); `manage.py expire_subscriptions` runs
+# it once, e.g. from cron.
+SUBSCRIPTION_EXPIRY_INTERVAL = int(os.environ.get('SUBSCRIPTION_EXPIRY_INTERVAL', 300))
+
+# Days finished (DONE or FAILED) background tasks are kept before the hourly
+# `prune_finished_tasks` task deletes them with their idempotency keys.
+TASK_RETENTION_DAYS = int(os.environ.get('TASK_RETENTION_DAYS', 7))
+
+
+# Order event feed (GET /api/order-events/), streamed as Server-Sent Events
+# or long-polled with ?since=. CACHE names an entry of CACHES shared by all
+# workers (e.g. Redis or Memcached): waiting clients then check per-store
+# counters in it every POLL_INTERVAL seconds and only query the database when
+# they moved, or every RECHECK_INTERVAL seconds in case a signal was lost.
+# Without one (process-local caches such as LocMemCache do not count), they
+# query the database every POLL_INTERVAL seconds instead.
+ORDER_EVENTS = {
+    'CACHE': os.environ.get('ORDER_EVENTS_CACHE') or None,
+    'POLL_INTERVAL': 1.0,
+    'RECHECK_INTERVAL': int(os.environ.get('ORDER_EVENTS_RECHECK_INTERVAL', 15)),
+    # Idle streams send a comment this often so proxies keep them open
+    'HEARTBEAT': 15,
+    # Streams end after this long; EventSource reconnects with Last-Event-ID
+    'STREAM_DURATION': 300,
+    'LONG_POLL_TIMEOUT': 25,
+    'BATCH_SIZE': 100,
+    # Events older than this are pruned by the task worker every hour
+    'RETENTION_DAYS': int(os.environ.get('ORDER_EVENTS_RETENTION_DAYS', 7)),
 }
 
 
+# Email
+# Order emails are sent by the background task worker (manage.py run_tasks).
+
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'orders@ecommercify.local')
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -137,3 +321,23 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ecommercify',
+    }
+}
+
+# SHARED_CACHE_BACKEND and SHARED_CACHE_LOCATION add a `shared` cache for the
+# settings that need one all workers see, e.g.
+# django.core.cache.backends.redis.RedisCache and redis://127.0.0.1:6379.
+if os.environ.get('SHARED_CACHE_BACKEND'):
+    CACHES['shared'] = {
+        'BACKEND': os.environ['SHARED_CACHE_BACKEND'],
+        'LOCATION': os.environ.get('SHARED_CACHE_LOCATION', ''),
+    }
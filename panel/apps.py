@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class PanelConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'panel'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from . import signals, tasks  # noqa: F401
+        from .db_routers import check_pin_cache
+        from .metrics import install_recorder
+
+        check_pin_cache()
+
+        # Every new connection, on any thread, reports to the sampled request's recorder
+        connection_created.connect(install_recorder, dispatch_uid='panel.metrics.install_recorder')
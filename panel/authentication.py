@@ -0,0 +1,69 @@
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+from .caching import TTLCache, shared_cache
+
+
+TOKEN_AUTH_CACHE = getattr(settings, 'TOKEN_AUTH_CACHE', {})
+
+# Seconds a revoked token or deactivated user may still be accepted by
+# workers other than the one that made the change
+MAX_LOCAL_TTL = 5
+
+# token key -> (user, token), shared by every request served by this process
+token_cache = TTLCache(
+    max_size=TOKEN_AUTH_CACHE.get('MAX_SIZE', 10_000),
+    ttl=min(TOKEN_AUTH_CACHE.get('TTL', MAX_LOCAL_TTL), MAX_LOCAL_TTL),
+)
+
+
+def shared_token_cache():
+    """
+    Return the cross-process cache configured for tokens, or None when none
+    is or it is process-local.
+    """
+    return shared_cache(getattr(settings, 'TOKEN_AUTH_CACHE', {}).get('SHARED_CACHE'))
+
+
+def shared_cache_key(key):
+    return f'panel:token:{key}'
+
+
+def invalidate_tokens(keys):
+    """
+    Forget cached credentials for the given token keys.
+    """
+    keys = list(keys)
+    for key in keys:
+        token_cache.delete(key)
+    shared = shared_token_cache()
+    if shared is not None and keys:
+        shared.delete_many([shared_cache_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that keeps token -> user in an in-process LRU+TTL
+    cache, backed by an optional shared Django cache, so an authenticated
+    request does not need the Token + User join on every call.
+
+    Entries are dropped by signal handlers when a token is deleted or its
+    user is saved (e.g. deactivated), from the shared cache too. Other
+    processes may still accept it from their in-process cache, whose TTL
+    is therefore capped at MAX_LOCAL_TTL seconds.
+    """
+
+    def authenticate_credentials(self, key):
+        credentials = token_cache.get(key)
+        if credentials is not None:
+            return credentials
+
+        shared = shared_token_cache()
+        if shared is not None:
+            credentials = shared.get(shared_cache_key(key))
+        if credentials is None:
+            credentials = super().authenticate_credentials(key)
+            if shared is not None:
+                shared.set(shared_cache_key(key), credentials, timeout=TOKEN_AUTH_CACHE.get('SHARED_TTL', 300))
+        token_cache.set(key, credentials)
+        return credentials
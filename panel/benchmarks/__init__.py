@@ -0,0 +1,8 @@
+"""
+Reproducible benchmarks of the panel API.
+
+`seed.py` generates a realistic data set with bulk inserts (management
+command `seed_benchmark`), `scenarios.py` replays API calls against the real
+URLconf and measures them (management command `run_benchmarks`). Run both
+against a scratch database, e.g. `DB_NAME=/tmp/bench.sqlite3`.
+"""
@@ -0,0 +1,207 @@
+import json
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import ExitStack
+
+import django
+from django.conf import settings
+from django.db import connection, connections
+from django.test import Client
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from ..models import Store, Product, Order, OrderStatus
+from .seed import BENCHMARK_EMAIL, BENCHMARK_PASSWORD
+
+
+class BenchmarkContext:
+    """
+    What the scenarios draw from: an authenticated client for the real
+    URLconf and ids of seeded rows, picked with a seeded random generator.
+    """
+
+    def __init__(self, seed=0, pending_orders=1_000):
+        token = Token.objects.select_related('user').filter(user__username=BENCHMARK_EMAIL).first()
+        if token is None:
+            raise LookupError('No benchmark data, run `manage.py seed_benchmark` first.')
+        self.rng = random.Random(seed)
+        self.client = Client(headers={'authorization': f'Token {token.key}'}, raise_request_exception=False)
+        self.store_ids = [str(pk) for pk in Store.objects.values_list('pk', flat=True)]
+        self.order_ids = [str(pk) for pk in Order.objects.order_by('-created_at').values_list('pk', flat=True)[:1_000]]
+        self.products = {}
+        for pk, store_id in Product.objects.filter(stock__gt=100).values_list('pk', 'store_id'):
+            self.products.setdefault(str(store_id), []).append(str(pk))
+        # Transitions consume pending orders, each can only move once
+        self.pending_orders = iter([
+            str(pk) for pk in Order.objects.filter(status=OrderStatus.PENDING).values_list('pk', flat=True)[:pending_orders]
+        ])
+
+    def pick(self, values):
+        return self.rng.choice(values)
+
+    def post_json(self, path, data):
+        return self.client.post(path, json.dumps(data), content_type='application/json')
+
+
+def list_orders(context):
+    return context.client.get('/api/orders/', {'store': context.pick(context.store_ids)})
+
+
+def list_products(context):
+    return context.client.get('/api/products/', {'store': context.pick(context.store_ids), 'in_stock': 'true'})
+
+
+def retrieve_order(context):
+    return context.client.get(f'/api/orders/{context.pick(context.order_ids)}/')
+
+
+def create_order(context):
+    store_id = context.pick([pk for pk in context.store_ids if pk in context.products])
+    products = context.rng.sample(context.products[store_id], min(2, len(context.products[store_id])))
+    return context.post_json('/api/orders/bulk/', {'orders': [{
+        'store': store_id,
+        'customer_name': 'Benchmark customer',
+        'customer_email': 'benchmark-customer@example.com',
+        'items': [{'product': product, 'quantity': 1} for product in products],
+    }]})
+
+
+def transition_order(context):
+    order_id = next(context.pending_orders, None)
+    if order_id is None:
+        return None
+    return context.post_json(f'/api/orders/{order_id}/transition/', {'status': OrderStatus.IN_CONFIRMATION})
+
+
+def login(context):
+    return context.post_json('/api/auth/login/', {'email': BENCHMARK_EMAIL, 'password': BENCHMARK_PASSWORD})
+
+
+# Scenario name -> function making one request and returning its response
+# (None when the scenario ran out of data)
+SCENARIOS = {
+    'list_orders': list_orders,
+    'list_products': list_products,
+    'retrieve_order': retrieve_order,
+    'create_order': create_order,
+    'transition_order': transition_order,
+    'login': login,
+}
+
+
+class QueryCounter:
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in kilobytes on Linux, in bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def run_scenario(run, context, requests, warmup):
+    """
+    Make `warmup` unmeasured then `requests` measured calls of scenario
+    `run` and return their latency percentiles, queries per request and the
+    process's peak RSS afterwards.
+    """
+    for _ in range(warmup):
+        if run(context) is None:
+            break
+    latencies, queries, errors = [], [], 0
+    counter = QueryCounter()
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(counter))
+        started = time.perf_counter()
+        for _ in range(requests):
+            counter.count = 0
+            start = time.perf_counter()
+            response = run(context)
+            if response is None:
+                break
+            latencies.append(time.perf_counter() - start)
+            queries.append(counter.count)
+            if response.status_code >= 400:
+                errors += 1
+        elapsed = time.perf_counter() - started
+
+    result = {'requests': len(latencies), 'errors': errors, 'peak_rss_mb': round(peak_rss_mb(), 1)}
+    if len(latencies) >= 2:
+        cuts = statistics.quantiles(latencies, n=100)
+        result.update(
+            throughput_rps=round(len(latencies) / elapsed, 1),
+            mean_ms=round(statistics.fmean(latencies) * 1000, 3),
+            p50_ms=round(cuts[49] * 1000, 3),
+            p95_ms=round(cuts[94] * 1000, 3),
+            p99_ms=round(cuts[98] * 1000, 3),
+            queries_mean=round(statistics.fmean(queries), 2),
+            queries_max=max(queries),
+        )
+    return result
+
+
+def run_benchmarks(names=None, requests=200, warmup=20, seed=0, log=lambda name, result: None):
+    """
+    Run the given scenarios (all by default) and return the results with
+    the metadata needed to compare runs.
+    """
+    context = BenchmarkContext(seed=seed, pending_orders=requests + warmup)
+    results = {}
+    for name in names or SCENARIOS:
+        results[name] = run_scenario(SCENARIOS[name], context, requests, warmup)
+        log(name, results[name])
+    return {
+        'meta': {
+            'started_at': timezone.now().isoformat(),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'debug': settings.DEBUG,
+            'requests': requests,
+            'warmup': warmup,
+            'seed': seed,
+            'rows': {
+                'stores': len(context.store_ids),
+                'orders': Order.objects.count(),
+                'products': Product.objects.count(),
+            },
+        },
+        'scenarios': results,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, metrics=('p50_ms', 'p95_ms', 'p99_ms', 'queries_mean', 'peak_rss_mb')):
+    """
+    Yield (scenario, metric, baseline value, current value, change in %)
+    for the scenarios both runs measured.
+    """
+    for name, result in current['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if before is None:
+            continue
+        for metric in metrics:
+            if metric in before and metric in result:
+                change = (result[metric] - before[metric]) / before[metric] * 100 if before[metric] else 0.0
+                yield name, metric, before[metric], result[metric], change
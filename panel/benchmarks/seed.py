@@ -0,0 +1,166 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from ..models import User, Store, Staff, StaffRole, Product, Order, OrderItem, OrderLog, OrderStatus, PromoCode, Subscription
+from ..services.rollups import rebuild_rollups
+from ..tenancy import invalidate_tenant_scopes
+
+
+# Credentials of the API account the scenarios log in with
+BENCHMARK_EMAIL = 'benchmark@example.com'
+BENCHMARK_PASSWORD = 'benchmark'
+
+# Share of orders currently in each status
+STATUS_WEIGHTS = {
+    OrderStatus.PENDING: 15,
+    OrderStatus.IN_CONFIRMATION: 10,
+    OrderStatus.IN_DISPATCH: 8,
+    OrderStatus.IN_DELIVERY: 7,
+    OrderStatus.DELIVERED: 45,
+    OrderStatus.RETURNED: 5,
+    OrderStatus.CANCELED: 10,
+}
+
+# Statuses an order went through to reach each status, in order
+STATUS_PATHS = {
+    OrderStatus.PENDING: [OrderStatus.PENDING],
+    OrderStatus.IN_CONFIRMATION: [OrderStatus.PENDING, OrderStatus.IN_CONFIRMATION],
+    OrderStatus.IN_DISPATCH: [OrderStatus.PENDING, OrderStatus.IN_CONFIRMATION, OrderStatus.IN_DISPATCH],
+    OrderStatus.IN_DELIVERY: [OrderStatus.PENDING, OrderStatus.IN_CONFIRMATION, OrderStatus.IN_DISPATCH,
+                              OrderStatus.IN_DELIVERY],
+    OrderStatus.DELIVERED: [OrderStatus.PENDING, OrderStatus.IN_CONFIRMATION, OrderStatus.IN_DISPATCH,
+                            OrderStatus.IN_DELIVERY, OrderStatus.DELIVERED],
+    OrderStatus.RETURNED: [OrderStatus.PENDING, OrderStatus.IN_CONFIRMATION, OrderStatus.IN_DISPATCH,
+                           OrderStatus.IN_DELIVERY, OrderStatus.RETURNED],
+    OrderStatus.CANCELED: [OrderStatus.PENDING, OrderStatus.CANCELED],
+}
+
+
+@contextmanager
+def manual_timestamps(model, *field_names):
+    """
+    Temporarily disable auto_now/auto_now_add so seeded rows can carry
+    historical timestamps through bulk_create.
+    """
+    fields = [model._meta.get_field(name) for name in field_names]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def seed_data(stores=10, products=100, orders=10_000, subscriptions=2_000, days=365, batch_size=5_000, seed=0,
+              log=lambda message: None):
+    """
+    Insert a synthetic but realistic data set with bulk_create and return
+    the number of rows created per model.
+
+    `products` is per store. Orders spread over the last `days` days with
+    1-4 items each and one OrderLog row per status they went through. The
+    same `seed` always produces the same data, apart from primary keys and
+    the current time.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    counts = dict.fromkeys(('stores', 'staff', 'products', 'orders', 'items', 'logs', 'subscriptions', 'promo_codes'), 0)
+    prefix = f'bench-{now.timestamp():.0f}'
+
+    with transaction.atomic():
+        api_user = get_user_model().objects.filter(username=BENCHMARK_EMAIL).first()
+        if api_user is None:
+            api_user = get_user_model().objects.create_user(
+                username=BENCHMARK_EMAIL, email=BENCHMARK_EMAIL, password=BENCHMARK_PASSWORD,
+            )
+        Token.objects.get_or_create(user=api_user)
+        # Its panel user manages every seeded store, so tenant scoping lets it see them
+        member = User.objects.filter(email=BENCHMARK_EMAIL).first()
+        if member is None:
+            member = User.objects.create_user(email=BENCHMARK_EMAIL, name='Benchmark')
+
+        owners = User.objects.bulk_create(
+            User(email=f'{prefix}-owner{i}@example.com', name=f'Owner {i}') for i in range(stores)
+        )
+        store_rows = Store.objects.bulk_create(
+            Store(name=f'Store {i}', owner=owner) for i, owner in enumerate(owners)
+        )
+        staff_users = User.objects.bulk_create(
+            User(email=f'{prefix}-staff{i}@example.com', name=f'Staff {i}') for i in range(stores * 3)
+        )
+        Staff.objects.bulk_create([
+            *(Staff(store=store_rows[i // 3], user=user, role=rng.choice(StaffRole.values))
+              for i, user in enumerate(staff_users)),
+            *(Staff(store=store, user=member, role=StaffRole.MANAGER) for store in store_rows),
+        ])
+        catalog = {
+            store.pk: Product.objects.bulk_create(
+                Product(store=store, name=f'Product {i}', description=f'Description of product {i}',
+                        price=Decimal(rng.randint(100, 20_000)) / 100, stock=rng.randint(10_000, 100_000))
+                for i in range(products)
+            )
+            for store in store_rows
+        }
+        customers = User.objects.bulk_create(
+            User(email=f'{prefix}-customer{i}@example.com', name=f'Customer {i}') for i in range(max(subscriptions // 2, 1))
+        )
+        promo_codes = PromoCode.objects.bulk_create(
+            PromoCode(code=f'{prefix.upper()}-{i}', discount_percentage=rng.choice([5, 10, 15, 20]),
+                      max_usage=rng.randint(1, 1_000), valid_from=now - timedelta(days=rng.randint(0, days)),
+                      valid_until=now + timedelta(days=rng.randint(-30, days)))
+            for i in range(max(subscriptions // 4, 1))
+        )
+        Subscription.objects.bulk_create(
+            Subscription(user=rng.choice(customers), store=rng.choice(store_rows),
+                         promo_code=rng.choice(promo_codes) if rng.random() < 0.2 else None,
+                         end_date=now + timedelta(days=rng.randint(-days, days)), is_trial=rng.random() < 0.1)
+            for _ in range(subscriptions)
+        )
+        counts.update(stores=stores, staff=len(staff_users), products=stores * products,
+                      subscriptions=subscriptions, promo_codes=len(promo_codes))
+
+    statuses, weights = list(STATUS_WEIGHTS), list(STATUS_WEIGHTS.values())
+    with manual_timestamps(Order, 'created_at', 'updated_at'), manual_timestamps(OrderLog, 'changed_at'):
+        for offset in range(0, orders, batch_size):
+            with transaction.atomic():
+                batch, items, logs = [], [], []
+                for _ in range(min(batch_size, orders - offset)):
+                    store = rng.choice(store_rows)
+                    created_at = now - timedelta(seconds=rng.randint(0, days * 24 * 3600))
+                    path = STATUS_PATHS[rng.choices(statuses, weights)[0]]
+                    order = Order(store=store, customer_name=f'Customer {rng.randint(1, 50_000)}',
+                                  customer_email=f'customer{rng.randint(1, 50_000)}@example.com',
+                                  status=path[-1], created_at=created_at, updated_at=created_at)
+                    changed_at = created_at
+                    for status in path:
+                        logs.append(OrderLog(order=order, status=status, changed_by=rng.choice(owners),
+                                             changed_at=changed_at))
+                        order.updated_at = changed_at
+                        changed_at = min(changed_at + timedelta(minutes=rng.randint(5, 3 * 24 * 60)), now)
+                    for product in rng.sample(catalog[store.pk], rng.randint(1, min(4, products))):
+                        quantity = rng.randint(1, 5)
+                        items.append(OrderItem(order=order, product=product, quantity=quantity,
+                                               unit_price=product.price, total_price=quantity * product.price))
+                    batch.append(order)
+                Order.objects.bulk_create(batch)
+                OrderItem.objects.bulk_create(items)
+                OrderLog.objects.bulk_create(logs)
+            counts['orders'] += len(batch)
+            counts['items'] += len(items)
+            counts['logs'] += len(logs)
+            log(f'{counts["orders"]} orders')
+
+    # Stats endpoints read the rollup, keep it consistent with the new orders
+    rebuild_rollups()
+    # bulk_create sends no signals
+    invalidate_tenant_scopes(emails=[BENCHMARK_EMAIL])
+    return counts
@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+_MISSING = object()
+
+
+def is_process_local(cache):
+    """
+    Whether entries of Django cache `cache` are invisible to other worker
+    processes (LocMemCache keeps them in memory, DummyCache not at all).
+    """
+    return isinstance(cache, (LocMemCache, DummyCache))
+
+
+def shared_cache(alias):
+    """
+    Return Django cache `alias` if it is shared across processes, or None
+    when `alias` is unset or names a process-local cache.
+    """
+    if not alias or is_process_local(caches[alias]):
+        return None
+    return caches[alias]
+
+
+class TTLCache:
+    """
+    Small thread-safe in-process LRU cache whose entries also expire after
+    `ttl` seconds. Keeps hit/miss counters so callers can expose them.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            value, expires_at = self._data.get(key, (_MISSING, 0))
+            if value is _MISSING or expires_at < time.monotonic():
+                self._data.pop(key, None)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._data), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses}
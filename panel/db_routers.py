@@ -0,0 +1,92 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+
+from .caching import is_process_local
+
+
+# Alias reads of the current request are sent to, None for the primary
+_read_alias = ContextVar('panel_read_alias', default=None)
+
+
+def replica_aliases():
+    return getattr(settings, 'REPLICA_DATABASES', [])
+
+
+def choose_replica():
+    """
+    Return a replica alias to read from, or None when none is configured.
+    """
+    aliases = replica_aliases()
+    return random.choice(aliases) if aliases else None
+
+
+@contextmanager
+def reading_from(alias):
+    """
+    Route reads made inside the block to `alias` (None means the primary).
+    """
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def pin_cache():
+    return caches[getattr(settings, 'READ_YOUR_WRITES_CACHE', 'default')]
+
+
+def check_pin_cache():
+    """
+    Refuse replicas unless primary pins are kept in a cache every worker
+    sees: a pin set by the worker that served a write would otherwise not
+    stop the next request, served by another one, from reading a lagging
+    replica.
+    """
+    if replica_aliases() and is_process_local(pin_cache()):
+        raise ImproperlyConfigured(
+            'DB_REPLICAS requires READ_YOUR_WRITES_CACHE to name a cache shared by all workers, '
+            f'{getattr(settings, "READ_YOUR_WRITES_CACHE", "default")!r} is process-local.'
+        )
+
+
+def primary_pin_key(user):
+    return f'panel:primary-pin:{user.pk}'
+
+
+def pin_to_primary(user):
+    """
+    Serve `user`'s reads from the primary for READ_YOUR_WRITES_WINDOW
+    seconds, so replication lag never hides their own writes.
+    """
+    pin_cache().set(primary_pin_key(user), True, getattr(settings, 'READ_YOUR_WRITES_WINDOW', 5))
+
+
+def is_pinned_to_primary(user):
+    return pin_cache().get(primary_pin_key(user), False)
+
+
+class ReplicaRouter:
+    """
+    Writes always go to `default`. Reads go to `default` as well unless the
+    caller opted into a replica with `reading_from()`; related objects are
+    read from the database their instance came from.
+    """
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
@@ -0,0 +1,76 @@
+from django_filters import rest_framework as filters
+from rest_framework.filters import OrderingFilter
+
+from .models import Product, Order, OrderLog, OrderStatus, Subscription
+
+
+class StableOrderingFilter(OrderingFilter):
+    """
+    OrderingFilter that always ends the ordering on the primary key, so a
+    client-chosen ordering such as `?ordering=price` stays deterministic
+    under cursor pagination.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering and not any(term.lstrip('-') in ('id', 'pk') for term in ordering):
+            ordering = [*ordering, '-id' if ordering[0].startswith('-') else 'id']
+        return ordering
+
+
+# Foreign keys are filtered on their raw `<name>_id` column with UUIDFilter:
+# a ModelChoiceFilter would run an extra query just to validate the value.
+
+class OrderFilter(filters.FilterSet):
+    store = filters.UUIDFilter(field_name='store_id')
+    status = filters.MultipleChoiceFilter(choices=OrderStatus.choices)
+    created_at = filters.IsoDateTimeFromToRangeFilter()
+
+    class Meta:
+        model = Order
+        fields = ['store', 'status', 'created_at', 'customer_email']
+
+
+class ProductFilter(filters.FilterSet):
+    store = filters.UUIDFilter(field_name='store_id')
+    price = filters.RangeFilter()
+    in_stock = filters.BooleanFilter(method='filter_in_stock')
+
+    class Meta:
+        model = Product
+        fields = ['store', 'price', 'in_stock']
+
+    def filter_in_stock(self, queryset, name, value):
+        if value:
+            return queryset.filter(stock__gt=0)
+        return queryset.filter(stock__lte=0)
+
+
+class OrderLogFilter(filters.FilterSet):
+    order = filters.UUIDFilter(field_name='order_id')
+    changed_by = filters.UUIDFilter(field_name='changed_by_id')
+    status = filters.MultipleChoiceFilter(choices=OrderStatus.choices)
+    changed_at = filters.IsoDateTimeFromToRangeFilter()
+
+    class Meta:
+        model = OrderLog
+        fields = ['order', 'changed_by', 'status', 'changed_at']
+
+
+class SubscriptionFilter(filters.FilterSet):
+    store = filters.UUIDFilter(field_name='store_id')
+    user = filters.UUIDFilter(field_name='user_id')
+    state = filters.ChoiceFilter(
+        choices=[('active', 'Active'), ('expired', 'Expired')], method='filter_state',
+    )
+
+    class Meta:
+        model = Subscription
+        fields = ['store', 'user', 'state', 'is_trial']
+
+    def filter_state(self, queryset, name, value):
+        # Computed from end_date in SQL, not from the stored status, which
+        # only changes when the expiry sweep runs
+        if value == 'active':
+            return queryset.active()
+        return queryset.expired()
@@ -0,0 +1,171 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+
+from panel.benchmarks.seed import manual_timestamps
+from panel.models import User, Store, Product, Order, OrderLog, OrderStatus, PromoCode, Subscription
+
+
+INDEXED_MODELS = (Order, OrderLog, Product, Subscription, PromoCode)
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a large synthetic order history and print query plans and timings '
+        'for the dashboard access paths with and without the panel indexes. '
+        'Run it against a scratch database: it inserts millions of rows.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=2_000_000)
+        parser.add_argument('--stores', type=int, default=50)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per query.')
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse rows from a previous run.')
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        self.using = options['database']
+        self.repeat = options['repeat']
+        if not options['skip_seed']:
+            self.seed(options['orders'], options['stores'], options['batch_size'])
+
+        store = Store.objects.using(self.using).order_by('id').first()
+        if store is None:
+            raise CommandError('No data to benchmark, run without --skip-seed first.')
+        order = Order.objects.using(self.using).filter(store=store).order_by('-created_at').first()
+        user = Subscription.objects.using(self.using).values_list('user_id', flat=True).first()
+        scenarios = self.scenarios(store, order, user)
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Without access path indexes'))
+        self.drop_indexes()
+        try:
+            before = self.run_scenarios(scenarios)
+        finally:
+            self.create_indexes()
+        self.stdout.write(self.style.MIGRATE_HEADING('With access path indexes'))
+        after = self.run_scenarios(scenarios)
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Summary (median ms)'))
+        for name in scenarios:
+            speedup = before[name] / after[name] if after[name] else float('inf')
+            self.stdout.write(f'{name:<40} {before[name]:>10.3f} {after[name]:>10.3f}  x{speedup:.1f}')
+
+    def scenarios(self, store, order, user_id):
+        now = timezone.now()
+        orders = Order.objects.using(self.using)
+        return {
+            'orders by store+status, newest first': lambda: list(
+                orders.filter(store=store, status=OrderStatus.IN_CONFIRMATION).order_by('-created_at')[:50]
+            ),
+            'open orders for store': lambda: list(
+                orders.filter(store=store).exclude(
+                    status__in=[OrderStatus.DELIVERED, OrderStatus.RETURNED, OrderStatus.CANCELED]
+                ).order_by('created_at')[:50]
+            ),
+            'order list page (created_at, id)': lambda: list(orders.order_by('-created_at', '-id')[:50]),
+            'logs for order by changed_at': lambda: list(
+                OrderLog.objects.using(self.using).filter(order=order).order_by('changed_at')
+            ),
+            'in-stock products by price': lambda: list(
+                Product.objects.using(self.using).filter(store=store, stock__gt=0).order_by('price')[:50]
+            ),
+            'active subscriptions ending after T': lambda: list(
+                Subscription.objects.using(self.using).filter(user_id=user_id, status='active', end_date__gt=now)
+            ),
+            'promo codes valid now': lambda: list(
+                PromoCode.objects.using(self.using).filter(valid_from__lte=now, valid_until__gte=now)[:50]
+            ),
+        }
+
+    def run_scenarios(self, scenarios):
+        connection = connections[self.using]
+        results = {}
+        for name, run in scenarios.items():
+            with connection.execute_wrapper(self.capture_sql):
+                run()
+            sql, params = self.last_sql
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN {"QUERY PLAN " if connection.vendor == "sqlite" else ""}{sql}', params)
+                plan = '\n'.join('    ' + ' '.join(str(col) for col in row) for row in cursor.fetchall())
+            timings = []
+            for _ in range(self.repeat):
+                start = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - start) * 1000)
+            results[name] = statistics.median(timings)
+            self.stdout.write(f'{name}: {results[name]:.3f} ms\n{plan}')
+        return results
+
+    def capture_sql(self, execute, sql, params, many, context):
+        self.last_sql = (sql, params)
+        return execute(sql, params, many, context)
+
+    def drop_indexes(self):
+        with connections[self.using].schema_editor() as editor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    editor.remove_index(model, index)
+
+    def create_indexes(self):
+        with connections[self.using].schema_editor() as editor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    editor.add_index(model, index)
+
+    def seed(self, order_count, store_count, batch_size):
+        rng = random.Random(0)
+        now = timezone.now()
+        statuses = OrderStatus.values
+        self.stdout.write(f'Seeding {store_count} stores and {order_count} orders...')
+
+        with transaction.atomic(using=self.using):
+            owner = User.objects.db_manager(self.using).create_user(
+                email=f'bench-{now.timestamp()}@example.com', name='Benchmark owner'
+            )
+            stores = Store.objects.using(self.using).bulk_create(
+                Store(name=f'Store {i}', owner=owner) for i in range(store_count)
+            )
+            Product.objects.using(self.using).bulk_create(
+                Product(store=store, name=f'Product {i}', price=Decimal(rng.randint(100, 10_000)) / 100,
+                        stock=rng.choice([0, rng.randint(1, 500)]))
+                for store in stores for i in range(200)
+            )
+            users = User.objects.using(self.using).bulk_create(
+                User(email=f'bench-{now.timestamp()}-{i}@example.com', name=f'Customer {i}') for i in range(1_000)
+            )
+            Subscription.objects.using(self.using).bulk_create(
+                Subscription(user=rng.choice(users), store=rng.choice(stores),
+                             end_date=now + timedelta(days=rng.randint(-365, 365)),
+                             status=rng.choice(['active', 'expired']))
+                for _ in range(50_000)
+            )
+            PromoCode.objects.using(self.using).bulk_create(
+                PromoCode(code=f'BENCH{now.timestamp():.0f}{i}', valid_from=now - timedelta(days=rng.randint(0, 365)),
+                          valid_until=now + timedelta(days=rng.randint(-365, 365)))
+                for i in range(20_000)
+            )
+
+        with manual_timestamps(Order, 'created_at', 'updated_at'), manual_timestamps(OrderLog, 'changed_at'):
+            for offset in range(0, order_count, batch_size):
+                with transaction.atomic(using=self.using):
+                    orders = []
+                    for _ in range(min(batch_size, order_count - offset)):
+                        created_at = now - timedelta(seconds=rng.randint(0, 3 * 365 * 24 * 3600))
+                        orders.append(Order(
+                            store=rng.choice(stores), customer_name='Customer', customer_email='customer@example.com',
+                            status=rng.choice(statuses), created_at=created_at, updated_at=created_at,
+                        ))
+                    Order.objects.using(self.using).bulk_create(orders)
+                    OrderLog.objects.using(self.using).bulk_create(
+                        OrderLog(order=order, status=order.status, changed_by=owner, changed_at=order.updated_at)
+                        for order in orders
+                    )
+                self.stdout.write(f'  {offset + len(orders)} orders', ending='\r')
+        self.stdout.write('')
@@ -0,0 +1,74 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from panel.models import User, Store, Product, Order, OrderItem
+from panel.serializers import LeanSerializer, ProductSerializer, OrderSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare ModelSerializer and LeanSerializer list serialization on '
+        'generated rows. Rows are created in a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000)
+        parser.add_argument('--items', type=int, default=2, help='Items per order.')
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            store = self.seed(options['rows'], options['items'])
+            for serializer_class, queryset in (
+                (ProductSerializer, Product.objects.filter(store=store)),
+                (OrderSerializer, Order.objects.filter(store=store)),
+            ):
+                self.compare(serializer_class, queryset.order_by('-created_at', '-id'), options['repeat'])
+            transaction.set_rollback(True)
+
+    def compare(self, serializer_class, queryset, repeat):
+        lean = LeanSerializer.for_serializer(serializer_class)
+        renderer = JSONRenderer()
+
+        def full():
+            return renderer.render(serializer_class(serializer_class.setup_eager_loading(queryset), many=True).data)
+
+        def fast():
+            return renderer.render(lean.serialize(lean.values(queryset)))
+
+        assert full() == fast(), f'{serializer_class.__name__}: lean output differs'
+        full_time, fast_time = self.best(full, repeat), self.best(fast, repeat)
+        self.stdout.write(
+            f'{serializer_class.__name__:<20} ModelSerializer {full_time * 1000:9.1f} ms   '
+            f'LeanSerializer {fast_time * 1000:9.1f} ms   x{full_time / fast_time:.1f}'
+        )
+
+    def best(self, run, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    def seed(self, rows, items):
+        owner = User.objects.create_user(email=f'serializer-bench-{time.time()}@example.com', name='Benchmark')
+        store = Store.objects.create(name='Benchmark store', owner=owner)
+        products = Product.objects.bulk_create(
+            Product(store=store, name=f'Product {i}', description='Benchmark product', price=Decimal('12.34'), stock=10)
+            for i in range(rows)
+        )
+        orders = Order.objects.bulk_create(
+            Order(store=store, customer_name=f'Customer {i}', customer_email='customer@example.com')
+            for i in range(rows)
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=products[(i + n) % rows], quantity=2, unit_price=Decimal('12.34'),
+                      total_price=Decimal('24.68'))
+            for i, order in enumerate(orders) for n in range(items)
+        )
+        return store
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from panel.models import Subscription
+
+
+class Command(BaseCommand):
+    help = (
+        'Mark active subscriptions whose end date has passed as expired, with a '
+        'single UPDATE. The task worker runs the same sweep every '
+        'SUBSCRIPTION_EXPIRY_INTERVAL seconds; use this from cron without it.'
+    )
+
+    def handle(self, *args, **options):
+        expired = Subscription.objects.expire_due()
+        self.stdout.write(self.style.SUCCESS(f'Expired {expired} subscriptions.'))
@@ -0,0 +1,95 @@
+import http.client
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Fire GET requests at running servers with a fixed number of concurrent '
+        'keep-alive clients and report throughput and latency percentiles per URL. '
+        'To compare sync WSGI with async ASGI on the same machine, start e.g. '
+        '`gunicorn ecommercify.wsgi -w 4 -b :8001` and '
+        '`gunicorn ecommercify.asgi -k uvicorn.workers.UvicornWorker -w 4 -b :8002`, then run '
+        '`load_test http://127.0.0.1:8001/api/orders/ http://127.0.0.1:8002/api/async/orders/ --token KEY`.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+')
+        parser.add_argument('--token', help='API token sent as `Authorization: Token <key>`.')
+        parser.add_argument('--concurrency', type=int, default=128)
+        parser.add_argument('--requests', type=int, default=5000, help='Requests per URL.')
+        parser.add_argument('--warmup', type=int, default=100, help='Unmeasured requests per URL.')
+        parser.add_argument('--timeout', type=float, default=30.0)
+
+    def handle(self, *args, **options):
+        headers = {'Accept': 'application/json'}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+        self.stdout.write(f'{"url":<48} {"req/s":>9} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"errors":>7}')
+        for url in options['urls']:
+            if urlsplit(url).scheme not in ('http', 'https'):
+                raise CommandError(f'Not an http(s) URL: {url}')
+            self.run(url, headers, options['warmup'], options['concurrency'], options['timeout'])
+            elapsed, latencies, errors = self.run(
+                url, headers, options['requests'], options['concurrency'], options['timeout'],
+            )
+            self.report(url, elapsed, latencies, errors)
+
+    def run(self, url, headers, total, concurrency, timeout):
+        """
+        Send `total` requests from `concurrency` threads, each reusing one
+        connection. Returns (elapsed seconds, latencies, error count).
+        """
+        parts = urlsplit(url)
+        target = parts.path + (f'?{parts.query}' if parts.query else '')
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        remaining = iter(range(total))
+        lock = threading.Lock()
+        latencies, errors = [], [0]
+
+        def client():
+            connection = connection_class(parts.netloc, timeout=timeout)
+            own = []
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        break
+                start = time.perf_counter()
+                try:
+                    connection.request('GET', target, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                    ok = response.status == 200
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    connection = connection_class(parts.netloc, timeout=timeout)
+                    ok = False
+                if ok:
+                    own.append(time.perf_counter() - start)
+                else:
+                    with lock:
+                        errors[0] += 1
+            connection.close()
+            with lock:
+                latencies.extend(own)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for future in [executor.submit(client) for _ in range(concurrency)]:
+                future.result()
+        return time.perf_counter() - start, latencies, errors[0]
+
+    def report(self, url, elapsed, latencies, errors):
+        if len(latencies) < 2:
+            self.stdout.write(f'{url:<48} {"-":>9} {"-":>9} {"-":>9} {"-":>9} {errors:>7}')
+            return
+        cuts = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f'{url:<48} {len(latencies) / elapsed:9.1f} {cuts[49] * 1000:9.1f} '
+            f'{cuts[94] * 1000:9.1f} {cuts[98] * 1000:9.1f} {errors:>7}'
+        )
@@ -0,0 +1,63 @@
+import json
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from panel.benchmarks.scenarios import SCENARIOS, run_benchmarks, compare
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay API scenarios in-process against the real URLconf and report '
+        'p50/p95/p99 latency, queries per request and peak RSS. Results are saved '
+        'as JSON; pass an earlier file with --compare to see what changed. '
+        'Needs data from `seed_benchmark`; write scenarios modify it.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f'Scenarios to run (default: all of {", ".join(SCENARIOS)}).')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per scenario.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Results file (default: benchmark-<timestamp>.json).')
+        parser.add_argument('--compare', help='Results file of an earlier run to compare with.')
+
+    def handle(self, *args, **options):
+        unknown = set(options['scenarios']) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}.')
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = json.load(file)
+
+        self.stdout.write(
+            f'{"scenario":<18} {"req":>5} {"err":>4} {"req/s":>8} {"p50 ms":>9} {"p95 ms":>9} '
+            f'{"p99 ms":>9} {"queries":>8} {"rss MB":>8}'
+        )
+        try:
+            results = run_benchmarks(
+                options['scenarios'] or None, options['requests'], options['warmup'], options['seed'], log=self.report,
+            )
+        except LookupError as exc:
+            raise CommandError(str(exc))
+
+        output = options['output'] or f'benchmark-{datetime.now():%Y%m%d-%H%M%S}.json'
+        with open(output, 'w') as file:
+            json.dump(results, file, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Results written to {output}.'))
+
+        if baseline is not None:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'Compared with {options["compare"]}'))
+            for name, metric, before, after, change in compare(baseline, results):
+                self.stdout.write(f'{name:<18} {metric:<13} {before:>10} {after:>10} {change:>+8.1f}%')
+
+    def report(self, name, result):
+        if 'p50_ms' not in result:
+            self.stdout.write(f'{name:<18} {result["requests"]:>5} {result["errors"]:>4}  not enough requests')
+            return
+        self.stdout.write(
+            f'{name:<18} {result["requests"]:>5} {result["errors"]:>4} {result["throughput_rps"]:>8.1f} '
+            f'{result["p50_ms"]:>9.2f} {result["p95_ms"]:>9.2f} {result["p99_ms"]:>9.2f} '
+            f'{result["queries_mean"]:>8.1f} {result["peak_rss_mb"]:>8.1f}'
+        )
@@ -0,0 +1,39 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from panel.services.queue import run_pending, schedule_periodic
+
+
+class Command(BaseCommand):
+    help = (
+        'Run queued background tasks on a thread pool. Polls for due tasks until '
+        'interrupted, or with --once until the queue has nothing due.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=20, help='Tasks claimed per round.')
+        parser.add_argument('--lease', type=int, default=300,
+                            help='Seconds before a claimed task counts as abandoned and is run again.')
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument('--once', action='store_true', help='Exit when no task is due.')
+
+    def handle(self, *args, **options):
+        # Make sure every periodic task has its next run queued
+        schedule_periodic()
+        processed = 0
+        with ThreadPoolExecutor(max_workers=options['threads'], thread_name_prefix='task') as executor:
+            try:
+                while True:
+                    claimed = run_pending(options['batch_size'], options['lease'], executor)
+                    processed += claimed
+                    if claimed:
+                        continue
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+            except KeyboardInterrupt:
+                pass
+        self.stdout.write(f'Processed {processed} tasks.')
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from panel.benchmarks.seed import BENCHMARK_EMAIL, BENCHMARK_PASSWORD, seed_data
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed stores, staff, products, orders with items and logs, promo codes and '
+        'subscriptions with bulk inserts, for `run_benchmarks`. The same --seed '
+        'gives the same data set. Run it against a scratch database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stores', type=int, default=10)
+        parser.add_argument('--products', type=int, default=100, help='Products per store.')
+        parser.add_argument('--orders', type=int, default=10_000)
+        parser.add_argument('--subscriptions', type=int, default=2_000)
+        parser.add_argument('--days', type=int, default=365, help='Days of order history.')
+        parser.add_argument('--batch-size', type=int, default=5_000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        counts = seed_data(
+            stores=options['stores'], products=options['products'], orders=options['orders'],
+            subscriptions=options['subscriptions'], days=options['days'], batch_size=options['batch_size'],
+            seed=options['seed'], log=lambda message: self.stdout.write(f'  {message}', ending='\r'),
+        )
+        self.stdout.write('')
+        for name, count in counts.items():
+            self.stdout.write(f'{name:<14} {count:>10}')
+        self.stdout.write(self.style.SUCCESS(f'Seeded. Scenarios log in as {BENCHMARK_EMAIL} / {BENCHMARK_PASSWORD}.'))
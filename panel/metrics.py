@@ -0,0 +1,209 @@
+"""
+Bounded in-process request metrics, filled by PerformanceMiddleware and
+rendered in the Prometheus text format by the /api/metrics/ endpoint.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+PERFORMANCE_METRICS = getattr(settings, 'PERFORMANCE_METRICS', {})
+
+# Distinct (route, method) pairs tracked; further ones share the `other` route
+MAX_ROUTES = PERFORMANCE_METRICS.get('MAX_ROUTES', 200)
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+# Recorder of the request being served, None when it is not sampled
+_recorder = ContextVar('panel_metrics_recorder', default=None)
+
+_untimed = nullcontext()
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram: memory does not grow with the number of observations.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            total += count
+            yield bound, total
+
+
+class RouteMetrics:
+
+    def __init__(self):
+        self.duration = Histogram(SECONDS_BUCKETS)
+        self.db = Histogram(SECONDS_BUCKETS)
+        self.serialize = Histogram(SECONDS_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.duplicate_queries = 0
+
+
+class MetricsRegistry:
+    """
+    Per-route metrics, shared by every request served by this process.
+    """
+
+    def __init__(self, max_routes):
+        self.max_routes = max_routes
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def record(self, route, method, recorder, duration):
+        with self._lock:
+            key = (route, method)
+            if key not in self._routes and len(self._routes) >= self.max_routes:
+                key = ('other', method)
+            metrics = self._routes.get(key)
+            if metrics is None:
+                metrics = self._routes[key] = RouteMetrics()
+            metrics.duration.observe(duration)
+            metrics.db.observe(recorder.sql_time)
+            metrics.serialize.observe(recorder.timings.get('serialize', 0))
+            metrics.queries.observe(recorder.queries)
+            metrics.duplicate_queries += recorder.duplicates
+
+    def clear(self):
+        with self._lock:
+            self._routes.clear()
+
+    def render(self):
+        """
+        Return the metrics in the Prometheus text exposition format.
+        """
+        families = (
+            ('panel_request_duration_seconds', 'Request latency.', 'duration'),
+            ('panel_request_db_seconds', 'Time spent in SQL per request.', 'db'),
+            ('panel_request_serialize_seconds', 'Time spent serializing per request, SQL excluded.', 'serialize'),
+            ('panel_request_queries', 'SQL queries per request.', 'queries'),
+        )
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = []
+            for name, help_text, attr in families:
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for (route, method), metrics in routes:
+                    histogram = getattr(metrics, attr)
+                    labels = f'route="{route}",method="{method}"'
+                    for bound, count in histogram.cumulative():
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.sum:g}')
+                    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+            name = 'panel_request_duplicate_queries_total'
+            lines += [f'# HELP {name} Queries repeating an earlier query of the same request.', f'# TYPE {name} counter']
+            for (route, method), metrics in routes:
+                lines.append(f'{name}{{route="{route}",method="{method}"}} {metrics.duplicate_queries}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry(MAX_ROUTES)
+
+
+class RequestRecorder:
+    """
+    Measurements of one request. Called as a database execute wrapper, it
+    counts the queries, their time, and exact repeats (same SQL and
+    parameters), a sign of N+1 lookups or missing caching.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.duplicates = 0
+        self.sql_time = 0
+        # Phase name -> seconds, see timed()
+        self.timings = {}
+        self.active = set()
+        self._seen = set()
+        # An async request may run queries on several threads at once
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.sql_time += elapsed
+                self.queries += 1
+                if not many:
+                    self.check_duplicate(sql, params)
+
+    def check_duplicate(self, sql, params):
+        try:
+            signature = (sql, tuple(params) if isinstance(params, list) else params)
+            if signature in self._seen:
+                self.duplicates += 1
+            else:
+                self._seen.add(signature)
+        except TypeError:
+            # Unhashable parameters (e.g. arrays) are not checked for repeats
+            pass
+
+
+def record_queries(execute, sql, params, many, context):
+    """
+    Execute wrapper of every connection: hands the query to the recorder of
+    the request being served, if it is sampled. Connections are per thread,
+    but sync_to_async copies the context, so queries an async view runs in
+    a worker thread reach its recorder too.
+    """
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_recorder(connection, **kwargs):
+    # connection_created receiver, see PanelConfig.ready()
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_queries)
+
+
+class _Timer:
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.sql_time = self.recorder.sql_time
+
+    def __exit__(self, *exc_info):
+        # Queries run while serializing (lazy relations) are counted as SQL only
+        elapsed = time.perf_counter() - self.start - (self.recorder.sql_time - self.sql_time)
+        self.recorder.timings[self.name] = self.recorder.timings.get(self.name, 0) + elapsed
+        self.recorder.active.discard(self.name)
+
+
+def timed(name):
+    """
+    Context manager adding the time spent in the block to phase `name` of
+    the current request. Nested blocks of the same phase are counted once;
+    outside a sampled request it does nothing.
+    """
+    recorder = _recorder.get()
+    if recorder is None or name in recorder.active:
+        return _untimed
+    recorder.active.add(name)
+    return _Timer(recorder, name)
@@ -0,0 +1,85 @@
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .metrics import RequestRecorder, registry, _recorder
+
+
+class PerformanceMiddleware:
+    """
+    Records latency, SQL query count and time, duplicate queries and
+    serialization time of a sampled share of requests, per route, into the
+    in-process histograms of panel.metrics.
+
+    SAMPLE_RATE bounds the overhead: requests that are not sampled pay for
+    one random() call, and their queries for one context variable lookup.
+    With SERVER_TIMING, sampled responses also carry a `Server-Timing`
+    header with the same measurements.
+
+    The middleware is sync and async capable, so under ASGI async views run
+    without being adapted to a thread. Queries reach the request's recorder
+    through the context variable (see record_queries()), including those
+    run by sync_to_async threads.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        options = getattr(settings, 'PERFORMANCE_METRICS', {})
+        self.sample_rate = options.get('SAMPLE_RATE', 1.0)
+        self.server_timing = options.get('SERVER_TIMING', False)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        recorder = RequestRecorder()
+        token = _recorder.set(recorder)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self.record(request, response, recorder, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        recorder = RequestRecorder()
+        token = _recorder.set(recorder)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self.record(request, response, recorder, time.perf_counter() - start)
+
+    def sampled(self):
+        return self.sample_rate and random.random() < self.sample_rate
+
+    def record(self, request, response, recorder, duration):
+        match = request.resolver_match
+        if match is not None:
+            # The URL name (e.g. `order-detail`) keeps the label set bounded
+            registry.record(match.view_name or match.route, request.method, recorder, duration)
+        if self.server_timing:
+            response['Server-Timing'] = server_timing(recorder, duration)
+        return response
+
+
+def server_timing(recorder, duration):
+    metrics = [f'db;dur={recorder.sql_time * 1000:.1f};desc="{recorder.queries} queries"']
+    metrics += [f'{name};dur={seconds * 1000:.1f}' for name, seconds in sorted(recorder.timings.items())]
+    if recorder.duplicates:
+        metrics.append(f'dup;desc="{recorder.duplicates} duplicate queries"')
+    metrics.append(f'total;dur={duration * 1000:.1f}')
+    return ', '.join(metrics)
@@ -0,0 +1,57 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('panel', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['store', 'status', '-created_at'], name='order_store_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['store', '-created_at', '-id'], name='order_store_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-created_at', '-id'], name='order_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status__in', ['delivered', 'returned', 'canceled']), _negated=True), fields=['store', 'status', 'created_at'], name='order_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderlog',
+            index=models.Index(fields=['order', 'changed_at'], name='orderlog_order_changed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderlog',
+            index=models.Index(fields=['-changed_at', '-id'], name='orderlog_changed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['store', '-created_at', '-id'], name='product_store_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['store', 'price'], name='product_store_instock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promocode',
+            index=models.Index(fields=['valid_until', 'valid_from'], name='promocode_validity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['user', 'status', 'end_date'], name='subscription_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['user', 'end_date'], name='subscription_active_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 15:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('panel', '0002_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['store', 'customer_email'], name='order_store_email_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:00
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('panel', '0003_order_customer_email_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyOrderRollup',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('in_confirmation', 'In Confirmation'), ('in_dispatch', 'In Dispatch'), ('in_delivery', 'In Delivery'), ('delivered', 'Delivered'), ('returned', 'Returned'), ('canceled', 'Canceled')], max_length=50)),
+                ('orders', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='panel.store')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('store', 'day', 'status'), name='rollup_store_day_status_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('panel', '0004_daily_order_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='store',
+            name='catalog_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='store',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
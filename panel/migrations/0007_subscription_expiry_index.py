@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('panel', '0006_task_queue'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['end_date'], name='subscription_expiry_idx'),
+        ),
+    ]
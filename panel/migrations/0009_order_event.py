@@ -0,0 +1,29 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('panel', '0008_order_work_queue_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('order.created', 'Order created'), ('order.status', 'Order status changed')], max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('in_confirmation', 'In Confirmation'), ('in_dispatch', 'In Dispatch'), ('in_delivery', 'In Delivery'), ('delivered', 'Delivered'), ('returned', 'Returned'), ('canceled', 'Canceled')], max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('log', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='events', to='panel.orderlog')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='panel.order')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_events', to='panel.store')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['store', 'id'], name='orderevent_store_seq_idx'), models.Index(fields=['created_at'], name='orderevent_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('panel', '0009_order_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='store',
+            name='order_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('panel', '0010_store_order_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'claimed_until', 'created_at'], name='order_claim_idx'),
+        ),
+    ]
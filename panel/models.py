@@ -28,6 +28,17 @@ class OrderStatus(models.TextChoices):
     RETURNED = 'returned', 'Returned'
     CANCELED = 'canceled', 'Canceled'
 
+# Allowed next statuses for each order status
+ORDER_TRANSITIONS = {
+    OrderStatus.PENDING: {OrderStatus.IN_CONFIRMATION, OrderStatus.CANCELED},
+    OrderStatus.IN_CONFIRMATION: {OrderStatus.IN_DISPATCH, OrderStatus.CANCELED},
+    OrderStatus.IN_DISPATCH: {OrderStatus.IN_DELIVERY, OrderStatus.CANCELED},
+    OrderStatus.IN_DELIVERY: {OrderStatus.DELIVERED, OrderStatus.RETURNED},
+    OrderStatus.DELIVERED: {OrderStatus.RETURNED},
+    OrderStatus.RETURNED: set(),
+    OrderStatus.CANCELED: set(),
+}
+
 # User model
 class UserManager(BaseUserManager):
     def create_user(self, email, name, password=None, **extra_fields):
@@ -81,6 +92,12 @@ class Store(models.Model):
     name = models.CharField(max_length=255)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stores')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped whenever the store (version), any of its products (catalog_version)
+    # or any of its orders (order_version) change; used as HTTP validators and
+    # response cache keys.
+    version = models.PositiveIntegerField(default=0, editable=False)
+    catalog_version = models.PositiveIntegerField(default=0, editable=False)
+    order_version = models.PositiveIntegerField(default=0, editable=False)
 
 # Staff model
 class Staff(models.Model):
@@ -100,6 +117,12 @@ class Product(models.Model):
     stock = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['store', '-created_at', '-id'], name='product_store_created_idx'),
+            models.Index(fields=['store', 'price'], condition=models.Q(stock__gt=0), name='product_store_instock_idx'),
+        ]
+
 # Order model
 class Order(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -109,6 +132,28 @@ class Order(models.Model):
     status = models.CharField(max_length=50, choices=OrderStatus.choices, default=OrderStatus.PENDING)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Work queue lease (see services/work_queues.py): the staff member working
+    # on the order until `claimed_until`, after which it is back in its queue
+    claimed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='claimed_orders')
+    claim_token = models.UUIDField(null=True, blank=True, editable=False)
+    claimed_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # "orders for store X in status Y, newest first"
+            models.Index(fields=['store', 'status', '-created_at'], name='order_store_status_idx'),
+            models.Index(fields=['store', '-created_at', '-id'], name='order_store_created_idx'),
+            models.Index(fields=['-created_at', '-id'], name='order_created_idx'),
+            models.Index(fields=['store', 'customer_email'], name='order_store_email_idx'),
+            # Open orders are a small, hot slice of the table
+            models.Index(
+                fields=['store', 'status', 'created_at'],
+                condition=~models.Q(status__in=[OrderStatus.DELIVERED, OrderStatus.RETURNED, OrderStatus.CANCELED]),
+                name='order_open_idx',
+            ),
+            # Work queue claims: "oldest orders in status Y whose lease is free"
+            models.Index(fields=['status', 'claimed_until', 'created_at'], name='order_claim_idx'),
+        ]
 
 # Order Item model
 class OrderItem(models.Model):
@@ -131,6 +176,37 @@ class OrderLog(models.Model):
     changed_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='order_changes')
     changed_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['order', 'changed_at'], name='orderlog_order_changed_idx'),
+            models.Index(fields=['-changed_at', '-id'], name='orderlog_changed_idx'),
+        ]
+
+# Order event model
+class OrderEvent(models.Model):
+    """
+    Append-only feed of order creations and status changes, read by the
+    order event stream (views/event_views.py). The auto-increment `id` is
+    the feed's sequence: clients resume after the last id they saw.
+    """
+    class Kind(models.TextChoices):
+        CREATED = 'order.created', 'Order created'
+        STATUS = 'order.status', 'Order status changed'
+
+    id = models.BigAutoField(primary_key=True)
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='order_events')
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='events')
+    log = models.ForeignKey(OrderLog, on_delete=models.CASCADE, null=True, blank=True, related_name='events')
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    status = models.CharField(max_length=50, choices=OrderStatus.choices)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['store', 'id'], name='orderevent_store_seq_idx'),
+            models.Index(fields=['created_at'], name='orderevent_created_idx'),
+        ]
+
 # Promo Code model
 class PromoCode(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -142,11 +218,40 @@ class PromoCode(models.Model):
     valid_until = models.DateTimeField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['valid_until', 'valid_from'], name='promocode_validity_idx'),
+        ]
+
     def is_valid(self):
         now = timezone.now()
         return self.valid_from <= now <= self.valid_until and self.current_usage < self.max_usage
 
 # Subscription model
+class SubscriptionQuerySet(models.QuerySet):
+    """
+    Status checks computed in SQL from `status` and `end_date`, so they are
+    right even before the expiry sweep has flipped a lapsed row.
+    """
+
+    def active(self, at=None):
+        return self.filter(status=Subscription.Status.ACTIVE, end_date__gte=at or timezone.now())
+
+    def expired(self, at=None):
+        return self.filter(
+            models.Q(status=Subscription.Status.EXPIRED)
+            | models.Q(status=Subscription.Status.ACTIVE, end_date__lt=at or timezone.now())
+        )
+
+    def expire_due(self, at=None):
+        """
+        Flip lapsed active subscriptions to EXPIRED with one UPDATE and return how many changed.
+        """
+        return self.filter(status=Subscription.Status.ACTIVE, end_date__lt=at or timezone.now()).update(
+            status=Subscription.Status.EXPIRED,
+        )
+
+
 class Subscription(models.Model):
     class Status(models.TextChoices):
         ACTIVE = 'active', 'Active'
@@ -163,8 +268,21 @@ class Subscription(models.Model):
     status = models.CharField(max_length=50, choices=Status.choices, default=Status.ACTIVE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = SubscriptionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'status', 'end_date'], name='subscription_user_status_idx'),
+            # "active subscriptions for user U ending after T"
+            models.Index(fields=['user', 'end_date'], condition=models.Q(status='active'), name='subscription_active_idx'),
+            # The expiry sweep: active subscriptions with end_date < now
+            models.Index(fields=['end_date'], condition=models.Q(status='active'), name='subscription_expiry_idx'),
+        ]
+
     def save(self, *args, **kwargs):
-        self.status = self.get_subscription_status()
+        # Rows nobody saves are expired by the `expire_subscriptions` sweep
+        if self.status != Subscription.Status.CANCELED:
+            self.status = self.get_subscription_status()
         super().save(*args, **kwargs)
 
     def get_subscription_status(self):
@@ -172,3 +290,55 @@ class Subscription(models.Model):
         if self.end_date < now:
             return Subscription.Status.EXPIRED
         return Subscription.Status.ACTIVE
+
+# Daily order rollup model
+class DailyOrderRollup(models.Model):
+    """
+    Orders created on `day` for `store` that are currently in `status`, with
+    the revenue of their items. Maintained incrementally by the order
+    services and rebuilt by the `rebuild_rollups` management command.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='daily_rollups')
+    day = models.DateField()
+    status = models.CharField(max_length=50, choices=OrderStatus.choices)
+    orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['store', 'day', 'status'], name='rollup_store_day_status_uniq'),
+        ]
+
+# Background task model
+class Task(models.Model):
+    """
+    A unit of deferred work run by the `run_tasks` worker. `name` selects a
+    function registered with `panel.services.queue.task`, called with
+    `payload` as keyword arguments.
+    """
+    class Status(models.TextChoices):
+        QUEUED = 'queued', 'Queued'
+        RUNNING = 'running', 'Running'
+        DONE = 'done', 'Done'
+        FAILED = 'failed', 'Failed'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    # Enqueueing the same key twice is a no-op, so an event is handled once
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    # Set while a worker holds the task; an expired lease makes it claimable again
+    lease_token = models.UUIDField(null=True, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='task_status_run_after_idx'),
+        ]
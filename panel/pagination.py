@@ -0,0 +1,25 @@
+from rest_framework.pagination import CursorPagination
+
+
+class StableCursorPagination(CursorPagination):
+    """
+    Keyset pagination used by every panel list endpoint.
+
+    Each page is fetched with a `WHERE <first ordering column> < cursor
+    LIMIT n` query, so the cost of a page does not depend on how deep into
+    the table it is. Only that first column is part of the predicate: DRF's
+    CursorPagination skips rows that share the cursor's value with an offset
+    kept in the cursor, so a run of equal values costs OFFSET within it.
+    ViewSets declare their own deterministic `ordering`, ending with a unique
+    column (usually `id`) so that tied rows keep a stable order and never
+    move between pages; that column is a tie-breaker for ORDER BY, not a
+    composite keyset.
+    """
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def get_ordering(self, request, queryset, view):
+        # Prefer the ordering declared on the view over the class default
+        self.ordering = getattr(view, 'ordering', None) or self.ordering
+        return super().get_ordering(request, queryset, view)
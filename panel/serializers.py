@@ -1,49 +1,421 @@
-from rest_framework import serializers
-from .models import User, Store, Staff, Product, Order, OrderItem, OrderLog, PromoCode, Subscription
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db.models import Prefetch
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from . import metrics
+from .models import User, Store, Staff, StaffRole, Product, Order, OrderItem, OrderLog, OrderStatus, PromoCode, Subscription
+
+
+class EagerLoadingMixin:
+    """
+    Lets a serializer declare the relations it reads so that views can load
+    them up front instead of issuing one query per serialized row.
+
+    `expandable_fields` maps optional nested representations to
+    `(serializer_class, kwargs, lookup)`; the lookup is select_related when
+    it is a string and prefetch_related when it is a Prefetch.
+    """
+    select_related_fields = ()
+    prefetch_related_fields = ()
+    expandable_fields = {}
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, fields=None, expand=(), keep=()):
+        """
+        With `fields`, relations outside it are not loaded and the SELECT is
+        narrowed with `.only()` to the requested columns plus `keep`.
+        """
+        def wanted(lookup):
+            name = lookup.prefetch_through if isinstance(lookup, Prefetch) else lookup
+            return fields is None or name.split('__')[0] in fields
+
+        select_related = [lookup for lookup in cls.select_related_fields if wanted(lookup)]
+        prefetch_related = [lookup for lookup in cls.prefetch_related_fields if wanted(lookup)]
+        for name in expand:
+            if name in cls.expandable_fields and wanted(name):
+                lookup = cls.expandable_fields[name][2]
+                (prefetch_related if isinstance(lookup, Prefetch) else select_related).append(lookup)
+
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        if fields is not None:
+            columns = {field.name for field in queryset.model._meta.concrete_fields}
+            only = [name for name in (*fields, *keep) if name in columns]
+            queryset = queryset.only(queryset.model._meta.pk.name, *only)
+        return queryset
+
+    @classmethod
+    def prefetch_queryset(cls, name):
+        """
+        Return the queryset of the Prefetch declared for relation `name`, if any.
+        """
+        lookups = (*cls.prefetch_related_fields, *(lookup for _, _, lookup in cls.expandable_fields.values()))
+        for lookup in lookups:
+            if isinstance(lookup, Prefetch) and lookup.prefetch_through == name and lookup.queryset is not None:
+                return lookup.queryset
+        return None
+
+
+class SparseFieldsMixin:
+    """
+    Accepts `fields` (names to keep) and `expand` (optional nested
+    representations from `expandable_fields` to add) as serializer kwargs.
+    Unknown names are ignored.
+    """
+
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        for name in expand:
+            if name in self.expandable_fields:
+                serializer_class, options, _ = self.expandable_fields[name]
+                self.fields[name] = serializer_class(read_only=True, **options)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def to_representation(self, instance):
+        with metrics.timed('serialize'):
+            return super().to_representation(instance)
+
+
+def sparse_selection(query_params):
+    """
+    Parse `?fields=a,b&expand=c` into the sorted `(fields, expand)` tuples
+    SparseFieldsMixin takes; `fields` is None when the parameter is absent.
+    """
+    fields = tuple(sorted({name for name in query_params.get('fields', '').split(',') if name})) or None
+    expand = tuple(sorted({name for name in query_params.get('expand', '').split(',') if name}))
+    if fields is not None:
+        # An expanded relation is implicitly requested
+        fields = tuple(sorted({*fields, *expand}))
+    return fields, expand
+
+
+class LeanSerializer:
+    """
+    Read-only fast path for list endpoints.
+
+    Compiles a ModelSerializer once into a plan of (name, source, converter)
+    and then serializes plain `.values()` dicts with it, skipping DRF's
+    per-field get_attribute/to_representation machinery. Nested many=True
+    serializers are filled from one extra `.values()` query per page. The
+    output is identical to the ModelSerializer it was built from.
+    """
+    # Fields whose database value is already what the serializer would output
+    IDENTITY_FIELDS = (
+        serializers.CharField, serializers.ChoiceField, serializers.IntegerField,
+        serializers.BooleanField, serializers.PrimaryKeyRelatedField,
+    )
+
+    def __init__(self, serializer_class, fields=None, expand=()):
+        self.serializer_class = serializer_class
+        self.model = serializer_class.Meta.model
+        # (name, source, converter or None for identity, nested LeanSerializer or None)
+        self.plan = []
+        options = {'fields': fields, 'expand': expand} if issubclass(serializer_class, SparseFieldsMixin) else {}
+        for name, field in serializer_class(**options).fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.ListSerializer):
+                self.plan.append((name, field.source, None, LeanSerializer.for_serializer(type(field.child))))
+            elif isinstance(field, serializers.ManyRelatedField):
+                raise TypeError(f'{serializer_class.__name__}.{name}: many-to-many fields are not supported.')
+            elif isinstance(field, serializers.BaseSerializer):
+                raise TypeError(f'{serializer_class.__name__}.{name}: nested objects are not supported.')
+            elif isinstance(field, self.IDENTITY_FIELDS):
+                self.plan.append((name, field.source, None, None))
+            elif isinstance(field, serializers.UUIDField):
+                self.plan.append((name, field.source, str, None))
+            elif settings.USE_TZ and self.is_iso_datetime(field):
+                # Bound per call in serialize(), once the current timezone is known
+                self.plan.append((name, field.source, self.iso_datetime, None))
+            else:
+                self.plan.append((name, field.source, field.to_representation, None))
+        self.nested = [(name, source, child) for name, source, _, child in self.plan if child is not None]
+        self.pk = self.model._meta.pk.attname
+        self.sources = [source for _, source, _, child in self.plan if child is None]
+        if self.pk not in self.sources:
+            self.sources.append(self.pk)
+
+    @staticmethod
+    def for_serializer(serializer_class, fields=None, expand=()):
+        """
+        Cached per serializer and field selection. Selections come from the
+        query string, so names the serializer does not know are dropped
+        before the lookup (they would be ignored anyway) and at most 256
+        plans are kept.
+        """
+        known, expandable = LeanSerializer.known_names(serializer_class)
+        expand = tuple(sorted(name for name in expand if name in expandable))
+        if fields is not None:
+            fields = tuple(sorted(name for name in fields if name in known or name in expandable))
+        return LeanSerializer.compile(serializer_class, fields, expand)
+
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def compile(serializer_class, fields, expand):
+        return LeanSerializer(serializer_class, fields, expand)
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def known_names(serializer_class):
+        """
+        Return the field names and expandable relations of `serializer_class`.
+        """
+        return frozenset(serializer_class().fields), frozenset(getattr(serializer_class, 'expandable_fields', {}))
+
+    @staticmethod
+    def is_iso_datetime(field):
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        return (
+            isinstance(field, serializers.DateTimeField) and not hasattr(field, 'timezone')
+            and isinstance(output_format, str) and output_format.lower() == ISO_8601
+        )
+
+    @staticmethod
+    def iso_datetime(field_timezone):
+        """
+        Return a converter equivalent to DateTimeField.to_representation for
+        aware datetimes, with the timezone lookup done once instead of per value.
+        """
+        def convert(value):
+            value = value.astimezone(field_timezone).isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return convert
+
+    def values(self, queryset, keep=()):
+        """
+        Turn a model queryset into the `.values()` queryset this plan reads,
+        plus the `keep` columns (e.g. those the paginator orders by).
+        """
+        extra = [name for name in keep if name not in self.sources]
+        return queryset.prefetch_related(None).values(*self.sources, *extra)
+
+    def serialize(self, rows):
+        with metrics.timed('serialize'):
+            rows = list(rows)
+            data = self.serialize_rows(rows)
+            for name, source, child in self.nested:
+                children = self.nested_rows(rows, source, child)
+                for item, group in zip(data, self.group_nested(rows, source, children)):
+                    item[name] = child.serialize(group)
+            return data
+
+    async def aserialize(self, rows):
+        """
+        serialize() for async views: nested rows are read with `aiterator()`.
+        """
+        rows = list(rows)
+        with metrics.timed('serialize'):
+            data = self.serialize_rows(rows)
+        for name, source, child in self.nested:
+            children = [row async for row in self.nested_rows(rows, source, child).aiterator()]
+            for item, group in zip(data, self.group_nested(rows, source, children)):
+                item[name] = await child.aserialize(group)
+        return data
+
+    def serialize_rows(self, rows):
+        plan = self.plan
+        if any(convert == self.iso_datetime for _, _, convert, _ in plan):
+            iso_datetime = self.iso_datetime(timezone.get_current_timezone())
+            plan = [
+                (name, source, iso_datetime if convert == self.iso_datetime else convert, child)
+                for name, source, convert, child in plan
+            ]
+        data = []
+        for row in rows:
+            item = {}
+            for name, source, convert, child in plan:
+                if child is not None:
+                    item[name] = None  # filled per page afterwards, keeps the field order
+                    continue
+                value = row[source]
+                item[name] = value if convert is None or value is None else convert(value)
+            data.append(item)
+        return data
+
+    def nested_rows(self, rows, source, child):
+        """
+        Return the `.values()` queryset of the `source` rows of every parent in `rows`.
+        """
+        link = self.model._meta.get_field(source).field.attname
+        parents = [row[self.pk] for row in rows]
+        return self.nested_queryset(source, child).filter(**{f'{link}__in': parents}).values(*child.sources, link)
+
+    def group_nested(self, rows, source, children):
+        """
+        Split nested rows per parent, in the order of `rows`.
+        """
+        link = self.model._meta.get_field(source).field.attname
+        grouped = {}
+        for row in children:
+            grouped.setdefault(row[link], []).append(row)
+        return [grouped.get(row[self.pk], []) for row in rows]
+
+    def nested_queryset(self, source, child):
+        # Reuse the ordering of the serializer's own Prefetch, if it declares one
+        queryset = None
+        if issubclass(self.serializer_class, EagerLoadingMixin):
+            queryset = self.serializer_class.prefetch_queryset(source)
+        if queryset is not None:
+            return queryset.prefetch_related(None)
+        return child.model._default_manager.all()
+
+
+class UserSerializer(SparseFieldsMixin, EagerLoadingMixin, serializers.ModelSerializer):
+    prefetch_related_fields = ('groups', 'user_permissions')
 
-class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = '__all__'
 
-class StoreSerializer(serializers.ModelSerializer):
+class StoreSerializer(SparseFieldsMixin, EagerLoadingMixin, serializers.ModelSerializer):
     class Meta:
         model = Store
-        fields = '__all__'
+        # The version counters are cache validators, not part of the store: the
+        # store ETag only follows `version`, so product and order writes must
+        # not change the representation
+        exclude = ('version', 'catalog_version', 'order_version')
 
-class StaffSerializer(serializers.ModelSerializer):
+class StaffSerializer(SparseFieldsMixin, EagerLoadingMixin, serializers.ModelSerializer):
     class Meta:
         model = Staff
         fields = '__all__'
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, EagerLoadingMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = '__all__'
 
-class OrderItemSerializer(serializers.ModelSerializer):
+    def get_fields(self):
+        fields = super().get_fields()
+        # Stock is set on creation, then only moved by conditional UPDATEs
+        # (POST /products/<id>/stock/ and order items), never overwritten
+        if self.instance is not None and 'stock' in fields:
+            fields['stock'].read_only = True
+        return fields
+
+class OrderItemSerializer(SparseFieldsMixin, EagerLoadingMixin, serializers.ModelSerializer):
+    quantity = serializers.IntegerField(min_value=1)
+
     class Meta:
         model = OrderItem
         fields = '__all__'
 
-class OrderSerializer(serializers.ModelSerializer):
-    items = OrderItemSerializer(many=True, read_only=True)
-    
+class OrderLogSerializer(SparseFieldsMixin, EagerLoadingMixin, serializers.ModelSerializer):
     class Meta:
-        model = Order
+        model = OrderLog
         fields = '__all__'
+        # Set to the requesting user's panel account
+        read_only_fields = ('changed_by',)
+
+class OrderSerializer(SparseFieldsMixin, EagerLoadingMixin, serializers.ModelSerializer):
+    items = OrderItemSerializer(many=True, read_only=True)
+
+    prefetch_related_fields = (
+        Prefetch('items', queryset=OrderItem.objects.order_by('id')),
+    )
+    expandable_fields = {
+        'store': (StoreSerializer, {}, 'store'),
+        'logs': (OrderLogSerializer, {'many': True}, Prefetch('logs', queryset=OrderLog.objects.order_by('changed_at', 'id'))),
+    }
 
-class OrderLogSerializer(serializers.ModelSerializer):
     class Meta:
-        model = OrderLog
-        fields = '__all__'
+        model = Order
+        # Work queue leases are served by the claim endpoint
+        exclude = ('claimed_by', 'claim_token', 'claimed_until')
+        # Status only changes through the transition endpoints, which check
+        # ORDER_TRANSITIONS and write the log, stock, rollup and feed updates
+        read_only_fields = ('status',)
 
-class PromoCodeSerializer(serializers.ModelSerializer):
+class PromoCodeSerializer(SparseFieldsMixin, EagerLoadingMixin, serializers.ModelSerializer):
     class Meta:
         model = PromoCode
         fields = '__all__'
 
-class SubscriptionSerializer(serializers.ModelSerializer):
+class SubscriptionSerializer(SparseFieldsMixin, EagerLoadingMixin, serializers.ModelSerializer):
     class Meta:
         model = Subscription
         fields = '__all__'
+
+# The author of a status change is always the requesting user's panel account
+class OrderTransitionSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=OrderStatus.choices)
+    # Optimistic concurrency: reject the transition if the order changed since this value was read
+    updated_at = serializers.DateTimeField(required=False)
+
+class BulkOrderTransitionSerializer(serializers.Serializer):
+    orders = serializers.ListField(child=serializers.UUIDField(), min_length=1, max_length=1000)
+    status = serializers.ChoiceField(choices=OrderStatus.choices)
+
+class OrderClaimSerializer(serializers.Serializer):
+    queue = serializers.ChoiceField(choices=[StaffRole.CONFIRMATION, StaffRole.DISPATCH, StaffRole.DELIVERY])
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+    # Seconds until unfinished orders go back to the queue
+    lease = serializers.IntegerField(min_value=30, max_value=24 * 3600, default=lambda: settings.ORDER_CLAIM_LEASE)
+    store = serializers.UUIDField(required=False)
+
+class OrderReleaseSerializer(serializers.Serializer):
+    orders = serializers.ListField(child=serializers.UUIDField(), min_length=1, max_length=1000)
+
+class OrderIngestItemSerializer(serializers.Serializer):
+    product = serializers.UUIDField()
+    quantity = serializers.IntegerField(min_value=1)
+    unit_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+
+class OrderIngestSerializer(serializers.Serializer):
+    store = serializers.UUIDField()
+    customer_name = serializers.CharField(max_length=255)
+    customer_email = serializers.EmailField()
+    items = OrderIngestItemSerializer(many=True, allow_empty=False)
+
+class BulkOrderCreateSerializer(serializers.Serializer):
+    orders = OrderIngestSerializer(many=True, allow_empty=False, max_length=1000)
+
+class StockAdjustmentSerializer(serializers.Serializer):
+    # Negative values take stock, positive values give it back
+    delta = serializers.IntegerField()
+
+class PromoRedeemSerializer(serializers.Serializer):
+    code = serializers.CharField(max_length=50)
+
+class PromoValidateSerializer(serializers.Serializer):
+    codes = serializers.ListField(child=serializers.CharField(max_length=50), min_length=1, max_length=1000)
+
+class StoreStatsQuerySerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    # `rollup` reads the daily rollup table, `live` aggregates raw orders
+    source = serializers.ChoiceField(choices=['rollup', 'live'], default='rollup')
+
+    def validate(self, attrs):
+        end = attrs.get('end') or timezone.localdate()
+        start = attrs.get('start') or end - timedelta(days=29)
+        if start > end:
+            raise serializers.ValidationError('start must not be after end.')
+        if (end - start).days >= 366:
+            raise serializers.ValidationError('The range cannot exceed one year.')
+        return {'start': start, 'end': end, 'source': attrs['source']}
+
+class DailyStatsSerializer(serializers.Serializer):
+    day = serializers.DateField()
+    orders = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+class FunnelSerializer(serializers.Serializer):
+    created = serializers.IntegerField()
+    delivered = serializers.IntegerField()
+    conversion_rate = serializers.FloatField()
+
+class StoreStatsSerializer(serializers.Serializer):
+    start = serializers.DateField()
+    end = serializers.DateField()
+    revenue_by_day = DailyStatsSerializer(many=True)
+    orders_by_status = serializers.DictField(child=serializers.IntegerField())
+    funnel = FunnelSerializer()
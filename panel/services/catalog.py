@@ -0,0 +1,74 @@
+import threading
+
+from django.db import transaction
+from django.db.models import F
+
+from ..models import Store
+
+
+# Store version counters to bump when the current transaction commits,
+# per thread: field -> (store ids, ids of products whose store to bump)
+_pending = threading.local()
+
+
+def bump_store_version(store_ids):
+    """
+    Invalidate cached representations of the given stores.
+    """
+    Store.objects.filter(pk__in=list(store_ids)).update(version=F('version') + 1)
+
+
+def bump_catalog_version(store_ids=(), product_ids=()):
+    """
+    Invalidate cached product listings of the given stores, or of the stores
+    selling the given products, once the current transaction commits, see
+    bump_on_commit().
+    """
+    bump_on_commit('catalog_version', store_ids, product_ids)
+
+
+def bump_order_version(store_ids):
+    """
+    Invalidate the order validators of the given stores once the current
+    transaction commits, see bump_on_commit().
+    """
+    bump_on_commit('order_version', store_ids)
+
+
+def bump_on_commit(field, store_ids, product_ids=()):
+    """
+    Bump Store counter `field` of `store_ids`, and of the stores selling
+    `product_ids`, after the current transaction commits (at once outside
+    of one).
+
+    However often it is called in a transaction, each counter is bumped
+    with one UPDATE at the end, so hot Store rows are written once per
+    transaction and not locked while it runs. Stores of a rolled back
+    transaction are bumped with the next commit, which only costs a
+    needless cache miss.
+    """
+    store_ids, product_ids = set(store_ids), set(product_ids)
+    if not store_ids and not product_ids:
+        return
+    pending = getattr(_pending, 'stores', None)
+    if pending is None:
+        pending = _pending.stores = {}
+    stores, products = pending.setdefault(field, (set(), set()))
+    stores.update(store_ids)
+    products.update(product_ids)
+    transaction.on_commit(flush_bumps)
+
+
+def flush_bumps():
+    pending, _pending.stores = getattr(_pending, 'stores', None) or {}, {}
+    for field, (store_ids, product_ids) in pending.items():
+        if product_ids:
+            stores = Store.objects.filter(products__pk__in=product_ids)
+            if store_ids:
+                stores = stores | Store.objects.filter(pk__in=store_ids)
+            stores = Store.objects.filter(pk__in=stores.values('pk'))
+        elif store_ids:
+            stores = Store.objects.filter(pk__in=store_ids)
+        else:
+            continue
+        stores.update(**{field: F(field) + 1})
@@ -0,0 +1,123 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from ..caching import shared_cache
+from ..models import OrderEvent
+
+
+# PostgreSQL advisory lock making event ids commit in the order they are assigned
+FEED_LOCK = 0x66656564
+
+# Columns of an event as served by the feed
+EVENT_FIELDS = ('id', 'kind', 'store_id', 'order_id', 'log_id', 'status', 'created_at')
+
+
+def feed_cache():
+    """
+    Return the cache holding the feed counters, or None when ORDER_EVENTS
+    names no cache shared by all workers: waiting clients then poll the
+    database.
+    """
+    return shared_cache(settings.ORDER_EVENTS.get('CACHE'))
+
+
+def feed_key(store_id=None):
+    return f'panel:order-events:{store_id or "all"}'
+
+
+def feed_keys(store_ids=None):
+    """
+    Return the cache keys that change when `store_ids` (all stores for
+    None) get new events.
+    """
+    if store_ids is None:
+        return [feed_key()]
+    return [feed_key(store_id) for store_id in store_ids]
+
+
+def lock_feed():
+    """
+    Hold the feed lock until the current transaction ends. Clients resume
+    after the last id they saw, so an id must never become visible after a
+    higher one: on PostgreSQL ids are assigned at INSERT but seen at
+    COMMIT, so transactions recording events take turns. SQLite
+    transactions already hold the database write lock.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [FEED_LOCK])
+
+
+def record_events(events):
+    """
+    Insert unsaved OrderEvent rows with one bulk_create, under the feed
+    lock; call it last in the transaction, the lock is held until commit.
+    Once the transaction commits, the feed counters of their stores are
+    bumped so waiting streams look for them.
+    """
+    if not events:
+        return []
+    lock_feed()
+    events = OrderEvent.objects.bulk_create(events)
+    if events and feed_cache() is not None:
+        store_ids = {event.store_id for event in events}
+        transaction.on_commit(lambda: signal_stores(store_ids))
+    return events
+
+
+def signal_stores(store_ids):
+    cache = feed_cache()
+    for key in feed_keys(None) + feed_keys(store_ids):
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Evicted in between; readers see the missing key as a change too
+            pass
+
+
+def order_created_events(orders):
+    return [
+        OrderEvent(store_id=order.store_id, order_id=order.pk, kind=OrderEvent.Kind.CREATED, status=order.status)
+        for order in orders
+    ]
+
+
+def status_events(logs, store_ids):
+    """
+    Events of new OrderLog rows; `store_ids` maps order id to store id.
+    """
+    return [
+        OrderEvent(store_id=store_ids[log.order_id], order_id=log.order_id, log_id=log.pk,
+                   kind=OrderEvent.Kind.STATUS, status=log.status)
+        for log in logs
+    ]
+
+
+def events_after(sequence, store_ids=None, limit=100):
+    """
+    Return a queryset of up to `limit` event dicts with an id above
+    `sequence`, oldest first, limited to `store_ids` unless None.
+    """
+    events = OrderEvent.objects.filter(pk__gt=sequence)
+    if store_ids is not None:
+        events = events.filter(store_id__in=store_ids)
+    return events.order_by('pk').values(*EVENT_FIELDS)[:limit]
+
+
+async def alatest_sequence():
+    """
+    Return the id of the newest event, 0 for an empty feed.
+    """
+    return await OrderEvent.objects.order_by('-pk').values_list('pk', flat=True).afirst() or 0
+
+
+def prune_events(days):
+    """
+    Delete events older than `days` days and return how many went.
+    """
+    return OrderEvent.objects.filter(created_at__lt=timezone.now() - timedelta(days=days)).delete()[0]
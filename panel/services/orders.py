@@ -0,0 +1,250 @@
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import Store, Product, Order, OrderItem, OrderLog, OrderStatus, ORDER_TRANSITIONS
+from .stock import take_stock, merge_lines
+from .queue import enqueue, enqueue_many
+from .events import record_events, order_created_events, status_events
+from .catalog import bump_order_version
+from . import rollups
+
+
+# Leaving the order flow for one of these gives the reserved stock back
+STOCK_RELEASING_STATUSES = {OrderStatus.RETURNED, OrderStatus.CANCELED}
+
+# A transition finishes the work on the order: its work queue lease ends
+RELEASED = {'claimed_by': None, 'claim_token': None, 'claimed_until': None}
+
+
+class TransitionError(Exception):
+    """
+    Raised when an order cannot move to the requested status.
+    """
+
+
+class StaleOrderError(TransitionError):
+    """
+    Raised when the order changed since the caller last read it.
+    """
+
+
+def allowed_sources(status):
+    """
+    Return the statuses an order may be in to move to `status`.
+    """
+    return [source for source, targets in ORDER_TRANSITIONS.items() if status in targets]
+
+
+def transition_order(order_id, status, changed_by_id, expected_updated_at=None):
+    """
+    Move one order to `status` and record the OrderLog row in the same
+    transaction.
+
+    The row is locked where the database supports it, and the UPDATE is
+    guarded on the status that was read (and on `expected_updated_at` when
+    given), so a concurrent writer makes this call fail instead of being
+    silently overwritten.
+    """
+    with transaction.atomic():
+        try:
+            order = Order.objects.select_for_update().get(pk=order_id)
+        except Order.DoesNotExist:
+            raise TransitionError('Order not found.')
+        if expected_updated_at is not None and order.updated_at != expected_updated_at:
+            raise StaleOrderError('Order was modified by someone else.')
+        if status not in ORDER_TRANSITIONS[order.status]:
+            raise TransitionError(f'Cannot move an order from {order.status} to {status}.')
+
+        now = timezone.now()
+        updated = Order.objects.filter(
+            pk=order.pk, status=order.status, updated_at=order.updated_at,
+        ).update(status=status, updated_at=now, **RELEASED)
+        if not updated:
+            raise StaleOrderError('Order was modified by someone else.')
+
+        previous = {order.pk: (order.store_id, order.created_at, order.status)}
+        order.status, order.updated_at = status, now
+        log = OrderLog.objects.create(order=order, status=status, changed_by_id=changed_by_id)
+        queue_transition_work([log], previous, rollups.order_revenue([order.pk]), status)
+    return order
+
+
+def bulk_transition_orders(order_ids, status, changed_by_id, store_ids=None):
+    """
+    Move many orders to `status` with a single UPDATE and a single
+    bulk_create of OrderLog rows.
+
+    Orders that are missing, outside `store_ids` (when given) or not allowed
+    to make the transition are left untouched and reported in the returned
+    `errors` mapping; the rest move together or not at all.
+    """
+    order_ids = list(dict.fromkeys(order_ids))
+    sources = allowed_sources(status)
+    errors = {}
+    orders = Order.objects.select_for_update().filter(pk__in=order_ids)
+    if store_ids is not None:
+        orders = orders.filter(store_id__in=store_ids)
+    with transaction.atomic():
+        current = {
+            order_id: (store_id, created_at, order_status)
+            for order_id, store_id, created_at, order_status in orders.values_list('pk', 'store_id', 'created_at', 'status')
+        }
+        movable = []
+        for order_id in order_ids:
+            if order_id not in current:
+                errors[order_id] = 'Order not found.'
+            elif current[order_id][2] not in sources:
+                errors[order_id] = f'Cannot move an order from {current[order_id][2]} to {status}.'
+            else:
+                movable.append(order_id)
+
+        if movable:
+            now = timezone.now()
+            updated = Order.objects.filter(pk__in=movable, status__in=sources).update(
+                status=status, updated_at=now, **RELEASED,
+            )
+            if updated != len(movable):
+                raise StaleOrderError('Some orders were modified by someone else, retry the batch.')
+            logs = OrderLog.objects.bulk_create(
+                OrderLog(order_id=order_id, status=status, changed_by_id=changed_by_id) for order_id in movable
+            )
+            queue_transition_work(logs, current, rollups.order_revenue(movable), status)
+    return movable, errors
+
+
+def queue_transition_work(logs, previous, revenue, status):
+    """
+    Queue the follow-up work of orders that just moved to `status`: the
+    rollup move, the release of their stock if they left the order flow, a
+    status email per order, their order feed events and a bump of their
+    stores' order version.
+
+    `logs` are the new OrderLog rows, `previous` maps order id to
+    `(store_id, created_at, previous_status)` and `revenue` order id to item
+    revenue. The rollup deltas and stock lines are computed now, inside the
+    transition's transaction, so the tasks only apply them.
+    """
+    # A log row belongs to exactly one transition, so it keys the batch
+    batch = logs[0].pk
+    order_ids = [log.order_id for log in logs]
+    deltas = rollups.move_deltas(((*previous[order_id], revenue.get(order_id)) for order_id in order_ids), status)
+    rollups.queue_deltas(deltas, key=f'rollup:transition:{batch}')
+    if status in STOCK_RELEASING_STATUSES:
+        lines = merge_lines(OrderItem.objects.filter(order_id__in=order_ids).values_list('product_id', 'quantity'))
+        if lines:
+            enqueue('release_stock_lines', {'lines': [[str(product_id), quantity] for product_id, quantity in lines]},
+                    key=f'stock:transition:{batch}')
+    queue_order_emails((order_id, status) for order_id in order_ids)
+    store_ids = {order_id: previous[order_id][0] for order_id in order_ids}
+    record_events(status_events(logs, store_ids))
+    bump_order_version(store_ids.values())
+
+
+def queue_order_created(orders, revenue=None):
+    """
+    Queue the follow-up work of new orders: their rollup counts, a
+    confirmation email each, a subscription refresh of their stores, their
+    order feed events and a bump of their stores' order version.
+    """
+    revenue = revenue or {}
+    deltas = rollups.collect_deltas(
+        ((order.store_id, order.created_at, order.status, revenue.get(order.pk)) for order in orders), 1,
+    )
+    rollups.queue_deltas(deltas, key=f'rollup:created:{orders[0].pk}')
+    queue_order_emails((order.pk, order.status) for order in orders)
+    # At most one refresh per store and hour
+    hour = timezone.now().strftime('%Y%m%d%H')
+    enqueue_many('refresh_store_subscriptions', [
+        ({'store_id': str(store_id)}, f'subscriptions:{store_id}:{hour}')
+        for store_id in {order.store_id for order in orders}
+    ])
+    record_events(order_created_events(orders))
+    bump_order_version({order.store_id for order in orders})
+
+
+def queue_order_emails(orders):
+    # An order reaches each status once, so (order, status) identifies the email
+    enqueue_many('send_order_email', [
+        ({'order_id': str(order_id), 'status': status}, f'order-email:{order_id}:{status}') for order_id, status in orders
+    ])
+
+
+class OrderRejected(Exception):
+    """
+    Raised while ingesting a batch when one order cannot be accepted.
+    """
+
+
+def ingest_orders(orders, store_ids=None):
+    """
+    Create many orders with their items in one transaction.
+
+    `orders` is a list of dicts with `store`, `customer_name`,
+    `customer_email` and `items` (each with `product`, `quantity` and an
+    optional `unit_price`). Stores and products are validated with one
+    query each, stock is taken with conditional UPDATEs and rows are inserted
+    with bulk_create, computing `total_price` here instead of in
+    OrderItem.save().
+
+    Returns `(created, errors)`: the created Order instances in input order,
+    and a mapping of input index to the reason that order was rejected.
+    Rejected orders leave no rows and no stock changes behind. With
+    `store_ids`, orders for other stores are rejected as unknown.
+    """
+    stores = Store.objects.filter(pk__in={data['store'] for data in orders})
+    if store_ids is not None:
+        stores = stores.filter(pk__in=store_ids)
+    product_ids = {item['product'] for data in orders for item in data['items']}
+    created, errors = [], {}
+    new_orders, new_items = [], []
+
+    with transaction.atomic():
+        known_stores = set(stores.values_list('pk', flat=True))
+        products = Product.objects.in_bulk(product_ids)
+
+        for index, data in enumerate(orders):
+            try:
+                with transaction.atomic():
+                    order, items = _build_order(data, known_stores, products)
+                    _take_stock(items)
+            except OrderRejected as exc:
+                errors[index] = str(exc)
+                continue
+            new_orders.append(order)
+            new_items.extend(items)
+            created.append(order)
+
+        Order.objects.bulk_create(new_orders)
+        OrderItem.objects.bulk_create(new_items)
+        revenue = {}
+        for item in new_items:
+            revenue[item.order_id] = revenue.get(item.order_id, 0) + item.total_price
+        if new_orders:
+            queue_order_created(new_orders, revenue)
+    return created, errors
+
+
+def _build_order(data, known_stores, products):
+    if data['store'] not in known_stores:
+        raise OrderRejected('Store not found.')
+    order = Order(store_id=data['store'], customer_name=data['customer_name'], customer_email=data['customer_email'])
+    items = []
+    for item in data['items']:
+        product = products.get(item['product'])
+        if product is None or product.store_id != order.store_id:
+            raise OrderRejected(f"Product {item['product']} is not sold by this store.")
+        unit_price = item.get('unit_price', product.price)
+        if unit_price != product.price:
+            raise OrderRejected(f'Price of product {product.pk} changed to {product.price}.')
+        items.append(OrderItem(
+            order=order, product=product, quantity=item['quantity'],
+            unit_price=unit_price, total_price=item['quantity'] * unit_price,
+        ))
+    return order, items
+
+
+def _take_stock(items):
+    lines = merge_lines((item.product_id, item.quantity) for item in items)
+    for (product_id, _), taken in zip(lines, take_stock(lines)):
+        if not taken:
+            raise OrderRejected(f'Not enough stock for product {product_id}.')
@@ -0,0 +1,96 @@
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from ..caching import TTLCache
+from ..models import PromoCode
+
+
+PROMO_CODE_CACHE = getattr(settings, 'PROMO_CODE_CACHE', {})
+
+# code -> promo code row (or UNKNOWN), shared by every request served by this process
+promo_cache = TTLCache(
+    max_size=PROMO_CODE_CACHE.get('MAX_SIZE', 10_000),
+    ttl=PROMO_CODE_CACHE.get('TTL', 30),
+)
+
+# Cached for codes that do not exist, so guessed codes do not hit the database either
+UNKNOWN = False
+
+PROMO_FIELDS = ('id', 'code', 'discount_percentage', 'max_usage', 'current_usage', 'valid_from', 'valid_until')
+
+
+def lookup_codes(codes):
+    """
+    Return `{code: row}` for the given codes, `row` being a dict of
+    PROMO_FIELDS or UNKNOWN. Cache misses are fetched with a single query.
+    """
+    rows = {}
+    for code in codes:
+        row = promo_cache.get(code)
+        if row is not None:
+            rows[code] = row
+    missing = [code for code in codes if code not in rows]
+    if missing:
+        found = {row['code']: row for row in PromoCode.objects.filter(code__in=missing).values(*PROMO_FIELDS)}
+        for code in missing:
+            rows[code] = found.get(code, UNKNOWN)
+            promo_cache.set(code, rows[code])
+    return rows
+
+
+def rejection_reason(row, at=None):
+    """
+    Return why the promo code `row` cannot be redeemed at `at`, or None.
+    """
+    at = at or timezone.now()
+    if row is UNKNOWN:
+        return 'unknown'
+    if at < row['valid_from']:
+        return 'not_started'
+    if at > row['valid_until']:
+        return 'expired'
+    if row['current_usage'] >= row['max_usage']:
+        return 'exhausted'
+    return None
+
+
+def validate_codes(codes):
+    """
+    Check many codes at once and return `{code: (row, reason)}`, `reason`
+    being None for codes that can be redeemed.
+
+    This is advisory: usage counts may be up to PROMO_CODE_CACHE['TTL']
+    seconds old. Only redeem_code() decides whether a use is granted.
+    """
+    now = timezone.now()
+    return {code: (row, rejection_reason(row, now)) for code, row in lookup_codes(list(dict.fromkeys(codes))).items()}
+
+
+def redeem_code(code):
+    """
+    Use promo code `code` once. Returns whether the use was granted.
+
+    Validity and the usage limit are checked by the same conditional
+    `UPDATE ... SET current_usage = current_usage + 1 WHERE current_usage <
+    max_usage AND valid_from <= now <= valid_until`, so concurrent
+    redemptions can never exceed `max_usage`, whatever the isolation level.
+    Call it inside the transaction that records what the code was used for.
+    """
+    now = timezone.now()
+    granted = bool(PromoCode.objects.filter(
+        code=code, current_usage__lt=F('max_usage'), valid_from__lte=now, valid_until__gte=now,
+    ).update(current_usage=F('current_usage') + 1))
+    if not granted:
+        # The cached row may still look redeemable; let validation see why it is not
+        promo_cache.delete(code)
+    return granted
+
+
+def explain_rejection(code):
+    """
+    Return why redeem_code() just refused `code`.
+    """
+    row, reason = validate_codes([code])[code]
+    # Redeemable again by now, e.g. a competing use was rolled back
+    return reason or 'exhausted'
@@ -0,0 +1,177 @@
+import random
+import time
+import traceback
+import uuid
+from collections import namedtuple
+from datetime import timedelta
+
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from ..models import Task
+
+
+TaskSpec = namedtuple('TaskSpec', 'func max_attempts retry_delay every', defaults=(None,))
+
+# Task name -> TaskSpec, filled by the @task decorator (see panel/tasks.py)
+registry = {}
+
+# Upper bound for the exponential retry delay, in seconds
+MAX_RETRY_DELAY = 3600
+
+
+class LeaseLost(Exception):
+    """
+    Raised when a task was reclaimed by another worker while it ran.
+    """
+
+
+def task(name=None, max_attempts=5, retry_delay=10, every=None):
+    """
+    Register a function as a task. Failed runs are retried up to
+    `max_attempts` times, `retry_delay * 2 ** (attempt - 1)` seconds apart.
+    With `every`, the task is periodic: each run queues the next one
+    `every` seconds later (see schedule_periodic).
+    """
+    def register(func):
+        registry[name or func.__name__] = TaskSpec(func, max_attempts, retry_delay, every)
+        return func
+    return register
+
+
+def enqueue(name, payload=None, key=None, delay=0):
+    """
+    Queue one task. Call it inside the transaction that writes the data the
+    task is about: the task becomes visible to workers when that commits.
+    Nothing is queued when a task with the same idempotency `key` exists.
+    """
+    enqueue_many(name, [(payload, key)], delay)
+
+
+def enqueue_many(name, jobs, delay=0):
+    """
+    Queue `(payload, key)` jobs of one task with a single INSERT, skipping
+    jobs whose key is already taken.
+    """
+    run_after = timezone.now() + timedelta(seconds=delay)
+    Task.objects.bulk_create(
+        [Task(name=name, payload=payload or {}, idempotency_key=key, run_after=run_after) for payload, key in jobs],
+        ignore_conflicts=True,
+    )
+
+
+def schedule_periodic(name=None):
+    """
+    Queue the next run of periodic task `name` (of all of them by default)
+    at the next multiple of its interval. The slot is the idempotency key,
+    so any number of workers scheduling the same run queue it once.
+    """
+    now = time.time()
+    for task_name, spec in registry.items():
+        if spec.every and name in (None, task_name):
+            slot = int(now // spec.every + 1) * spec.every
+            enqueue(task_name, key=f'periodic:{task_name}:{slot}', delay=slot - now)
+
+
+def claim_tasks(limit, lease):
+    """
+    Lease up to `limit` due tasks for `lease` seconds and return them.
+
+    The claim is a conditional UPDATE stamped with a fresh lease token, so
+    two workers can never both win a task, whether or not the database
+    supports SKIP LOCKED. Tasks whose lease expired (their worker died) are
+    due again.
+    """
+    now = timezone.now()
+    due = Q(status=Task.Status.QUEUED, run_after__lte=now) | Q(status=Task.Status.RUNNING, locked_until__lt=now)
+    token = uuid.uuid4()
+    with transaction.atomic():
+        candidates = list(
+            Task.objects.select_for_update(skip_locked=True).filter(due)
+            .order_by('run_after').values_list('pk', flat=True)[:limit]
+        )
+        if not candidates:
+            return []
+        Task.objects.filter(due, pk__in=candidates).update(
+            status=Task.Status.RUNNING, lease_token=token, locked_until=now + timedelta(seconds=lease),
+            attempts=F('attempts') + 1,
+        )
+    return list(Task.objects.filter(pk__in=candidates, lease_token=token).order_by('run_after'))
+
+
+def prune_tasks(days):
+    """
+    Delete DONE and FAILED tasks that finished more than `days` days ago and
+    return how many went. Their idempotency keys go with them, so only
+    prune past the window in which the same event could be queued again.
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    # Finishing stamps updated_at; a task is due before it finishes, so the run_after bound
+    # holds as well and lets the (status, run_after) index narrow the scan
+    finished = Task.objects.filter(
+        status__in=[Task.Status.DONE, Task.Status.FAILED], run_after__lt=cutoff, updated_at__lt=cutoff,
+    )
+    return finished.delete()[0]
+
+
+def retry_delay(spec, attempts):
+    delay = min(spec.retry_delay * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+    # Jitter spreads out retries of tasks that failed together
+    return delay * random.uniform(1, 1.1)
+
+
+def run_task(task):
+    """
+    Run one claimed task. Its database writes commit together with the DONE
+    mark; on failure they roll back and the task is rescheduled with
+    backoff, or marked FAILED once it is out of attempts. Periodic tasks
+    queue their next run either way.
+    """
+    spec = registry.get(task.name)
+    mine = Task.objects.filter(pk=task.pk, lease_token=task.lease_token)
+    try:
+        if spec is None:
+            raise LookupError(f'Unknown task {task.name!r}.')
+        with transaction.atomic():
+            spec.func(**task.payload)
+            if not mine.update(status=Task.Status.DONE, lease_token=None, locked_until=None, last_error='',
+                               updated_at=timezone.now()):
+                raise LeaseLost()
+            if spec.every:
+                schedule_periodic(task.name)
+    except LeaseLost:
+        pass
+    except Exception:
+        error = traceback.format_exc()
+        if spec is None or task.attempts >= spec.max_attempts:
+            failed = mine.update(status=Task.Status.FAILED, lease_token=None, locked_until=None, last_error=error,
+                                 updated_at=timezone.now())
+            if failed and spec is not None and spec.every:
+                schedule_periodic(task.name)
+        else:
+            run_after = timezone.now() + timedelta(seconds=retry_delay(spec, task.attempts))
+            mine.update(status=Task.Status.QUEUED, lease_token=None, locked_until=None, run_after=run_after, last_error=error)
+
+
+def run_pending(limit=20, lease=300, executor=None):
+    """
+    Claim and run one batch of due tasks, on `executor` (a thread pool) or
+    inline. Returns the number of tasks claimed.
+    """
+    tasks = claim_tasks(limit, lease)
+    if executor is None:
+        for task in tasks:
+            run_task(task)
+    else:
+        # Consume the results so that a crashing thread surfaces here
+        list(executor.map(run_in_thread, tasks))
+    return len(tasks)
+
+
+def run_in_thread(task):
+    try:
+        run_task(task)
+    finally:
+        # Worker threads hold their own connections; drop broken or expired ones
+        close_old_connections()
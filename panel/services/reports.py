@@ -0,0 +1,95 @@
+from datetime import datetime, time, timedelta
+
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from ..models import Order, OrderItem, OrderStatus, DailyOrderRollup
+
+
+# Orders in these statuses do not count towards revenue
+NON_REVENUE_STATUSES = [OrderStatus.CANCELED, OrderStatus.RETURNED]
+
+
+def day_start(day):
+    """
+    Return the aware datetime at which `day` begins in the current time zone.
+    """
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def store_stats(store_id, start, end):
+    """
+    Sales and order-funnel figures for one store, for orders created between
+    the `start` and `end` dates (inclusive).
+
+    Everything is aggregated in SQL with two grouped queries, one over
+    OrderItem for revenue and one over Order for counts, so the cost does
+    not depend on how many rows are summed on the Python side. The dates
+    are turned into a half-open `created_at` range, which the (store,
+    created_at) index serves, where a `__date` lookup would not.
+    """
+    orders = Order.objects.filter(
+        store_id=store_id, created_at__gte=day_start(start), created_at__lt=day_start(end + timedelta(days=1)),
+    )
+    counts = (
+        orders.annotate(day=TruncDate('created_at'))
+        .values_list('day', 'status')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    revenue = (
+        OrderItem.objects.filter(order__in=orders.exclude(status__in=NON_REVENUE_STATUSES))
+        .annotate(day=TruncDate('order__created_at'))
+        .values_list('day')
+        .annotate(revenue=Sum('total_price'))
+        .order_by()
+    )
+    return build_stats(start, end, counts, revenue)
+
+
+def rollup_store_stats(store_id, start, end):
+    """
+    Same figures as `store_stats`, read from DailyOrderRollup: one indexed
+    range scan over at most (days x statuses) rows, whatever the order
+    history size.
+    """
+    rows = list(
+        DailyOrderRollup.objects.filter(store_id=store_id, day__gte=start, day__lte=end)
+        .exclude(orders=0, revenue=0)
+        .values_list('day', 'status', 'orders', 'revenue')
+    )
+    counts = [(day, status, orders) for day, status, orders, _ in rows]
+    revenue = [(day, amount) for day, status, _, amount in rows if status not in NON_REVENUE_STATUSES]
+    return build_stats(start, end, counts, revenue)
+
+
+def build_stats(start, end, counts, revenue):
+    """
+    Shape `(day, status, count)` and `(day, revenue)` rows into the stats
+    payload.
+    """
+    days = {}
+    by_status = dict.fromkeys(OrderStatus.values, 0)
+    for day, status, count in counts:
+        days.setdefault(day, {'orders': 0, 'revenue': 0})['orders'] += count
+        by_status[status] += count
+    for day, amount in revenue:
+        days.setdefault(day, {'orders': 0, 'revenue': 0})['revenue'] += amount or 0
+
+    created = sum(by_status.values())
+    delivered = by_status[OrderStatus.DELIVERED]
+    return {
+        'start': start,
+        'end': end,
+        'revenue_by_day': [
+            {'day': day, 'orders': values['orders'], 'revenue': values['revenue']}
+            for day, values in sorted(days.items())
+        ],
+        'orders_by_status': by_status,
+        'funnel': {
+            'created': created,
+            'delivered': delivered,
+            'conversion_rate': round(delivered / created, 4) if created else 0.0,
+        },
+    }
@@ -0,0 +1,203 @@
+import uuid
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from ..models import Order, OrderItem, DailyOrderRollup, Task
+from .queue import enqueue
+from .reports import day_start
+
+
+# PostgreSQL advisory lock serializing rollup rebuilds with delta writers
+ROLLUP_LOCK = 0x726f6c6c
+
+
+def lock_rollups(exclusive=False):
+    """
+    Take the rollup lock until the current transaction ends: shared by the
+    transactions that apply or queue deltas, exclusive for
+    rebuild_rollups(). Only PostgreSQL needs it, SQLite transactions take
+    the database write lock at BEGIN.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    function = 'pg_advisory_xact_lock' if exclusive else 'pg_advisory_xact_lock_shared'
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {function}(%s)', [ROLLUP_LOCK])
+
+
+def rollup_key(store_id, created_at, status):
+    return (store_id, timezone.localdate(created_at), status)
+
+
+def add_orders(rows, sign=1):
+    """
+    Count orders in (or, with `sign=-1`, out of) the rollup. `rows` are
+    `(store_id, created_at, status, revenue)` tuples.
+    """
+    apply_deltas(collect_deltas(rows, sign))
+
+
+def move_orders(rows, status):
+    """
+    Move orders to another status bucket of their creation day. `rows` are
+    `(store_id, created_at, previous_status, revenue)` tuples.
+    """
+    apply_deltas(move_deltas(rows, status))
+
+
+def move_deltas(rows, status):
+    rows = list(rows)
+    deltas = collect_deltas(rows, sign=-1)
+    collect_deltas(((store_id, created_at, status, revenue) for store_id, created_at, _, revenue in rows), 1, deltas)
+    return deltas
+
+
+def collect_deltas(rows, sign, deltas=None):
+    if deltas is None:
+        deltas = defaultdict(lambda: [0, Decimal(0)])
+    for store_id, created_at, status, revenue in rows:
+        delta = deltas[rollup_key(store_id, created_at, status)]
+        delta[0] += sign
+        delta[1] += sign * (revenue or 0)
+    return deltas
+
+
+def queue_deltas(deltas, key):
+    """
+    Queue `deltas` for the `apply_rollup_deltas` task, in the transaction
+    that writes the orders they describe.
+    """
+    lock_rollups()
+    enqueue('apply_rollup_deltas', {'deltas': dump_deltas(deltas)}, key=key)
+
+
+def dump_deltas(deltas):
+    """
+    Encode deltas as JSON-friendly rows, e.g. for a task payload.
+    """
+    return [
+        [str(store_id), day.isoformat(), status, orders, str(revenue)]
+        for (store_id, day, status), (orders, revenue) in deltas.items()
+    ]
+
+
+def load_deltas(rows):
+    return {
+        (uuid.UUID(store_id), date.fromisoformat(day), status): [orders, Decimal(revenue)]
+        for store_id, day, status, orders, revenue in rows
+    }
+
+
+def add_revenue(order, amount):
+    """
+    Book item revenue (negative to remove it) on the order's current bucket.
+    """
+    apply_deltas({rollup_key(order.store_id, order.created_at, order.status): [0, amount]})
+
+
+def order_revenue(order_ids):
+    """
+    Return order id -> total item revenue for the given orders in one query.
+    """
+    return dict(
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .values_list('order_id')
+        .annotate(total=Sum('total_price'))
+        .order_by()
+    )
+
+
+def apply_deltas(deltas):
+    """
+    Add `{(store_id, day, status): [orders, revenue]}` to the rollup: missing
+    buckets are inserted in one statement, then each bucket gets a single
+    `UPDATE ... SET orders = orders + n`, so concurrent writers never lose
+    an increment.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta[0] or delta[1]}
+    if not deltas:
+        return
+    with transaction.atomic():
+        lock_rollups()
+        DailyOrderRollup.objects.bulk_create(
+            [DailyOrderRollup(store_id=store_id, day=day, status=status) for store_id, day, status in deltas],
+            ignore_conflicts=True,
+        )
+        for (store_id, day, status), (orders, revenue) in deltas.items():
+            DailyOrderRollup.objects.filter(store_id=store_id, day=day, status=status).update(
+                orders=F('orders') + orders, revenue=F('revenue') + revenue,
+            )
+
+
+def rebuild_rollups(store_id=None, since=None, chunk_size=2000):
+    """
+    Recompute the rollup from `Order.status` (optionally for one store
+    and/or for orders created on or after the `since` date).
+
+    The rebuild holds the rollup lock exclusively, so no delta is applied
+    or queued while it counts and replaces the rows. Deltas queued before
+    describe changes the count already includes: their in-scope part is
+    dropped and the rest applied, and their tasks are marked done (a worker
+    running one loses its lease and rolls back). Orders are streamed with
+    `iterator(chunk_size=...)`, so memory only grows with the number of
+    (store, day, status) buckets. Returns the bucket count.
+    """
+    orders = Order.objects.all()
+    rollups = DailyOrderRollup.objects.all()
+    if store_id is not None:
+        orders = orders.filter(store_id=store_id)
+        rollups = rollups.filter(store_id=store_id)
+    if since is not None:
+        orders = orders.filter(created_at__gte=day_start(since))
+        rollups = rollups.filter(day__gte=since)
+
+    def in_scope(key):
+        store, day, _ = key
+        return (store_id is None or str(store) == str(store_id)) and (since is None or day >= since)
+
+    revenue = (
+        OrderItem.objects.filter(order=OuterRef('pk'))
+        .values('order')
+        .annotate(total=Sum('total_price'))
+        .values('total')
+    )
+    rows = orders.annotate(revenue=Subquery(revenue)).values_list('store_id', 'created_at', 'status', 'revenue').order_by()
+
+    with transaction.atomic():
+        lock_rollups(exclusive=True)
+        pending = Task.objects.select_for_update().filter(
+            name='apply_rollup_deltas', status__in=[Task.Status.QUEUED, Task.Status.RUNNING],
+        )
+        outside = defaultdict(lambda: [0, Decimal(0)])
+        drained = []
+        for task in pending:
+            for key, (count, amount) in load_deltas(task.payload['deltas']).items():
+                if not in_scope(key):
+                    outside[key][0] += count
+                    outside[key][1] += amount
+            drained.append(task.pk)
+
+        buckets = defaultdict(lambda: [0, Decimal(0)])
+        for store, created_at, status, amount in rows.iterator(chunk_size=chunk_size):
+            bucket = buckets[rollup_key(store, created_at, status)]
+            bucket[0] += 1
+            bucket[1] += amount or 0
+
+        rollups.delete()
+        DailyOrderRollup.objects.bulk_create(
+            (
+                DailyOrderRollup(store_id=store, day=day, status=status, orders=count, revenue=amount)
+                for (store, day, status), (count, amount) in buckets.items()
+            ),
+            batch_size=chunk_size,
+        )
+        apply_deltas(outside)
+        Task.objects.filter(pk__in=drained).update(
+            status=Task.Status.DONE, lease_token=None, locked_until=None, updated_at=timezone.now(),
+        )
+    return len(buckets)
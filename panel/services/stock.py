@@ -0,0 +1,60 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F
+
+from ..models import Product, OrderItem
+from .catalog import bump_catalog_version
+
+
+def take_stock(lines):
+    """
+    Decrement stock for each `(product_id, quantity)` line.
+
+    Every line is a single conditional `UPDATE ... SET stock = stock - n
+    WHERE stock >= n`, so concurrent callers can never drive stock below
+    zero, whatever the isolation level. Returns one boolean per line telling
+    whether it was taken; lines are independent, so callers that need
+    all-or-nothing must run this in a transaction and roll back on failure.
+    Lines with a quantity below 1 are refused, they would add stock.
+
+    The catalog versions of the affected stores are bumped once per
+    transaction, when it commits.
+    """
+    lines = list(lines)
+    taken = [
+        quantity > 0
+        and bool(Product.objects.filter(pk=product_id, stock__gte=quantity).update(stock=F('stock') - quantity))
+        for product_id, quantity in lines
+    ]
+    bump_catalog_version(product_ids=[product_id for (product_id, _), ok in zip(lines, taken) if ok])
+    return taken
+
+
+def release_stock(lines):
+    """
+    Give back stock for each `(product_id, quantity)` line.
+    """
+    lines = merge_lines(lines)
+    for product_id, quantity in lines:
+        Product.objects.filter(pk=product_id).update(stock=F('stock') + quantity)
+    bump_catalog_version(product_ids=[product_id for product_id, _ in lines])
+
+
+def release_order_stock(order_ids):
+    """
+    Give back the stock held by the items of the given orders, with one
+    UPDATE per distinct product.
+    """
+    with transaction.atomic():
+        release_stock(OrderItem.objects.filter(order_id__in=order_ids).values_list('product_id', 'quantity'))
+
+
+def merge_lines(lines):
+    """
+    Sum quantities per product so each product is updated once.
+    """
+    quantities = Counter()
+    for product_id, quantity in lines:
+        quantities[product_id] += quantity
+    return list(quantities.items())
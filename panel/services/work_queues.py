@@ -0,0 +1,65 @@
+import uuid
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import Order, OrderStatus, StaffRole
+
+
+# Work queue -> the order status it holds. Each queue is worked by the
+# assistants of the matching StaffRole; managers and owners may work any.
+QUEUES = {
+    StaffRole.CONFIRMATION: OrderStatus.IN_CONFIRMATION,
+    StaffRole.DISPATCH: OrderStatus.IN_DISPATCH,
+    StaffRole.DELIVERY: OrderStatus.IN_DELIVERY,
+}
+
+
+def unclaimed(now):
+    return Q(claimed_until__isnull=True) | Q(claimed_until__lt=now)
+
+
+def claim_orders(queue, store_ids, claimant_id, limit, lease):
+    """
+    Lease up to `limit` of the oldest unclaimed orders of `queue` in the
+    given stores (all stores for None) to panel user `claimant_id` for
+    `lease` seconds. Returns the claimed ids and the lease expiry.
+
+    Like claim_tasks(), candidates are read with SKIP LOCKED where the
+    database supports it, so concurrent claimers skip each other's rows
+    instead of queueing on them, and taken with a conditional UPDATE stamped
+    with a fresh token, so an order is never handed to two claimers. Orders
+    whose lease expired are claimable again.
+    """
+    now = timezone.now()
+    claimed_until = now + timedelta(seconds=lease)
+    due = Q(status=QUEUES[queue]) & unclaimed(now)
+    if store_ids is not None:
+        due &= Q(store_id__in=store_ids)
+    token = uuid.uuid4()
+    with transaction.atomic():
+        candidates = list(
+            Order.objects.select_for_update(skip_locked=True).filter(due)
+            .order_by('created_at', 'id').values_list('pk', flat=True)[:limit]
+        )
+        if not candidates:
+            return [], claimed_until
+        Order.objects.filter(due, pk__in=candidates).update(
+            claimed_by_id=claimant_id, claim_token=token, claimed_until=claimed_until,
+        )
+    claimed = Order.objects.filter(pk__in=candidates, claim_token=token).order_by('created_at', 'id').values_list('pk', flat=True)
+    return list(claimed), claimed_until
+
+
+def release_orders(order_ids, claimant_id):
+    """
+    Give back orders leased to `claimant_id` before their lease runs out.
+    Returns the ids that were released.
+    """
+    with transaction.atomic():
+        mine = Order.objects.filter(pk__in=order_ids, claimed_by_id=claimant_id, claimed_until__gte=timezone.now())
+        released = list(mine.select_for_update().values_list('pk', flat=True))
+        Order.objects.filter(pk__in=released).update(claimed_by=None, claim_token=None, claimed_until=None)
+    return released
@@ -0,0 +1,63 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_tokens
+from .models import User, Store, Staff, Product, PromoCode
+from .services.catalog import bump_store_version, bump_catalog_version
+from .services.promos import promo_cache
+from .tenancy import invalidate_tenant_scopes
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=get_user_model())
+def forget_tokens_of_saved_user(sender, instance, created, **kwargs):
+    # A saved user may have been deactivated or changed; cached copies are stale
+    if not created:
+        invalidate_tokens(Token.objects.filter(user=instance).values_list('key', flat=True))
+
+
+@receiver(post_save, sender=Store)
+def bump_saved_store_version(sender, instance, **kwargs):
+    bump_store_version([instance.pk])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def bump_changed_product_catalog(sender, instance, **kwargs):
+    bump_catalog_version(store_ids=[instance.store_id])
+
+
+@receiver(post_save, sender=PromoCode)
+@receiver(post_delete, sender=PromoCode)
+def forget_changed_promo_code(sender, instance, **kwargs):
+    promo_cache.delete(instance.code)
+
+
+@receiver(post_save, sender=Staff)
+@receiver(post_delete, sender=Staff)
+@receiver(post_save, sender=Store)
+@receiver(post_delete, sender=Store)
+def forget_changed_tenant_scope(sender, instance, **kwargs):
+    invalidate_tenant_scopes(user_ids=[instance.user_id if sender is Staff else instance.owner_id])
+
+
+@receiver(pre_save, sender=Staff)
+@receiver(pre_save, sender=Store)
+def forget_previous_tenant_scope(sender, instance, **kwargs):
+    # A store changing owner, or a staff row moving to another user, also changes the previous user's scope
+    if not instance._state.adding:
+        field = 'user_id' if sender is Staff else 'owner_id'
+        invalidate_tenant_scopes(user_ids=sender.objects.filter(pk=instance.pk).values(field))
+
+
+@receiver(post_save, sender=User)
+def forget_tenant_scope_of_saved_user(sender, instance, created, **kwargs):
+    # Scopes are cached by email: a changed email must not inherit a cached scope
+    if not created:
+        invalidate_tenant_scopes(emails=[instance.email])
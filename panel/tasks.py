@@ -0,0 +1,58 @@
+"""
+Background tasks run by the `run_tasks` worker. The order services queue
+them in the same transaction as the order rows, see services/orders.py.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.mail import send_mail
+
+from .models import Order, OrderStatus, Subscription
+from .services import rollups
+from .services.events import prune_events
+from .services.queue import task, prune_tasks
+from .services.stock import release_stock
+
+
+@task(max_attempts=10)
+def apply_rollup_deltas(deltas):
+    rollups.apply_deltas(rollups.load_deltas(deltas))
+
+
+@task(max_attempts=10)
+def release_stock_lines(lines):
+    release_stock((uuid.UUID(product_id), quantity) for product_id, quantity in lines)
+
+
+@task(retry_delay=60)
+def send_order_email(order_id, status):
+    order = Order.objects.filter(pk=order_id).values('customer_name', 'customer_email', 'store__name').first()
+    if order is None:
+        return
+    label = OrderStatus(status).label
+    send_mail(
+        subject=f'{order["store__name"]}: your order is {label.lower()}',
+        message=f'Hello {order["customer_name"]},\n\nYour order {order_id} is now {label.lower()}.\n',
+        from_email=None,
+        recipient_list=[order['customer_email']],
+    )
+
+
+@task()
+def refresh_store_subscriptions(store_id):
+    Subscription.objects.filter(store_id=store_id).expire_due()
+
+
+@task(every=settings.SUBSCRIPTION_EXPIRY_INTERVAL)
+def expire_subscriptions():
+    Subscription.objects.expire_due()
+
+
+@task(every=3600)
+def prune_finished_tasks():
+    prune_tasks(settings.TASK_RETENTION_DAYS)
+
+
+@task(every=3600)
+def prune_order_events():
+    prune_events(settings.ORDER_EVENTS['RETENTION_DAYS'])
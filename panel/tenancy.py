@@ -0,0 +1,121 @@
+from collections import namedtuple
+from functools import reduce
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import CharField, Value
+
+from .caching import shared_cache
+from .models import User, Store, Staff, Product, Order, OrderItem, OrderLog
+
+
+# Stores an API account may see, its roles in each (a frozenset of StaffRole
+# values, plus OWNER for the stores it owns; Staff rows may give a user
+# several roles in one store) and its panel user id (None without a panel
+# account)
+TenantScope = namedtuple('TenantScope', 'store_ids roles user_id')
+
+OWNER = 'owner'
+
+# Seconds a scope may stay in a process-local cache, which Staff and Store
+# changes made by other workers cannot clear
+MAX_LOCAL_TTL = 5
+
+# Model -> lookup of the store it belongs to
+TENANT_LOOKUPS = {
+    Store: 'pk',
+    Product: 'store_id',
+    Order: 'store_id',
+    OrderItem: 'order__store_id',
+    OrderLog: 'order__store_id',
+    Staff: 'store_id',
+}
+
+
+def scope_cache():
+    """
+    Return the cache holding tenant scopes and their TTL: TENANT_SCOPE_CACHE
+    for TENANT_SCOPE_TTL seconds when it is shared by all workers, else the
+    default cache for at most MAX_LOCAL_TTL seconds.
+    """
+    ttl = getattr(settings, 'TENANT_SCOPE_TTL', 300)
+    shared = shared_cache(getattr(settings, 'TENANT_SCOPE_CACHE', None))
+    if shared is not None:
+        return shared, ttl
+    return cache, min(ttl, MAX_LOCAL_TTL)
+
+
+def scope_cache_key(email):
+    return f'panel:tenant-scope:{email}'
+
+
+def tenant_scope(user):
+    """
+    Return the TenantScope of API account `user`, or None when it may see
+    every store (admin accounts).
+
+    Accounts are matched to panel users by email. The scope is read with a
+    single query and cached (see scope_cache()); Staff and Store changes
+    drop the cached scopes they affect.
+    """
+    if user.is_staff or user.is_superuser:
+        return None
+    email = getattr(user, 'email', '')
+    if not email:
+        return TenantScope(frozenset(), {}, None)
+    key = scope_cache_key(email)
+    scopes, ttl = scope_cache()
+    scope = scopes.get(key)
+    if scope is None:
+        owned = Store.objects.filter(owner__email=email).annotate(
+            role=Value(OWNER, output_field=CharField()),
+        ).values_list('pk', 'owner_id', 'role')
+        # Annotations are selected after fields, keep `role` last in both halves
+        rows = Staff.objects.filter(user__email=email).values_list('store_id', 'user_id', 'role').union(owned, all=True)
+        roles, user_id = {}, None
+        for store_id, user_id, role in rows:
+            roles.setdefault(store_id, set()).add(role)
+        if user_id is None:
+            user_id = User.objects.filter(email=email).values_list('pk', flat=True).first()
+        roles = {store_id: frozenset(store_roles) for store_id, store_roles in roles.items()}
+        scope = TenantScope(frozenset(roles), roles, user_id)
+        scopes.set(key, scope, ttl)
+    return scope
+
+
+def scope_queryset(queryset, scope):
+    """
+    Restrict `queryset` to the stores of `scope` with a single `__in` filter.
+    Models without a store are returned unchanged.
+    """
+    if scope is None:
+        return queryset
+    return restrict_to_stores(queryset, scope.store_ids)
+
+
+def restrict_to_stores(queryset, store_ids):
+    lookup = TENANT_LOOKUPS.get(queryset.model)
+    if lookup is None:
+        return queryset
+    return queryset.filter(**{f'{lookup}__in': store_ids})
+
+
+def store_id_of(instance):
+    """
+    Return the id of the store a store-owned row belongs to, None for
+    models without a store.
+    """
+    lookup = TENANT_LOOKUPS.get(type(instance))
+    if lookup is None:
+        return None
+    return reduce(getattr, lookup.split('__'), instance)
+
+
+def invalidate_tenant_scopes(user_ids=(), emails=()):
+    """
+    Forget the cached scopes of the given panel users; `user_ids` may be a
+    subquery.
+    """
+    emails = [*emails, *User.objects.filter(pk__in=user_ids).values_list('email', flat=True)]
+    if emails:
+        scope_cache()[0].delete_many([scope_cache_key(email) for email in emails])
@@ -1,3 +1,1446 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from io import StringIO
+from unittest import mock, skipUnless
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection, OperationalError
+from django.db.models import Q
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .models import User, Store, Staff, StaffRole, Product, Order, OrderItem, OrderLog, OrderEvent, OrderStatus, PromoCode, Subscription, Task, DailyOrderRollup
+from .urls import router
+from .views import ProductViewSet, OrderViewSet, OrderItemViewSet, OrderLogViewSet
+from .serializers import LeanSerializer
+from .services.queue import TaskSpec, registry, enqueue, enqueue_many, claim_tasks, run_task, run_pending, schedule_periodic, prune_tasks
+from .services.stock import take_stock
+from .services.orders import queue_order_created
+from .services.events import feed_cache, feed_key, feed_keys, prune_events
+from .services.reports import day_start, store_stats
+from .metrics import RequestRecorder, registry as metrics_registry
+from .services.promos import promo_cache, validate_codes, redeem_code
+from .authentication import MAX_LOCAL_TTL, shared_cache_key, token_cache
+from .db_routers import check_pin_cache, is_pinned_to_primary, pin_to_primary, primary_pin_key
+from .tenancy import MAX_LOCAL_TTL, OWNER, scope_cache, scope_cache_key, tenant_scope
+
+
+@override_settings(REPLICA_DATABASES=[])
+class PanelAPITestCase(TestCase):
+    """
+    Shared fixtures: one store with a product and an authenticated API client.
+    Reads stay on the primary unless a test case opts into replicas.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(email='owner@example.com', name='Owner', password='secret')
+        cls.store = Store.objects.create(name='Main store', owner=cls.owner)
+        cls.product = Product.objects.create(store=cls.store, name='Mug', price=Decimal('9.50'), stock=100)
+        cls.api_user = get_user_model().objects.create_user(username='api', email='owner@example.com', password='secret')
+
+    def setUp(self):
+        # Version counters restart with every test transaction, cached responses must not
+        cache.clear()
+        # Query budgets are for the hot path, where the user's tenant scope is cached
+        tenant_scope(self.api_user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.api_user)
+
+    def run_tasks(self):
+        # Inline, the worker's threads would not see this test's transaction
+        while run_pending():
+            pass
+
+    def create_order(self, items=1, **kwargs):
+        kwargs.setdefault('store', self.store)
+        kwargs.setdefault('customer_name', 'Customer')
+        kwargs.setdefault('customer_email', 'customer@example.com')
+        order = Order.objects.create(**kwargs)
+        for _ in range(items):
+            OrderItem.objects.create(order=order, product=self.product, quantity=2, unit_price=self.product.price)
+        return order
+
+
+class CursorPaginationTests(PanelAPITestCase):
+
+    def test_list_is_paginated_with_cursor(self):
+        for _ in range(5):
+            self.create_order()
+
+        response = self.client.get('/api/orders/', {'page_size': 2})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIn('cursor=', response.data['next'])
+        self.assertNotIn('count', response.data)
+
+    def test_pages_cover_every_row_once_in_stable_order(self):
+        orders = [self.create_order() for _ in range(7)]
+        # Force identical timestamps so the id tie-breaker decides the order
+        Order.objects.update(created_at=timezone.now() - timedelta(days=1))
+
+        seen = []
+        url = '/api/orders/?page_size=3'
+        while url:
+            response = self.client.get(url)
+            seen.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(len(seen), len(orders))
+        self.assertEqual(sorted(seen, reverse=True), seen)
+
+    def test_order_logs_are_ordered_by_change_time(self):
+        order = self.create_order()
+        first = OrderLog.objects.create(order=order, status=OrderStatus.PENDING, changed_by=self.owner)
+        second = OrderLog.objects.create(order=order, status=OrderStatus.IN_CONFIRMATION, changed_by=self.owner)
+
+        response = self.client.get('/api/order-logs/')
+
+        self.assertEqual([row['id'] for row in response.data['results']], [str(second.id), str(first.id)])
+
+
+class QueryBudgetTests(PanelAPITestCase):
+    """
+    Pins the number of SQL queries for list and retrieve on every router
+    endpoint. The budget must hold no matter how many rows are returned.
+    """
+    # prefix: (list, retrieve); stores, products and orders add one validator query
+    QUERY_BUDGETS = {
+        'users': (3, 3),
+        'stores': (2, 2),
+        'staff': (1, 1),
+        'products': (2, 2),
+        'orders': (3, 3),
+        'order-items': (1, 1),
+        'order-logs': (1, 1),
+        'promo-codes': (1, 1),
+        'subscriptions': (1, 1),
+    }
+    # Endpoints only admin accounts may read
+    ADMIN_ONLY = {'promo-codes'}
+
+    def seed(self, count):
+        now = timezone.now()
+        for i in range(count):
+            user = User.objects.create_user(email=f'user{i}-{now.timestamp()}@example.com', name='User')
+            Staff.objects.create(store=self.store, user=user, role=StaffRole.DISPATCH)
+            order = self.create_order(items=3)
+            OrderLog.objects.create(order=order, status=OrderStatus.PENDING, changed_by=user)
+            promo = PromoCode.objects.create(code=f'CODE{i}-{now.timestamp()}', valid_from=now, valid_until=now + timedelta(days=1))
+            Subscription.objects.create(user=user, store=self.store, promo_code=promo, end_date=now + timedelta(days=30))
+
+    def detail_url(self, prefix):
+        queryset = dict((p, v) for p, v, _ in router.registry)[prefix].queryset
+        return f'/api/{prefix}/{queryset.first().pk}/'
+
+    def test_every_router_endpoint_has_a_budget(self):
+        self.assertEqual({prefix for prefix, _, _ in router.registry}, set(self.QUERY_BUDGETS))
+
+    def test_list_and_retrieve_stay_within_budget(self):
+        admin = get_user_model().objects.create_superuser(username='admin', email='admin@example.com', password='secret')
+        for count in (1, 5):
+            self.seed(count)
+            for prefix, (list_budget, retrieve_budget) in self.QUERY_BUDGETS.items():
+                cache.clear()
+                tenant_scope(self.api_user)
+                self.client.force_authenticate(admin if prefix in self.ADMIN_ONLY else self.api_user)
+                with self.subTest(prefix=prefix, rows=count):
+                    with self.assertNumQueries(list_budget):
+                        response = self.client.get(f'/api/{prefix}/')
+                    self.assertEqual(response.status_code, 200)
+                    detail_url = self.detail_url(prefix)
+                    with self.assertNumQueries(retrieve_budget):
+                        response = self.client.get(detail_url)
+                    self.assertEqual(response.status_code, 200)
+
+
+class FilteringTests(PanelAPITestCase):
+
+    def result_ids(self, response):
+        self.assertEqual(response.status_code, 200)
+        return {row['id'] for row in response.data['results']}
+
+    def test_orders_filter_by_store_status_and_window(self):
+        other_store = Store.objects.create(name='Other', owner=self.owner)
+        match = self.create_order(status=OrderStatus.IN_DISPATCH)
+        self.create_order(status=OrderStatus.PENDING)
+        self.create_order(store=other_store, status=OrderStatus.IN_DISPATCH)
+        old = self.create_order(status=OrderStatus.IN_DISPATCH)
+        Order.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=30))
+
+        response = self.client.get('/api/orders/', {
+            'store': self.store.id,
+            'status': [OrderStatus.IN_DISPATCH, OrderStatus.IN_DELIVERY],
+            'created_at_after': (timezone.now() - timedelta(days=1)).isoformat(),
+        })
+
+        self.assertEqual(self.result_ids(response), {str(match.id)})
+
+    def test_orders_filter_by_customer_email(self):
+        match = self.create_order(customer_email='jane@example.com')
+        self.create_order()
+
+        response = self.client.get('/api/orders/', {'customer_email': 'jane@example.com'})
+
+        self.assertEqual(self.result_ids(response), {str(match.id)})
+
+    def test_products_filter_by_price_and_stock(self):
+        cheap = Product.objects.create(store=self.store, name='Pen', price=Decimal('1.00'), stock=5)
+        Product.objects.create(store=self.store, name='Sold out pen', price=Decimal('1.50'), stock=0)
+
+        response = self.client.get('/api/products/', {'price_max': '5', 'in_stock': 'true'})
+
+        self.assertEqual(self.result_ids(response), {str(cheap.id)})
+
+    def test_order_logs_filter_by_order(self):
+        order = self.create_order()
+        log = OrderLog.objects.create(order=order, status=OrderStatus.PENDING, changed_by=self.owner)
+        OrderLog.objects.create(order=self.create_order(), status=OrderStatus.PENDING, changed_by=self.owner)
+
+        response = self.client.get('/api/order-logs/', {'order': order.id, 'changed_by': self.owner.id})
+
+        self.assertEqual(self.result_ids(response), {str(log.id)})
+
+    def test_ordering_is_whitelisted(self):
+        Product.objects.create(store=self.store, name='Cheap', price=Decimal('1.00'))
+        Product.objects.create(store=self.store, name='Pricey', price=Decimal('99.00'))
+
+        by_price = self.client.get('/api/products/', {'ordering': 'price'}).data['results']
+        by_name = self.client.get('/api/products/', {'ordering': 'name'}).data['results']
+
+        self.assertEqual([row['name'] for row in by_price], ['Cheap', 'Mug', 'Pricey'])
+        # `name` is not whitelisted, so the default newest-first ordering applies
+        self.assertEqual([row['name'] for row in by_name], ['Pricey', 'Cheap', 'Mug'])
+
+
+class OrderTransitionTests(PanelAPITestCase):
+
+    def test_transition_updates_status_and_writes_log(self):
+        order = self.create_order()
+
+        response = self.client.post(f'/api/orders/{order.id}/transition/', {
+            'status': OrderStatus.IN_CONFIRMATION,
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], OrderStatus.IN_CONFIRMATION)
+        log = OrderLog.objects.get(order=order)
+        self.assertEqual((log.status, log.changed_by_id), (OrderStatus.IN_CONFIRMATION, self.owner.id))
+
+    def test_status_and_log_author_cannot_be_chosen_by_the_client(self):
+        order = self.create_order()
+        impostor = User.objects.create_user(email='impostor@example.com', name='Impostor')
+
+        patched = self.client.patch(f'/api/orders/{order.id}/', {'status': OrderStatus.DELIVERED})
+        self.client.post(f'/api/orders/{order.id}/transition/', {
+            'status': OrderStatus.IN_CONFIRMATION, 'changed_by': impostor.id,
+        })
+        posted = self.client.post('/api/order-logs/', {'order': order.id, 'status': OrderStatus.DELIVERED})
+        log = OrderLog.objects.get()
+        patched_log = self.client.patch(f'/api/order-logs/{log.id}/', {'changed_by': impostor.id})
+        deleted_log = self.client.delete(f'/api/order-logs/{log.id}/')
+
+        self.assertEqual((posted.status_code, patched_log.status_code, deleted_log.status_code), (405, 405, 405))
+
+        self.assertEqual(patched.data['status'], OrderStatus.PENDING)
+        self.assertEqual(set(OrderLog.objects.values_list('changed_by', flat=True)), {self.owner.id})
+        # Only the real transition reached the order feed
+        self.assertEqual(list(OrderEvent.objects.filter(kind=OrderEvent.Kind.STATUS).values_list('status', flat=True)),
+                         [OrderStatus.IN_CONFIRMATION])
+
+        stranger = get_user_model().objects.create_user(username='stranger', email='stranger@example.com')
+        self.client.force_authenticate(stranger)
+        response = self.client.post('/api/orders/transition/', {'orders': [order.id], 'status': OrderStatus.CANCELED},
+                                    format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_transition_rejects_skipping_states(self):
+        order = self.create_order()
+
+        response = self.client.post(f'/api/orders/{order.id}/transition/', {
+            'status': OrderStatus.DELIVERED,
+        })
+
+        self.assertEqual(response.status_code, 400)
+        order.refresh_from_db()
+        self.assertEqual(order.status, OrderStatus.PENDING)
+        self.assertFalse(OrderLog.objects.exists())
+
+    def test_transition_with_stale_updated_at_conflicts(self):
+        order = self.create_order()
+        stale = order.updated_at - timedelta(seconds=5)
+
+        response = self.client.post(f'/api/orders/{order.id}/transition/', {
+            'status': OrderStatus.IN_CONFIRMATION, 'updated_at': stale.isoformat(),
+        })
+
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(OrderLog.objects.exists())
+
+    def test_bulk_transition_reports_per_order_errors(self):
+        movable = [self.create_order(status=OrderStatus.IN_CONFIRMATION) for _ in range(3)]
+        stuck = self.create_order(status=OrderStatus.DELIVERED)
+
+        # Lookup, UPDATE and log insert, item revenue, then the rollup task, the emails
+        # and the feed events; the author comes from the cached tenant scope
+        with self.assertNumQueries(9):
+            response = self.client.post('/api/orders/transition/', {
+                'orders': [str(order.id) for order in movable + [stuck]],
+                'status': OrderStatus.IN_DISPATCH,
+            }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['updated']), {str(order.id) for order in movable})
+        self.assertEqual(list(response.data['errors']), [str(stuck.id)])
+        self.assertEqual(Order.objects.filter(status=OrderStatus.IN_DISPATCH).count(), 3)
+        self.assertEqual(OrderLog.objects.filter(status=OrderStatus.IN_DISPATCH).count(), 3)
+
+
+class BulkOrderIngestionTests(PanelAPITestCase):
+
+    def payload(self, *orders):
+        return {'orders': [
+            {
+                'store': str(self.store.id),
+                'customer_name': 'Customer',
+                'customer_email': 'customer@example.com',
+                'items': items,
+            }
+            for items in orders
+        ]}
+
+    def test_bulk_create_computes_totals_and_takes_stock(self):
+        response = self.client.post('/api/orders/bulk/', self.payload(
+            [{'product': str(self.product.id), 'quantity': 3}],
+            [{'product': str(self.product.id), 'quantity': 1, 'unit_price': '9.50'}],
+        ), format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['created']), 2)
+        self.assertEqual(response.data['errors'], {})
+        totals = sorted(OrderItem.objects.values_list('total_price', flat=True))
+        self.assertEqual(totals, [Decimal('9.50'), Decimal('28.50')])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 96)
+
+    def test_rejected_orders_leave_no_rows_or_stock_changes(self):
+        other_product = Product.objects.create(store=self.store, name='Plate', price=Decimal('4.00'), stock=1)
+
+        response = self.client.post('/api/orders/bulk/', self.payload(
+            [{'product': str(self.product.id), 'quantity': 2}],
+            [{'product': str(self.product.id), 'quantity': 1}, {'product': str(other_product.id), 'quantity': 5}],
+            [{'product': str(self.product.id), 'quantity': 1, 'unit_price': '1.00'}],
+        ), format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['created']), 1)
+        self.assertEqual(set(response.data['errors']), {1, 2})
+        self.assertEqual(Order.objects.count(), 1)
+        self.product.refresh_from_db()
+        other_product.refresh_from_db()
+        self.assertEqual((self.product.stock, other_product.stock), (98, 1))
+
+    def test_query_count_does_not_grow_with_items(self):
+        # 10 fixed queries (follow-up tasks are queued with three INSERTs, feed events with
+        # one), plus per order a guarded stock UPDATE per product in a savepoint
+        with self.captureOnCommitCallbacks() as callbacks, self.assertNumQueries(19):
+            self.client.post('/api/orders/bulk/', self.payload(
+                *[[{'product': str(self.product.id), 'quantity': 1}] * 3] * 3
+            ), format='json')
+
+        # The catalog version is bumped once, after the commit
+        with self.assertNumQueries(2):  # order and catalog versions
+            for callback in callbacks:
+                callback()
+        self.store.refresh_from_db()
+        self.assertEqual(self.store.catalog_version, 1)
+
+
+class StockTests(PanelAPITestCase):
+
+    def test_take_stock_reports_each_line(self):
+        plate = Product.objects.create(store=self.store, name='Plate', price=Decimal('4.00'), stock=1)
+
+        self.assertEqual(take_stock([(self.product.id, 60), (plate.id, 2), (self.product.id, 50)]), [True, False, False])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 40)
+
+    def test_adding_an_item_reserves_stock(self):
+        order = self.create_order(items=0)
+        payload = {'order': order.id, 'product': self.product.id, 'unit_price': '9.50'}
+
+        created = self.client.post('/api/order-items/', {**payload, 'quantity': 60})
+        refused = self.client.post('/api/order-items/', {**payload, 'quantity': 60})
+
+        self.assertEqual((created.status_code, refused.status_code), (201, 400))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 40)
+
+    def test_canceling_an_order_releases_its_stock(self):
+        order = self.create_order(items=0)
+        for _ in range(2):
+            self.client.post('/api/order-items/', {
+                'order': order.id, 'product': self.product.id, 'quantity': 2, 'unit_price': '9.50',
+            })
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 96)
+
+        self.client.post(f'/api/orders/{order.id}/transition/', {
+            'status': OrderStatus.CANCELED,
+        })
+        self.run_tasks()
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 100)
+
+    def test_item_changes_move_the_stock_they_hold(self):
+        order = self.create_order(items=0)
+        item = self.client.post('/api/order-items/', {
+            'order': order.id, 'product': self.product.id, 'quantity': 5, 'unit_price': '9.50',
+        }).data
+        url = f'/api/order-items/{item["id"]}/'
+
+        self.client.patch(url, {'quantity': 8})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 92)
+        self.assertEqual(self.client.patch(url, {'quantity': 200}).status_code, 400)
+        self.assertEqual(self.client.patch(url, {'quantity': -3}).status_code, 400)
+        self.client.patch(url, {'quantity': 2})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 98)
+
+        self.client.delete(url)
+        self.client.patch(f'/api/products/{self.product.id}/', {'stock': 5000})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 100)
+        self.assertEqual(take_stock([(self.product.id, -10)]), [False])
+
+    def test_adjust_stock_endpoint(self):
+        taken = self.client.post(f'/api/products/{self.product.id}/stock/', {'delta': -30})
+        refused = self.client.post(f'/api/products/{self.product.id}/stock/', {'delta': -80})
+        restocked = self.client.post(f'/api/products/{self.product.id}/stock/', {'delta': 5})
+
+        self.assertEqual((taken.data['stock'], refused.status_code, restocked.data['stock']), (70, 409, 75))
+
+
+class TaskQueueTests(PanelAPITestCase):
+
+    def test_transition_work_runs_in_the_worker_once(self):
+        order = self.create_order(items=1)
+        self.client.post(f'/api/orders/{order.id}/transition/', {
+            'status': OrderStatus.CANCELED,
+        })
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, len(mail.outbox)), (100, 0))
+
+        self.run_tasks()
+        log = OrderLog.objects.get(order=order)
+        enqueue('release_stock_lines', {'lines': [[str(self.product.id), 2]]}, key=f'stock:transition:{log.pk}')
+        self.run_tasks()
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 102)
+        self.assertEqual([message.to for message in mail.outbox], [['customer@example.com']])
+        self.assertFalse(Task.objects.exclude(status=Task.Status.DONE).exists())
+
+    def test_failing_task_is_retried_with_backoff_then_failed(self):
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            Store.objects.update(name='Rolled back')
+            raise ValueError('boom')
+
+        with mock.patch.dict(registry, flaky=TaskSpec(flaky, max_attempts=2, retry_delay=30)):
+            enqueue('flaky')
+            run_pending()
+            task = Task.objects.get(name='flaky')
+            self.assertEqual((task.status, task.attempts), (Task.Status.QUEUED, 1))
+            self.assertGreaterEqual(task.run_after, timezone.now() + timedelta(seconds=29))
+            self.assertEqual(run_pending(), 0)
+
+            Task.objects.update(run_after=timezone.now())
+            run_pending()
+
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts, len(calls)), (Task.Status.FAILED, 2, 2))
+        self.assertIn('ValueError: boom', task.last_error)
+        self.assertEqual(Store.objects.get().name, 'Main store')
+
+    def test_failed_periodic_task_still_schedules_its_next_run(self):
+        def broken():
+            raise ValueError('boom')
+
+        with mock.patch.dict(registry, broken=TaskSpec(broken, max_attempts=1, retry_delay=30, every=60)):
+            enqueue('broken', key='broken:slot')
+            run_pending()
+
+        runs = Task.objects.filter(name='broken')
+        self.assertEqual(list(runs.values_list('status', flat=True).order_by('created_at')), ['failed', 'queued'])
+        self.assertGreater(runs.get(status=Task.Status.QUEUED).run_after, timezone.now())
+
+    def test_abandoned_task_is_claimed_again_after_its_lease(self):
+        enqueue('refresh_store_subscriptions', {'store_id': str(self.store.id)})
+        claimed = claim_tasks(10, lease=60)
+        self.assertEqual((len(claimed), claim_tasks(10, lease=60)), (1, []))
+
+        Task.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        reclaimed = claim_tasks(10, lease=60)
+        run_task(claimed[0])  # the first worker finishes late: its lease is gone
+        self.assertEqual(Task.objects.get().status, Task.Status.RUNNING)
+
+        run_task(reclaimed[0])
+        task = Task.objects.get()
+        self.assertEqual((task.status, task.attempts), (Task.Status.DONE, 2))
+
+    def test_finished_tasks_are_pruned_after_retention(self):
+        enqueue_many('refresh_store_subscriptions', [({'store_id': str(self.store.id)}, f'job:{i}') for i in range(4)])
+        old = timezone.now() - timedelta(days=8)
+        Task.objects.filter(idempotency_key__in=['job:0', 'job:1']).update(
+            status=Task.Status.DONE, run_after=old, updated_at=old,
+        )
+        Task.objects.filter(idempotency_key='job:2').update(run_after=old, updated_at=old)
+
+        self.assertEqual(prune_tasks(7), 2)
+        self.assertEqual(set(Task.objects.values_list('idempotency_key', flat=True)), {'job:2', 'job:3'})
+
+
+class SubscriptionExpiryTests(PanelAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        # bulk_create skips save(), like rows whose end date passed since they were written
+        self.lapsed, self.current, self.canceled = Subscription.objects.bulk_create([
+            Subscription(user=self.owner, store=self.store, end_date=now - timedelta(days=1)),
+            Subscription(user=self.owner, store=self.store, end_date=now + timedelta(days=1)),
+            Subscription(user=self.owner, store=self.store, end_date=now - timedelta(days=1),
+                         status=Subscription.Status.CANCELED),
+        ])
+
+    def test_state_is_computed_in_sql_before_the_sweep(self):
+        self.assertEqual(list(Subscription.objects.active()), [self.current])
+        self.assertEqual(list(Subscription.objects.expired()), [self.lapsed])
+
+        response = self.client.get('/api/subscriptions/', {'state': 'expired'})
+        self.assertEqual([row['id'] for row in response.data['results']], [str(self.lapsed.id)])
+
+    def test_sweep_expires_lapsed_rows_in_one_query(self):
+        out = StringIO()
+        with self.assertNumQueries(1):
+            call_command('expire_subscriptions', stdout=out)
+        self.assertIn('Expired 1 subscriptions.', out.getvalue())
+        self.assertEqual(
+            dict(Subscription.objects.values_list('id', 'status')),
+            {self.lapsed.id: 'expired', self.current.id: 'active', self.canceled.id: 'canceled'},
+        )
+
+    def test_periodic_sweep_schedules_its_next_run_once(self):
+        schedule_periodic()
+        schedule_periodic()
+        # Fast-forward to the scheduled slot
+        Task.objects.update(run_after=timezone.now())
+        later = time.time() + settings.SUBSCRIPTION_EXPIRY_INTERVAL
+        with mock.patch('panel.services.queue.time.time', return_value=later):
+            self.run_tasks()
+
+        self.lapsed.refresh_from_db()
+        self.assertEqual(self.lapsed.status, Subscription.Status.EXPIRED)
+        runs = Task.objects.filter(name='expire_subscriptions')
+        self.assertEqual(list(runs.values_list('status', flat=True).order_by('created_at')), ['done', 'queued'])
+        self.assertGreater(runs.get(status=Task.Status.QUEUED).run_after, timezone.now())
+
+
+class PromoCodeTests(PanelAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        promo_cache.clear()
+        now = timezone.now()
+        self.promo = PromoCode.objects.create(code='SALE', discount_percentage=10, max_usage=2,
+                                              valid_from=now - timedelta(days=1), valid_until=now + timedelta(days=1))
+        PromoCode.objects.create(code='OLD', valid_from=now - timedelta(days=2), valid_until=now - timedelta(days=1))
+
+    def test_redeem_stops_at_max_usage(self):
+        responses = [self.client.post('/api/promo-codes/redeem/', {'code': 'SALE'}) for _ in range(3)]
+        self.assertEqual([response.status_code for response in responses], [200, 200, 409])
+        self.assertEqual(responses[2].data['reason'], 'exhausted')
+        self.promo.refresh_from_db()
+        self.assertEqual(self.promo.current_usage, 2)
+
+        response = self.client.post('/api/promo-codes/redeem/', {'code': 'OLD'})
+        self.assertEqual((response.status_code, response.data['reason']), (409, 'expired'))
+
+    def test_many_codes_are_validated_with_one_query_then_from_cache(self):
+        codes = ['SALE', 'OLD', 'NOPE', 'SALE']
+        with self.assertNumQueries(1):
+            results = validate_codes(codes)
+        with self.assertNumQueries(0):
+            validate_codes(codes)
+        self.assertEqual({code: reason for code, (_, reason) in results.items()},
+                         {'SALE': None, 'OLD': 'expired', 'NOPE': 'unknown'})
+
+        # Editing the code drops its cached copy
+        PromoCode.objects.filter(pk=self.promo.pk).update(current_usage=2)
+        self.promo.refresh_from_db()
+        self.promo.save()
+        response = self.client.post('/api/promo-codes/validate/', {'codes': ['SALE']}, format='json')
+        self.assertEqual(response.data['results'], [
+            {'code': 'SALE', 'valid': False, 'reason': 'exhausted', 'discount_percentage': '10.00'},
+        ])
+
+    def test_subscription_uses_its_promo_code(self):
+        self.promo.current_usage = 1
+        self.promo.save()
+        data = {'user': self.owner.id, 'promo_code': self.promo.id, 'end_date': timezone.now() + timedelta(days=30)}
+        self.assertEqual(self.client.post('/api/subscriptions/', data).status_code, 201)
+        response = self.client.post('/api/subscriptions/', data)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('exhausted', response.data['promo_code'][0])
+        self.assertEqual(Subscription.objects.count(), 1)
+
+
+@override_settings(PERFORMANCE_METRICS={'SAMPLE_RATE': 1.0, 'SERVER_TIMING': True})
+class PerformanceMetricsTests(PanelAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics_registry.clear()
+
+    def test_sampled_request_is_recorded_per_route(self):
+        self.create_order(items=2)
+        response = self.client.get('/api/orders/')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", serialize;dur=[\d.]+, total;dur=[\d.]+$')
+
+        admin = get_user_model().objects.create_user(username='admin', password='secret', is_staff=True)
+        self.client.force_authenticate(admin)
+        text = self.client.get('/api/metrics/').content.decode()
+        self.assertIn('panel_request_duration_seconds_bucket{route="order-list",method="GET",le="+Inf"} 1', text)
+        self.assertIn('panel_request_queries_count{route="order-list",method="GET"} 1', text)
+        self.assertIn('panel_request_duplicate_queries_total{route="order-list",method="GET"} 0', text)
+
+    def test_repeated_queries_are_reported(self):
+        recorder = RequestRecorder()
+        with connection.execute_wrapper(recorder):
+            for _ in range(3):
+                list(Store.objects.filter(pk=self.store.pk))
+            list(Store.objects.filter(pk=uuid.uuid4()))
+        self.assertEqual((recorder.queries, recorder.duplicates), (4, 2))
+
+    @override_settings(PERFORMANCE_METRICS={'SAMPLE_RATE': 1, 'SERVER_TIMING': True})
+    async def test_async_views_report_queries_run_in_worker_threads(self):
+        token = await Token.objects.acreate(user=self.api_user)
+        response = await AsyncClient().get('/api/async/orders/', headers={'authorization': f'Token {token.key}'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="[1-9]\d* queries"')
+        self.assertIn('panel_request_queries_count{route="async-order-list",method="GET"} 1', metrics_registry.render())
+
+    @override_settings(PERFORMANCE_METRICS={'SAMPLE_RATE': 0})
+    def test_unsampled_requests_are_not_measured(self):
+        response = self.client.get('/api/orders/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertNotIn('order-list', metrics_registry.render())
+
+
+class BenchmarkSuiteTests(PanelAPITestCase):
+
+    def test_seeded_scenarios_run_and_save_results(self):
+        call_command('seed_benchmark', stores=2, products=5, orders=40, subscriptions=8, batch_size=15, stdout=StringIO())
+        self.assertEqual(Order.objects.count(), 40)
+        self.assertFalse(Order.objects.filter(Q(items=None) | Q(logs=None)).exists())
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command('run_benchmarks', requests=3, warmup=0, output=output, stdout=StringIO())
+            with open(output) as file:
+                results = json.load(file)
+
+        self.assertEqual(results['meta']['rows']['orders'], 43)
+        for name, result in results['scenarios'].items():
+            with self.subTest(scenario=name):
+                self.assertEqual((result['requests'], result['errors']), (3, 0))
+                self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+                self.assertGreater(result['queries_mean'], 0)
+
+
+class TenantScopeTests(PanelAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.rival = User.objects.create_user(email='rival@example.com', name='Rival')
+        self.other_store = Store.objects.create(name='Rival store', owner=self.rival)
+        self.other_product = Product.objects.create(store=self.other_store, name='Rival mug', price=Decimal('8.00'), stock=5)
+        self.other_order = self.create_order(store=self.other_store)
+        self.own_order = self.create_order()
+
+    def test_rows_of_other_stores_are_invisible(self):
+        response = self.client.get('/api/orders/')
+        self.assertEqual([row['id'] for row in response.data['results']], [str(self.own_order.id)])
+        self.assertEqual(self.client.get(f'/api/products/{self.other_product.id}/').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/stores/{self.other_store.id}/stats/').status_code, 404)
+        response = self.client.get('/api/order-items/')
+        self.assertEqual({row['order'] for row in response.data['results']}, {self.own_order.id})
+
+    def test_writes_cannot_target_other_stores(self):
+        response = self.client.post('/api/products/', {'store': self.other_store.id, 'name': 'Sneaky', 'price': '1.00'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('store', response.data)
+
+        response = self.client.post('/api/orders/transition/', {
+            'orders': [self.other_order.id], 'status': OrderStatus.CANCELED,
+        }, format='json')
+        self.assertEqual(response.data['errors'], {str(self.other_order.id): 'Order not found.'})
+
+    def test_scope_is_cached_and_follows_staff_changes(self):
+        staff = Staff.objects.create(store=self.other_store, user=self.owner, role=StaffRole.DISPATCH)
+        # The staff row dropped the cached scope: one query rebuilds it, then it is reused
+        with self.assertNumQueries(1):
+            scope = tenant_scope(self.api_user)
+        with self.assertNumQueries(0):
+            tenant_scope(self.api_user)
+        self.assertEqual(scope.roles, {self.store.id: {OWNER}, self.other_store.id: {StaffRole.DISPATCH}})
+        self.assertEqual(self.client.get(f'/api/orders/{self.other_order.id}/').status_code, 200)
+
+        staff.delete()
+        self.assertEqual(self.client.get(f'/api/orders/{self.other_order.id}/').status_code, 404)
+
+    def test_scopes_are_shared_across_workers_or_kept_briefly(self):
+        self.assertEqual(scope_cache(), (cache, MAX_LOCAL_TTL))
+        with tempfile.TemporaryDirectory() as location, override_settings(
+            CACHES={**settings.CACHES, 'scopes': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}},
+            TENANT_SCOPE_CACHE='scopes',
+        ):
+            staff = Staff.objects.create(store=self.other_store, user=self.owner, role=StaffRole.DISPATCH)
+            self.assertIn(self.other_store.id, tenant_scope(self.api_user).store_ids)
+            self.assertIsNotNone(caches['scopes'].get(scope_cache_key(self.owner.email)))
+            # Firing drops the entry every worker reads
+            staff.delete()
+            self.assertIsNone(caches['scopes'].get(scope_cache_key(self.owner.email)))
+
+    def test_cached_responses_are_not_shared_across_tenants(self):
+        self.assertEqual(len(self.client.get('/api/products/').data['results']), 1)
+        rival = get_user_model().objects.create_user(username='rival', email='rival@example.com')
+        self.client.force_authenticate(rival)
+        response = self.client.get('/api/products/')
+        self.assertEqual([row['id'] for row in response.data['results']], [str(self.other_product.id)])
+
+        admin = get_user_model().objects.create_user(username='root', is_staff=True)
+        self.client.force_authenticate(admin)
+        self.assertEqual(len(self.client.get('/api/products/').data['results']), 2)
+
+    def test_every_role_of_a_user_in_a_store_counts(self):
+        assistant = User.objects.create_user(email='multi@example.com', name='Multi')
+        Staff.objects.create(store=self.store, user=assistant, role=StaffRole.MANAGER)
+        Staff.objects.create(store=self.store, user=assistant, role=StaffRole.CONFIRMATION)
+        Staff.objects.create(store=self.other_store, user=assistant, role=StaffRole.CONFIRMATION)
+        Staff.objects.create(store=self.other_store, user=assistant, role=StaffRole.DISPATCH)
+        account = get_user_model().objects.create_user(username='multi', email='multi@example.com')
+
+        self.assertEqual(tenant_scope(account).roles[self.store.id], {StaffRole.MANAGER, StaffRole.CONFIRMATION})
+        self.client.force_authenticate(account)
+        self.assertEqual(self.client.patch(f'/api/stores/{self.store.id}/', {'name': 'Managed'}).status_code, 200)
+        Order.objects.filter(pk=self.other_order.pk).update(status=OrderStatus.IN_DISPATCH)
+        response = self.client.post('/api/orders/claim/', {'queue': StaffRole.DISPATCH}, format='json')
+        self.assertEqual([row['id'] for row in response.data['results']], [str(self.other_order.id)])
+
+    def test_staff_and_store_writes_need_a_manager(self):
+        assistant = User.objects.create_user(email='dispatch@example.com', name='Dispatch')
+        hired = Staff.objects.create(store=self.store, user=assistant, role=StaffRole.DISPATCH)
+        self.client.force_authenticate(get_user_model().objects.create_user(username='dispatch', email='dispatch@example.com'))
+
+        response = self.client.post('/api/staff/', {'store': self.store.id, 'user': assistant.id, 'role': StaffRole.MANAGER})
+        self.assertEqual((response.status_code, list(response.data)), (400, ['store']))
+        self.assertEqual(self.client.patch(f'/api/staff/{hired.id}/', {'role': StaffRole.MANAGER}).status_code, 403)
+        self.assertEqual(self.client.patch(f'/api/stores/{self.store.id}/', {'name': 'Mine'}).status_code, 403)
+        self.assertEqual(self.client.delete(f'/api/stores/{self.store.id}/').status_code, 403)
+        self.assertEqual(self.client.get(f'/api/stores/{self.store.id}/').status_code, 200)
+        response = self.client.post('/api/stores/', {'name': 'Stolen', 'owner': self.owner.id})
+        self.assertEqual(response.status_code, 403)
+
+        # Owners and managers may
+        self.client.force_authenticate(self.api_user)
+        self.assertEqual(self.client.patch(f'/api/staff/{hired.id}/', {'role': StaffRole.MANAGER}).status_code, 200)
+        self.client.force_authenticate(get_user_model().objects.get(username='dispatch'))
+        self.assertEqual(self.client.patch(f'/api/stores/{self.store.id}/', {'name': 'Managed'}).status_code, 200)
+        response = self.client.patch(f'/api/stores/{self.store.id}/', {'owner': assistant.id})
+        self.assertEqual(response.status_code, 403)
+
+    def test_users_promo_codes_and_subscriptions_are_restricted(self):
+        rival_subscription = Subscription.objects.create(user=self.rival, store=self.other_store, end_date=timezone.now())
+        own_subscription = Subscription.objects.create(user=self.owner, end_date=timezone.now())
+
+        response = self.client.get('/api/users/')
+        self.assertEqual([row['id'] for row in response.data['results']], [str(self.owner.id)])
+        self.assertEqual(self.client.patch(f'/api/users/{self.owner.id}/', {'is_staff': True}).status_code, 403)
+        self.assertEqual(self.client.get('/api/promo-codes/').status_code, 403)
+        self.assertEqual(self.client.post('/api/promo-codes/validate/', {'codes': ['X']}, format='json').status_code, 200)
+
+        response = self.client.get('/api/subscriptions/')
+        self.assertEqual([row['id'] for row in response.data['results']], [str(own_subscription.id)])
+        self.assertEqual(self.client.delete(f'/api/subscriptions/{rival_subscription.id}/').status_code, 404)
+        response = self.client.post('/api/subscriptions/', {'user': self.rival.id, 'end_date': timezone.now()})
+        self.assertEqual(response.status_code, 403)
+
+
+class WorkQueueTests(PanelAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.assistant = User.objects.create_user(email='dispatch@example.com', name='Dispatch')
+        Staff.objects.create(store=self.store, user=self.assistant, role=StaffRole.DISPATCH)
+        self.dispatcher = get_user_model().objects.create_user(username='dispatch', email='dispatch@example.com')
+        self.orders = [self.create_order(status=OrderStatus.IN_DISPATCH) for _ in range(3)]
+
+    def claim(self, client=None, **data):
+        return (client or self.client).post('/api/orders/claim/', {'queue': StaffRole.DISPATCH, **data}, format='json')
+
+    def test_concurrent_claims_get_disjoint_batches(self):
+        other = APIClient()
+        other.force_authenticate(self.dispatcher)
+
+        first = self.claim(limit=2)
+        second = self.claim(other, limit=2)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual([row['id'] for row in first.data['results']], [str(order.id) for order in self.orders[:2]])
+        self.assertEqual([row['id'] for row in second.data['results']], [str(self.orders[2].id)])
+        self.assertEqual(self.claim().data['results'], [])
+        self.assertEqual(Order.objects.filter(claimed_by=self.assistant).count(), 1)
+
+    def test_assistants_only_work_their_own_queue(self):
+        self.client.force_authenticate(self.dispatcher)
+        response = self.claim(queue=StaffRole.CONFIRMATION)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(len(self.claim().data['results']), 3)
+
+    def test_expired_lease_returns_orders_to_the_queue(self):
+        self.claim(limit=1, lease=60)
+        Order.objects.filter(pk=self.orders[0].pk).update(claimed_until=timezone.now() - timedelta(seconds=1))
+        response = self.claim(limit=1)
+        self.assertEqual([row['id'] for row in response.data['results']], [str(self.orders[0].id)])
+
+    def test_transition_and_release_end_the_lease(self):
+        self.claim()
+        response = self.client.post(f'/api/orders/{self.orders[0].id}/transition/', {
+            'status': OrderStatus.IN_DELIVERY,
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.post('/api/orders/release/', {'orders': [self.orders[1].id, uuid.uuid4()]}, format='json')
+        self.assertEqual(response.data['released'], [str(self.orders[1].id)])
+        self.assertEqual(
+            list(Order.objects.filter(claimed_by__isnull=False).values_list('pk', flat=True)), [self.orders[2].pk],
+        )
+
+
+class ConcurrencyTestCase(TransactionTestCase):
+    """
+    Runs one operation from many threads at once, each with its own
+    connection. Runs against whatever database is configured: SQLite
+    serializes the writers, backends with row locking (e.g. PostgreSQL)
+    contend on the row.
+    """
+    THREADS = 8
+    ATTEMPTS_PER_THREAD = 25
+    # A database still busy after this many retries of one attempt fails the test
+    MAX_RETRIES = 200
+    JOIN_TIMEOUT = 60
+
+    def hammer(self, attempt):
+        """
+        Call `attempt()` ATTEMPTS_PER_THREAD times from each of THREADS
+        threads started together, and return how many calls returned true.
+        """
+        successes, errors = [], []
+        start = threading.Barrier(self.THREADS)
+
+        def worker():
+            try:
+                start.wait()
+                for _ in range(self.ATTEMPTS_PER_THREAD):
+                    for retry in range(self.MAX_RETRIES):
+                        try:
+                            succeeded = attempt()
+                            break
+                        except OperationalError:
+                            # SQLite reports a busy database instead of waiting on it
+                            if retry == self.MAX_RETRIES - 1:
+                                raise
+                    if succeeded:
+                        successes.append(1)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(self.JOIN_TIMEOUT)
+        self.assertFalse(any(thread.is_alive() for thread in threads), 'worker threads did not finish')
+        self.assertEqual(errors, [])
+        return len(successes)
+
+
+class StockConcurrencyTests(ConcurrencyTestCase):
+    STOCK = 50
+
+    def test_stock_is_never_oversold(self):
+        owner = User.objects.create_user(email='stress@example.com', name='Stress')
+        store = Store.objects.create(name='Stress store', owner=owner)
+        product = Product.objects.create(store=store, name='Hot item', price=Decimal('1.00'), stock=self.STOCK)
+
+        taken = self.hammer(lambda: take_stock([(product.id, 1)])[0])
+
+        product.refresh_from_db()
+        self.assertEqual(taken, self.STOCK)
+        self.assertEqual(product.stock, 0)
+
+
+class PromoRedemptionConcurrencyTests(ConcurrencyTestCase):
+    MAX_USAGE = 50
+
+    def test_usage_never_exceeds_max_usage(self):
+        now = timezone.now()
+        promo = PromoCode.objects.create(code='FLASH', max_usage=self.MAX_USAGE,
+                                         valid_from=now - timedelta(hours=1), valid_until=now + timedelta(hours=1))
+
+        granted = self.hammer(lambda: redeem_code('FLASH'))
+
+        promo.refresh_from_db()
+        self.assertEqual(granted, self.MAX_USAGE)
+        self.assertEqual(promo.current_usage, self.MAX_USAGE)
+
+
+class CachedTokenAuthenticationTests(PanelAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        token_cache.clear()
+        self.token = Token.objects.create(user=self.api_user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_repeated_requests_skip_the_token_lookup(self):
+        with self.assertNumQueries(2):  # token + user join, then the page of staff
+            self.assertEqual(self.client.get('/api/staff/').status_code, 200)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/staff/').status_code, 200)
+        self.assertEqual(token_cache.stats()['hits'], 1)
+
+    def test_deleted_token_is_rejected(self):
+        self.client.get('/api/staff/')
+        self.token.delete()
+
+        self.assertEqual(self.client.get('/api/staff/').status_code, 401)
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get('/api/staff/')
+        self.api_user.is_active = False
+        self.api_user.save()
+
+        self.assertEqual(self.client.get('/api/staff/').status_code, 401)
+
+    def test_revocations_reach_other_workers_through_the_shared_cache(self):
+        self.assertLessEqual(token_cache.ttl, MAX_LOCAL_TTL)
+        with tempfile.TemporaryDirectory() as location, override_settings(
+            CACHES={**settings.CACHES, 'tokens': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}},
+            TOKEN_AUTH_CACHE={**settings.TOKEN_AUTH_CACHE, 'SHARED_CACHE': 'tokens'},
+        ):
+            self.client.get('/api/staff/')
+            self.assertIsNotNone(caches['tokens'].get(shared_cache_key(self.token.key)))
+            self.token.delete()
+            # Another worker, once its local entry expired
+            token_cache.clear()
+            self.assertEqual(self.client.get('/api/staff/').status_code, 401)
+
+
+class StoreStatsTests(PanelAPITestCase):
+
+    def test_stats_aggregate_revenue_status_and_funnel(self):
+        self.create_order(items=2, status=OrderStatus.DELIVERED)
+        self.create_order(items=1, status=OrderStatus.PENDING)
+        self.create_order(items=3, status=OrderStatus.CANCELED)
+        old = self.create_order(items=1, status=OrderStatus.DELIVERED)
+        Order.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=2))
+
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/stores/{self.store.id}/stats/', {'source': 'live'})
+
+        self.assertEqual(response.status_code, 200)
+        today = timezone.localdate().isoformat()
+        by_day = {row['day']: row for row in response.data['revenue_by_day']}
+        # Canceled orders are counted but bring no revenue
+        self.assertEqual(by_day[today], {'day': today, 'orders': 3, 'revenue': '57.00'})
+        self.assertEqual(len(by_day), 2)
+        self.assertEqual(response.data['orders_by_status'][OrderStatus.DELIVERED], 2)
+        self.assertEqual(response.data['orders_by_status'][OrderStatus.CANCELED], 1)
+        self.assertEqual(response.data['funnel'], {'created': 4, 'delivered': 2, 'conversion_rate': 0.5})
+
+    def test_stats_range_covers_whole_days(self):
+        start, end = date(2026, 1, 1), date(2026, 1, 31)
+        first, last, after = self.create_order(), self.create_order(), self.create_order()
+        Order.objects.filter(pk=first.pk).update(created_at=day_start(start))
+        Order.objects.filter(pk=last.pk).update(created_at=day_start(date(2026, 2, 1)) - timedelta(microseconds=1))
+        Order.objects.filter(pk=after.pk).update(created_at=day_start(date(2026, 2, 1)))
+
+        stats = store_stats(self.store.id, start, end)
+
+        self.assertEqual(stats['funnel']['created'], 2)
+        self.assertEqual([row['day'] for row in stats['revenue_by_day']], [start, end])
+
+    def test_stats_range_is_validated(self):
+        response = self.client.get(f'/api/stores/{self.store.id}/stats/', {'start': '2026-02-01', 'end': '2026-01-01'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class DailyRollupTests(PanelAPITestCase):
+
+    def stats(self, source):
+        response = self.client.get(f'/api/stores/{self.store.id}/stats/', {'source': source})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_api_writes_keep_rollup_in_step_with_live_stats(self):
+        created = self.client.post('/api/orders/bulk/', {'orders': [
+            {'store': str(self.store.id), 'customer_name': 'C', 'customer_email': 'c@example.com',
+             'items': [{'product': str(self.product.id), 'quantity': 2}]}
+            for _ in range(3)
+        ]}, format='json').data['created']
+        order = self.client.post('/api/orders/', {
+            'store': self.store.id, 'customer_name': 'D', 'customer_email': 'd@example.com',
+        }).data
+        self.client.post('/api/order-items/', {
+            'order': order['id'], 'product': self.product.id, 'quantity': 1, 'unit_price': '9.50',
+        })
+        self.client.post(f'/api/orders/{created[0]}/transition/', {
+            'status': OrderStatus.CANCELED,
+        })
+        self.client.post('/api/orders/transition/', {
+            'orders': created[1:], 'status': OrderStatus.IN_CONFIRMATION,
+        }, format='json')
+        self.client.patch(f'/api/orders/{order["id"]}/', {'status': OrderStatus.DELIVERED})
+        self.run_tasks()
+
+        rollup = self.stats('rollup')
+
+        self.assertEqual(rollup, self.stats('live'))
+        self.assertEqual(rollup['orders_by_status'][OrderStatus.IN_CONFIRMATION], 2)
+        self.assertEqual(rollup['revenue_by_day'][0]['revenue'], '47.50')
+
+    def test_rebuild_counts_current_statuses(self):
+        order = self.create_order(items=2)
+        self.create_order(items=1)
+        # A log that disagrees with the order, e.g. written by a failed transition
+        OrderLog.objects.create(order=order, status=OrderStatus.DELIVERED, changed_by=self.owner)
+        Order.objects.filter(pk=order.pk).update(status=OrderStatus.IN_CONFIRMATION)
+
+        call_command('rebuild_rollups', chunk_size=1, stdout=StringIO())
+
+        self.assertEqual(self.stats('rollup'), self.stats('live'))
+        self.assertEqual(self.stats('rollup')['orders_by_status'][OrderStatus.IN_CONFIRMATION], 1)
+
+    def test_rebuild_drops_queued_deltas_it_already_counts(self):
+        other_store = Store.objects.create(name='Other', owner=self.owner)
+        queue_order_created([self.create_order(items=1), self.create_order(items=1, store=other_store)])
+
+        call_command('rebuild_rollups', store=str(self.store.id), stdout=StringIO())
+        self.run_tasks()
+
+        self.assertEqual(self.stats('rollup'), self.stats('live'))
+        self.assertEqual(DailyOrderRollup.objects.get(store=other_store).orders, 1)
+
+
+class ExportTests(PanelAPITestCase):
+
+    def read(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export_flattens_items(self):
+        self.create_order(items=2)
+        self.create_order(items=0)
+
+        lines = list(csv.DictReader(StringIO(self.read(self.client.get('/api/orders/export/')))))
+
+        self.assertEqual(len(lines), 3)
+        self.assertEqual([bool(line['item_id']) for line in lines], [True, True, False])
+        self.assertEqual(lines[0]['item_total_price'], '19.00')
+
+    def test_ndjson_export_nests_items_and_resumes_from_cursor(self):
+        orders = [self.create_order(items=index) for index in range(3)]
+
+        records = [json.loads(line) for line in self.read(self.client.get('/api/orders/export/', {'output': 'ndjson'})).splitlines()]
+        self.assertEqual([record['id'] for record in records], [str(order.id) for order in orders])
+        self.assertEqual([len(record['items']) for record in records], [0, 1, 2])
+
+        resumed = self.read(self.client.get('/api/orders/export/', {'output': 'ndjson', 'after': records[0]['cursor']}))
+        self.assertEqual([json.loads(line)['id'] for line in resumed.splitlines()], [str(order.id) for order in orders[1:]])
+
+    def test_export_applies_filters(self):
+        Product.objects.create(store=Store.objects.create(name='Other', owner=self.owner), name='Elsewhere', price=1)
+
+        lines = list(csv.DictReader(StringIO(self.read(self.client.get('/api/products/export/', {'store': self.store.id})))))
+
+        self.assertEqual([line['name'] for line in lines], ['Mug'])
+
+    def test_invalid_cursor_is_rejected(self):
+        self.assertEqual(self.client.get('/api/orders/export/', {'after': 'nope'}).status_code, 400)
+
+
+class ConditionalGetTests(PanelAPITestCase):
+
+    def test_unchanged_product_list_is_not_modified(self):
+        etag = self.client.get('/api/products/', {'store': self.store.id})['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/products/', {'store': self.store.id}, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_product_change_invalidates_etag_and_cache(self):
+        etag = self.client.get(f'/api/products/{self.product.id}/')['ETag']
+        with self.assertNumQueries(1):
+            cached = self.client.get(f'/api/products/{self.product.id}/')
+        self.assertEqual(cached.data['stock'], 100)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/products/{self.product.id}/stock/', {'delta': -1})
+        response = self.client.get(f'/api/products/{self.product.id}/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['stock'], 99)
+
+    def test_store_representation_leaves_out_version_counters(self):
+        response = self.client.get(f'/api/stores/{self.store.id}/')
+        order = self.client.get(f'/api/orders/{self.create_order().id}/', {'expand': 'store'})
+
+        self.assertFalse({'version', 'catalog_version', 'order_version'} & set(response.data))
+        self.assertEqual(set(order.data['store']), set(response.data))
+
+    def test_store_rename_invalidates_store_etag(self):
+        etag = self.client.get(f'/api/stores/{self.store.id}/')['ETag']
+
+        self.client.patch(f'/api/stores/{self.store.id}/', {'name': 'Renamed'})
+        response = self.client.get(f'/api/stores/{self.store.id}/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'Renamed')
+
+    def test_order_validators_follow_updated_at(self):
+        order = self.create_order(items=0)
+        response = self.client.get(f'/api/orders/{order.id}/')
+        self.assertIn('Last-Modified', response)
+
+        not_modified = self.client.get(f'/api/orders/{order.id}/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.client.post('/api/order-items/', {
+            'order': order.id, 'product': self.product.id, 'quantity': 1, 'unit_price': '9.50',
+        })
+        modified = self.client.get(f'/api/orders/{order.id}/', HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual((not_modified.status_code, modified.status_code), (304, 200))
+        self.assertEqual(len(modified.data['items']), 1)
+
+
+    def test_order_list_etag_follows_the_users_stores_only(self):
+        rival = User.objects.create_user(email='rival@example.com', name='Rival')
+        rival_store = Store.objects.create(name='Rival store', owner=rival)
+        etag = self.client.get('/api/orders/')['ETag']
+
+        # Store counters are bumped once the writing transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_order(store=rival_store)
+            queue_order_created([Order.objects.get(store=rival_store)])
+        with self.assertNumQueries(1):
+            unchanged = self.client.get('/api/orders/', HTTP_IF_NONE_MATCH=etag)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/orders/', {
+                'store': self.store.id, 'customer_name': 'New', 'customer_email': 'new@example.com',
+            })
+        changed = self.client.get('/api/orders/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual((unchanged.status_code, changed.status_code), (304, 200))
+        self.assertEqual(len(changed.data['results']), 1)
+
+
+class SparseFieldsTests(PanelAPITestCase):
+
+    def test_fields_narrow_payload_and_select(self):
+        self.create_order(items=2)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/orders/', {'fields': 'id,status,customer_name'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'status', 'customer_name'})
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('customer_email', sql)
+        self.assertNotIn('panel_orderitem', sql)
+
+    def test_expand_adds_store_and_logs(self):
+        order = self.create_order(items=1)
+        OrderLog.objects.create(order=order, status=OrderStatus.PENDING, changed_by=self.owner)
+
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/orders/{order.id}/', {'expand': 'store,logs'})
+
+        self.assertEqual(response.data['store']['name'], 'Main store')
+        self.assertEqual([log['status'] for log in response.data['logs']], [OrderStatus.PENDING])
+        self.assertEqual(len(response.data['items']), 1)
+
+    def test_sparse_lists_match_model_serializers(self):
+        order = self.create_order(items=2)
+        OrderLog.objects.create(order=order, status=OrderStatus.PENDING, changed_by=self.owner)
+        params = {'fields': 'id,status,items,created_at', 'expand': 'logs'}
+
+        lean = self.client.get('/api/orders/', params)
+        cache.clear()
+        with mock.patch.object(OrderViewSet, 'lean_list', False):
+            full = self.client.get('/api/orders/', params)
+
+        self.assertEqual(set(lean.data['results'][0]), {'id', 'status', 'items', 'created_at', 'logs'})
+        self.assertEqual(lean.content, full.content)
+
+    def test_expanded_store_rename_invalidates_order_etag(self):
+        order = self.create_order(items=0)
+        response = self.client.get(f'/api/orders/{order.id}/', {'expand': 'store'})
+        self.client.patch(f'/api/stores/{self.store.id}/', {'name': 'Renamed'})
+        response = self.client.get(f'/api/orders/{order.id}/', {'expand': 'store'}, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['store']['name'], 'Renamed')
+
+
+class AsyncViewTests(PanelAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.token = Token.objects.create(user=self.api_user)
+
+    def async_get(self, path, params=None):
+        return AsyncClient().get(path, params, headers={'authorization': f'Token {self.token.key}'})
+
+    async def test_async_list_pages_match_sync_list(self):
+        for _ in range(3):
+            await sync_to_async(self.create_order)(items=2)
+        params = {'page_size': 2, 'fields': 'id,status,items'}
+
+        first = await self.async_get('/api/async/orders/', params)
+        second = await self.async_get(first.json()['next'])
+        sync = await sync_to_async(self.client.get)('/api/orders/', {**params, 'page_size': 3})
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()['results'] + second.json()['results'], json.loads(sync.content)['results'])
+        self.assertIsNone(second.json()['next'])
+
+    async def test_async_retrieve_and_errors(self):
+        order = await sync_to_async(self.create_order)(items=1)
+        response = await self.async_get(f'/api/async/orders/{order.id}/', {'expand': 'store'})
+        sync = await sync_to_async(self.client.get)(f'/api/orders/{order.id}/', {'expand': 'store'})
+        missing = await self.async_get(f'/api/async/products/{order.id}/')
+        anonymous = await AsyncClient().get('/api/async/stores/')
+
+        self.assertEqual(response.content, sync.content)
+        self.assertEqual((missing.status_code, anonymous.status_code), (404, 401))
+
+
+@override_settings(ORDER_EVENTS={**settings.ORDER_EVENTS, 'POLL_INTERVAL': 0.01, 'HEARTBEAT': 0.05,
+                                  'STREAM_DURATION': 0.2, 'LONG_POLL_TIMEOUT': 0.05})
+class OrderEventFeedTests(PanelAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.token = Token.objects.create(user=self.api_user)
+        rival = User.objects.create_user(email='rival@example.com', name='Rival')
+        self.rival_store = Store.objects.create(name='Rival store', owner=rival)
+
+    def async_get(self, path, params=None, **headers):
+        return AsyncClient().get(path, params, headers={'authorization': f'Token {self.token.key}', **headers})
+
+    async def test_long_poll_returns_new_events_of_the_users_stores(self):
+        order = await sync_to_async(self.create_order)()
+        await sync_to_async(self.create_order)(store=self.rival_store)
+        await sync_to_async(self.client.post)('/api/orders/bulk/', {'orders': [{
+            'store': str(self.store.id), 'customer_name': 'Bulk', 'customer_email': 'bulk@example.com',
+            'items': [{'product': str(self.product.id), 'quantity': 1}],
+        }]}, format='json')
+        await sync_to_async(self.client.post)(f'/api/orders/{order.id}/transition/', {
+            'status': OrderStatus.IN_CONFIRMATION,
+        }, format='json')
+
+        response = (await self.async_get('/api/order-events/', {'since': 0})).json()
+        self.assertEqual([event['kind'] for event in response['events']], [OrderEvent.Kind.CREATED, OrderEvent.Kind.STATUS])
+        self.assertEqual(response['events'][1]['order_id'], str(order.id))
+        self.assertEqual(response['last_id'], response['events'][-1]['id'])
+
+        # Nothing newer: the poll times out and hands the same position back
+        idle = (await self.async_get('/api/order-events/', {'since': response['last_id']})).json()
+        self.assertEqual(idle, {'last_id': response['last_id'], 'events': []})
+        latest = await OrderEvent.objects.order_by('-pk').values_list('pk', flat=True).afirst()
+        self.assertEqual((await self.async_get('/api/order-events/', {'since': ''})).json()['last_id'], latest)
+        self.assertEqual((await self.async_get('/api/order-events/', {'since': 'x'})).status_code, 400)
+
+    async def test_stream_resumes_after_last_event_id(self):
+        first = await sync_to_async(self.create_order)()
+        await sync_to_async(queue_order_created)([first])
+        second = await sync_to_async(self.create_order)()
+        await sync_to_async(queue_order_created)([second])
+        first_id = await OrderEvent.objects.filter(order=first).values_list('pk', flat=True).aget()
+
+        response = await self.async_get('/api/order-events/', last_event_id=str(first_id))
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertIn(f'id: {first_id + 1}\nevent: order.created\ndata: ', body)
+        self.assertIn(str(second.id), body)
+        self.assertNotIn(str(first.id), body)
+        self.assertIn(': keep-alive', body)
+
+    def test_committed_events_signal_waiting_streams_and_old_ones_are_pruned(self):
+        # Counters only go to a cache all workers share, LocMemCache does not qualify
+        self.assertIsNone(feed_cache())
+        with tempfile.TemporaryDirectory() as location, override_settings(
+            CACHES={**settings.CACHES, 'feed': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}},
+            ORDER_EVENTS={**settings.ORDER_EVENTS, 'CACHE': 'feed'},
+        ):
+            order = self.create_order()
+            with self.captureOnCommitCallbacks(execute=True):
+                queue_order_created([order])
+            feed = feed_cache()
+            self.assertEqual(feed.get_many(feed_keys([self.store.id, self.rival_store.id])), {feed_key(self.store.id): 1})
+            self.assertEqual(feed.get(feed_key()), 1)
+
+        OrderEvent.objects.update(created_at=timezone.now() - timedelta(days=8))
+        self.assertEqual(prune_events(7), 1)
+
+
+class DatabaseProfileTests(TestCase):
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite profile')
+    def test_sqlite_connections_are_tuned_at_connect_time(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            busy_timeout = cursor.fetchone()[0]
+            cursor.execute('PRAGMA synchronous')
+            synchronous = cursor.fetchone()[0]
+
+        self.assertEqual(busy_timeout, 5000)
+        self.assertEqual(synchronous, 1)  # NORMAL
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+
+class ReadYourWritesTests(PanelAPITestCase):
+
+    def test_successful_writes_pin_the_user_to_the_primary(self):
+        self.client.post('/api/products/', {'store': self.store.id, 'name': 'Bad', 'price': 'x'})
+        self.assertFalse(is_pinned_to_primary(self.api_user))
+
+        self.client.post('/api/products/', {'store': self.store.id, 'name': 'Plate', 'price': '4.00'})
+        self.assertTrue(is_pinned_to_primary(self.api_user))
+
+    def test_replicas_require_a_shared_pin_cache(self):
+        with override_settings(REPLICA_DATABASES=['replica'], READ_YOUR_WRITES_CACHE='default'):
+            with self.assertRaises(ImproperlyConfigured):
+                check_pin_cache()
+        with tempfile.TemporaryDirectory() as location, override_settings(
+            CACHES={**settings.CACHES, 'pins': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}},
+            REPLICA_DATABASES=['replica'], READ_YOUR_WRITES_CACHE='pins',
+        ):
+            check_pin_cache()
+            pin_to_primary(self.api_user)
+            self.assertTrue(caches['pins'].get(primary_pin_key(self.api_user)))
+
+
+@skipUnless(settings.REPLICA_DATABASES, 'set DB_REPLICAS to run against a replica database')
+@override_settings(REPLICA_DATABASES=settings.REPLICA_DATABASES[:1])
+class ReplicaRoutingTests(PanelAPITestCase):
+    """
+    Run with e.g. `DB_REPLICAS=/tmp/replica.sqlite3 READ_YOUR_WRITES_CACHE=shared
+    SHARED_CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+    SHARED_CACHE_LOCATION=/tmp/panel-cache python manage.py test panel`:
+    the replica is a separate database, so rows written only there show
+    which database served a request.
+    """
+    databases = {'default', *settings.REPLICA_DATABASES}
+
+    def setUp(self):
+        super().setUp()
+        self.replica = settings.REPLICA_DATABASES[0]
+        self.owner.save(using=self.replica)
+        self.store.save(using=self.replica)
+        self.replica_only = Product.objects.using(self.replica).create(store=self.store, name='Replica', price=Decimal('1.00'))
+
+    def test_list_retrieve_and_export_read_from_the_replica(self):
+        listed = self.client.get('/api/products/')
+        retrieved = self.client.get(f'/api/products/{self.replica_only.id}/')
+        exported = b''.join(self.client.get('/api/products/export/').streaming_content).decode()
+
+        self.assertEqual([product['name'] for product in listed.data['results']], ['Replica'])
+        self.assertEqual(retrieved.status_code, 200)
+        self.assertIn('Replica', exported)
+
+    def test_writes_go_to_the_primary_and_pin_reads_to_it(self):
+        response = self.client.post('/api/products/', {'store': self.store.id, 'name': 'Plate', 'price': '4.00'})
+        listed = self.client.get('/api/products/')
+
+        self.assertTrue(Product.objects.using('default').filter(pk=response.data['id']).exists())
+        self.assertEqual({product['name'] for product in listed.data['results']}, {'Mug', 'Plate'})
+
+
+class LeanListGoldenTests(PanelAPITestCase):
+    """
+    The lean list path must render byte-for-byte what the ModelSerializers do.
+    """
+    LEAN_VIEWSETS = {
+        'products': ProductViewSet,
+        'orders': OrderViewSet,
+        'order-items': OrderItemViewSet,
+        'order-logs': OrderLogViewSet,
+    }
+
+    def test_lean_lists_match_model_serializers(self):
+        Product.objects.create(store=self.store, name='No description', price=Decimal('0.10'), description=None)
+        for index in range(4):
+            order = self.create_order(items=index)
+            OrderLog.objects.create(order=order, status=OrderStatus.PENDING, changed_by=self.owner)
+
+        for prefix, viewset in self.LEAN_VIEWSETS.items():
+            with self.subTest(prefix=prefix):
+                self.assertTrue(viewset.lean_list)
+                cache.clear()
+                lean = self.client.get(f'/api/{prefix}/', {'page_size': 3})
+                cache.clear()
+                with mock.patch.object(viewset, 'lean_list', False):
+                    full = self.client.get(f'/api/{prefix}/', {'page_size': 3})
+                self.assertEqual(lean.status_code, 200)
+                self.assertEqual(lean.content, full.content)
+
+    def test_unknown_field_names_do_not_grow_the_plan_cache(self):
+        self.client.get('/api/products/', {'fields': 'name'})
+        size = LeanSerializer.compile.cache_info().currsize
+
+        for index in range(20):
+            response = self.client.get('/api/products/', {'fields': f'name,junk{index}', 'expand': f'junk{index}'})
+            self.assertEqual(list(response.data['results'][0]), ['name'])
+
+        self.assertEqual(LeanSerializer.compile.cache_info().currsize, size)
+        self.assertEqual(LeanSerializer.compile.cache_info().maxsize, 256)
@@ -2,7 +2,10 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework.authtoken.views import obtain_auth_token  # For login
 from .views import UserViewSet, StoreViewSet, StaffViewSet, ProductViewSet, OrderViewSet, OrderItemViewSet, OrderLogViewSet, PromoCodeViewSet, SubscriptionViewSet
-from .views.auth_views import SignupAPIView, CustomLoginAPIView  # Import the new login view
+from .views.async_views import AsyncStoreView, AsyncProductView, AsyncOrderView
+from .views.auth_views import SignupAPIView, CustomLoginAPIView, TokenCacheStatsAPIView  # Import the new login view
+from .views.metrics_views import MetricsAPIView
+from .views.event_views import OrderEventStreamView
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet)
@@ -19,4 +22,15 @@ urlpatterns = [
     path('', include(router.urls)),
     path('auth/login/', CustomLoginAPIView.as_view(), name='api_login'),  # Replace obtain_auth_token
     path('auth/signup/', SignupAPIView.as_view(), name='api_signup'),  # Signup endpoint
+    path('auth/token-cache/', TokenCacheStatsAPIView.as_view(), name='api_token_cache_stats'),
+    path('metrics/', MetricsAPIView.as_view(), name='api_metrics'),
+    # Async-native read endpoints, for deployments served by an ASGI server
+    path('async/stores/', AsyncStoreView.as_view(), name='async-store-list'),
+    path('async/stores/<uuid:pk>/', AsyncStoreView.as_view(), name='async-store-detail'),
+    path('async/products/', AsyncProductView.as_view(), name='async-product-list'),
+    path('async/products/<uuid:pk>/', AsyncProductView.as_view(), name='async-product-detail'),
+    path('async/orders/', AsyncOrderView.as_view(), name='async-order-list'),
+    path('async/orders/<uuid:pk>/', AsyncOrderView.as_view(), name='async-order-detail'),
+    # Order creations and transitions as Server-Sent Events, or long-polled with ?since=
+    path('order-events/', OrderEventStreamView.as_view(), name='order-events'),
 ]
\ No newline at end of file
@@ -1,50 +1,510 @@
-from rest_framework import viewsets
-from ..models import User, Store, Staff, Product, Order, OrderItem, OrderLog, PromoCode, Subscription
-from ..serializers import UserSerializer, StoreSerializer, StaffSerializer, ProductSerializer, OrderSerializer, OrderItemSerializer, OrderLogSerializer, PromoCodeSerializer, SubscriptionSerializer
-from rest_framework.permissions import IsAuthenticated
+import uuid
+from collections import Counter
 
-class UserViewSet(viewsets.ModelViewSet):
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
+from rest_framework import viewsets, status, serializers
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from ..models import User, Store, Staff, StaffRole, Product, Order, OrderItem, OrderLog, PromoCode, Subscription
+from ..serializers import LeanSerializer, sparse_selection, UserSerializer, StoreSerializer, StaffSerializer, ProductSerializer, OrderSerializer, OrderItemSerializer, OrderLogSerializer, PromoCodeSerializer, SubscriptionSerializer, OrderTransitionSerializer, BulkOrderTransitionSerializer, BulkOrderCreateSerializer, StockAdjustmentSerializer, OrderClaimSerializer, OrderReleaseSerializer, PromoRedeemSerializer, PromoValidateSerializer, StoreStatsQuerySerializer, StoreStatsSerializer
+from ..filters import OrderFilter, ProductFilter, OrderLogFilter, SubscriptionFilter
+from ..services import rollups
+from ..services.reports import store_stats, rollup_store_stats
+from ..services.stock import take_stock, release_stock
+from ..services.promos import validate_codes, redeem_code, explain_rejection
+from ..services.work_queues import claim_orders, release_orders
+from ..services.catalog import bump_order_version
+from ..tenancy import OWNER
+from ..services.orders import STOCK_RELEASING_STATUSES, TransitionError, StaleOrderError, transition_order, bulk_transition_orders, ingest_orders, queue_order_created
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from .export_views import ExportMixin
+from .conditional_views import ConditionalGetMixin
+from .replica_views import ReplicaReadMixin
+from .tenant_views import TenantScopedMixin, AdminWritesOnly
+
+
+class PanelModelViewSet(TenantScopedMixin, ReplicaReadMixin, viewsets.ModelViewSet):
+    """
+    Base ViewSet for the panel API.
+
+    The queryset is widened with the select/prefetch hints declared by the
+    serializer, so list and retrieve cost a fixed number of queries.
+    Ordering is opt-in: only fields listed in `ordering_fields` are accepted.
+    With `lean_list`, list responses are built from `.values()` rows by a
+    LeanSerializer instead of the ModelSerializer; the output is identical.
+    List and retrieve accept `?fields=` and `?expand=`: only the requested
+    columns are selected and only the requested relations are loaded.
+    Safe reads of `replica_actions` are served from a read replica.
+    Store-owned rows are limited to the stores of the user (TenantScopedMixin).
+    """
+    ordering_fields = ()
+    lean_list = False
+    sparse_actions = ('list', 'retrieve')
+
+    def get_sparse_fields(self):
+        """
+        Return the `(fields, expand)` selection of the request, see sparse_selection().
+        """
+        if self.action not in self.sparse_actions:
+            return None, ()
+        return sparse_selection(self.request.query_params)
+
+    def get_serializer(self, *args, **kwargs):
+        fields, expand = self.get_sparse_fields()
+        kwargs.setdefault('fields', fields)
+        kwargs.setdefault('expand', expand)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields, expand = self.get_sparse_fields()
+        return self.get_serializer_class().setup_eager_loading(queryset, fields, expand, self.get_ordering_columns())
+
+    def filtered_stores(self):
+        """
+        Return the user's stores, narrowed to `?store=` when given.
+        """
+        stores = self.scope_queryset(Store.objects.all())
+        try:
+            return stores.filter(pk=uuid.UUID(self.request.query_params['store']))
+        except (KeyError, ValueError):
+            return stores
+
+    def get_ordering_columns(self):
+        # Cursor pagination reads the ordering columns back from each row
+        return [name.lstrip('-') for name in (*self.ordering, *self.ordering_fields)]
+
+    def list(self, request, *args, **kwargs):
+        if not self.lean_list:
+            return super().list(request, *args, **kwargs)
+        try:
+            lean = LeanSerializer.for_serializer(self.get_serializer_class(), *self.get_sparse_fields())
+        except TypeError:
+            # The selection expands a relation the lean path cannot build
+            return super().list(request, *args, **kwargs)
+        queryset = lean.values(self.filter_queryset(self.get_queryset()), self.get_ordering_columns())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(lean.serialize(page))
+        return Response(lean.serialize(queryset))
+
+
+def store_versions(stores, field, extra_field=None):
+    """
+    Combine version counter `field` (plus `extra_field`) of `stores` into a
+    validator. Counters only grow, so the sum changes with every bump; the
+    count catches stores coming and going.
+    """
+    aggregates = {'total': Sum(field), 'latest': Max(field), 'count': Count('id')}
+    if extra_field:
+        aggregates['extra'] = Sum(extra_field)
+    versions = stores.aggregate(**aggregates)
+    return '-'.join(str(versions[name]) for name in aggregates)
+
+
+class UserViewSet(PanelModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticated, AdminWritesOnly]
+    ordering = ('-created_at', '-id')
+
+    def get_queryset(self):
+        # Users see themselves and the owners and staff of their stores
+        queryset = super().get_queryset()
+        scope = self.tenant_scope
+        if scope is None:
+            return queryset
+        return queryset.filter(
+            Q(pk=scope.user_id)
+            | Q(pk__in=Store.objects.filter(pk__in=scope.store_ids).values('owner_id'))
+            | Q(pk__in=Staff.objects.filter(store_id__in=scope.store_ids).values('user_id'))
+        )
 
-class StoreViewSet(viewsets.ModelViewSet):
+class StoreViewSet(ConditionalGetMixin, PanelModelViewSet):
     queryset = Store.objects.all()
     serializer_class = StoreSerializer
     permission_classes = [IsAuthenticated]
+    ordering = ('-created_at', '-id')
+    cache_responses = True
+    write_roles = (StaffRole.MANAGER, OWNER)
+
+    # Anyone may open a store of their own; only its owner may hand it over
+    def perform_create(self, serializer):
+        if self.tenant_scope is not None and serializer.validated_data['owner'].pk != self.tenant_scope.user_id:
+            raise PermissionDenied('Stores can only be created for your own account.')
+        serializer.save()
+
+    def perform_update(self, serializer):
+        owner = serializer.validated_data.get('owner')
+        if (self.tenant_scope is not None and owner is not None and owner.pk != serializer.instance.owner_id
+                and OWNER not in self.tenant_scope.roles.get(serializer.instance.pk, ())):
+            raise PermissionDenied('Only the owner may hand the store over.')
+        serializer.save()
+
+    def get_validators(self):
+        stores = self.scope_queryset(Store.objects.all())
+        if self.action == 'retrieve':
+            return stores.filter(pk=self.kwargs['pk']).values_list('version', flat=True).first(), None
+        return store_versions(stores, 'version'), None
 
-class StaffViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'])
+    def stats(self, request, pk=None):
+        """
+        Revenue per day, order counts per status and the pending to delivered
+        conversion for the store, over `start`..`end` (last 30 days by default).
+        """
+        store = self.get_object()
+        query = StoreStatsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        compute = rollup_store_stats if query.validated_data['source'] == 'rollup' else store_stats
+        stats = compute(store.pk, query.validated_data['start'], query.validated_data['end'])
+        return Response(StoreStatsSerializer(stats).data)
+
+class StaffViewSet(PanelModelViewSet):
     queryset = Staff.objects.all()
     serializer_class = StaffSerializer
     permission_classes = [IsAuthenticated]
+    ordering = ('-added_at', '-id')
+    # Assistants must not be able to hire, promote or fire
+    write_roles = (StaffRole.MANAGER, OWNER)
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ConditionalGetMixin, ExportMixin, PanelModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
+    ordering = ('-created_at', '-id')
+    filterset_class = ProductFilter
+    lean_list = True
+    search_fields = ['^name']
+    ordering_fields = ('created_at', 'price', 'stock')
+    export_fields = ('id', 'created_at', 'store', 'name', 'description', 'price', 'stock')
+    cache_responses = True
+
+    def get_validators(self):
+        if self.action == 'retrieve':
+            version = self.scope_queryset(Product.objects.filter(pk=self.kwargs['pk'])).values_list('store__catalog_version', flat=True).first()
+            return version, None
+        return store_versions(self.filtered_stores(), 'catalog_version'), None
+
+    @action(detail=True, methods=['post'])
+    def stock(self, request, pk=None):
+        """
+        Atomically adjust stock by a delta instead of a read-modify-write PATCH.
+        """
+        product = self.get_object()
+        serializer = StockAdjustmentSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        delta = serializer.validated_data['delta']
+        if delta < 0:
+            if not take_stock([(product.pk, -delta)])[0]:
+                return Response({'error': 'Not enough stock.'}, status=status.HTTP_409_CONFLICT)
+        elif delta > 0:
+            release_stock([(product.pk, delta)])
+        product.refresh_from_db(fields=['stock'])
+        return Response({'id': str(product.pk), 'stock': product.stock})
+
+def holds_stock(order):
+    # Canceled and returned orders already gave their items' stock back
+    return order.status not in STOCK_RELEASING_STATUSES
+
+def touch_orders(orders):
+    # Items are part of the order representation, so they move its updated_at
+    Order.objects.filter(pk__in=[order.pk for order in orders]).update(updated_at=timezone.now())
+    bump_order_version({order.store_id for order in orders})
 
-class OrderItemViewSet(viewsets.ModelViewSet):
+class OrderItemViewSet(PanelModelViewSet):
     queryset = OrderItem.objects.all()
     serializer_class = OrderItemSerializer
     permission_classes = [IsAuthenticated]
+    ordering = ('-id',)
+    lean_list = True
 
-class OrderViewSet(viewsets.ModelViewSet):
+    # Items of open orders hold their stock; the order gives it back when canceled or returned
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            data = serializer.validated_data
+            if holds_stock(data['order']):
+                self.move_stock({data['product'].pk: data['quantity']})
+            item = serializer.save()
+            rollups.add_revenue(item.order, item.total_price)
+            touch_orders([item.order])
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            item, data = serializer.instance, serializer.validated_data
+            previous_order, previous_total = item.order, item.total_price
+            deltas = Counter()
+            if holds_stock(previous_order):
+                deltas[item.product_id] -= item.quantity
+            if holds_stock(data.get('order', previous_order)):
+                deltas[data['product'].pk if 'product' in data else item.product_id] += data.get('quantity', item.quantity)
+            self.move_stock(deltas)
+            item = serializer.save()
+            rollups.add_revenue(previous_order, -previous_total)
+            rollups.add_revenue(item.order, item.total_price)
+            touch_orders([previous_order, item.order])
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            if holds_stock(instance.order):
+                release_stock([(instance.product_id, instance.quantity)])
+            rollups.add_revenue(instance.order, -instance.total_price)
+            instance.delete()
+            touch_orders([instance.order])
+
+    def move_stock(self, deltas):
+        """
+        Take the positive and give back the negative `product id: quantity`
+        deltas; raises ValidationError, to roll back, when stock is short.
+        """
+        take = [(product_id, quantity) for product_id, quantity in deltas.items() if quantity > 0]
+        if take and not all(take_stock(take)):
+            raise serializers.ValidationError({'quantity': 'Not enough stock.'})
+        release_stock([(product_id, -quantity) for product_id, quantity in deltas.items() if quantity < 0])
+
+class OrderViewSet(ConditionalGetMixin, ExportMixin, PanelModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    ordering = ('-created_at', '-id')
+    filterset_class = OrderFilter
+    lean_list = True
+    search_fields = ['^customer_name', '=customer_email']
+    ordering_fields = ('created_at', 'updated_at', 'status')
+    export_fields = ('id', 'created_at', 'updated_at', 'store', 'customer_name', 'customer_email', 'status')
+    export_nested = ('items', ('id', 'product', 'quantity', 'unit_price', 'total_price'))
+
+    def get_validators(self):
+        # Item and log writes touch the order's updated_at, so it covers nested items and logs too;
+        # an expanded store adds the store version, which only ever grows
+        with_store = 'store' in self.get_sparse_fields()[1]
+        if self.action == 'retrieve':
+            row = self.scope_queryset(Order.objects.filter(pk=self.kwargs['pk'])).values_list('updated_at', 'store__version').first()
+            if row is None:
+                return None, None
+            updated_at, store_version = row
+            return (f'{updated_at}-{store_version}' if with_store else updated_at), updated_at
+        # Lists are versioned by the order counters of the stores they cover, read by primary
+        # key instead of aggregating the orders themselves; filters are part of the cache key
+        return store_versions(self.filtered_stores(), 'order_version', 'version' if with_store else None), None
+
+    # Keep the daily rollup in step with plain CRUD writes as well
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            order = serializer.save()
+            queue_order_created([order])
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            previous = (serializer.instance.store_id, serializer.instance.created_at, serializer.instance.status)
+            order = serializer.save()
+            bump_order_version({previous[0], order.store_id})
+            if previous != (order.store_id, order.created_at, order.status):
+                revenue = rollups.order_revenue([order.pk]).get(order.pk)
+                rollups.add_orders([(*previous, revenue)], sign=-1)
+                rollups.add_orders([(order.store_id, order.created_at, order.status, revenue)])
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            revenue = rollups.order_revenue([instance.pk]).get(instance.pk)
+            rollups.add_orders([(instance.store_id, instance.created_at, instance.status, revenue)], sign=-1)
+            instance.delete()
+            bump_order_version([instance.store_id])
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create many orders with nested items in one transaction. Orders that
+        fail validation or lack stock are reported by their index in the
+        payload; the others are created.
+        """
+        serializer = BulkOrderCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        created, errors = ingest_orders(serializer.validated_data['orders'], store_ids=self.tenant_store_ids())
+        return Response({
+            'created': [str(order.pk) for order in created],
+            'errors': errors,
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=True, methods=['post'])
+    def transition(self, request, pk=None):
+        """
+        Move the order to a new status and log the change atomically.
+        """
+        order = self.get_object()
+        serializer = OrderTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            order = transition_order(
+                order.pk,
+                serializer.validated_data['status'],
+                self.require_panel_user_id(),
+                expected_updated_at=serializer.validated_data.get('updated_at'),
+            )
+        except StaleOrderError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
+        except TransitionError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(self.get_queryset().get(pk=order.pk)).data)
+
+    @action(detail=False, methods=['post'])
+    def claim(self, request):
+        """
+        Lease the oldest unclaimed orders of a work queue (confirmation,
+        dispatch or delivery) to the requesting staff member. Concurrent
+        callers get disjoint batches; orders not transitioned or released
+        before `claimed_until` go back to the queue.
+        """
+        serializer = OrderClaimSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        queue = serializer.validated_data['queue']
+        store_ids = self.queue_store_ids(queue)
+        if 'store' in serializer.validated_data:
+            store = serializer.validated_data['store']
+            store_ids = {store} & store_ids if store_ids is not None else {store}
+        claimant_id = self.panel_user_id()
+        if claimant_id is None or store_ids is not None and not store_ids:
+            return Response({'error': f'You do not work the {queue} queue.'}, status=status.HTTP_403_FORBIDDEN)
+
+        order_ids, claimed_until = claim_orders(
+            queue, store_ids, claimant_id, serializer.validated_data['limit'], serializer.validated_data['lease'],
+        )
+        orders = self.get_queryset().filter(pk__in=order_ids).order_by('created_at', 'id')
+        return Response({
+            'claimed_until': claimed_until,
+            'results': self.get_serializer(orders, many=True).data,
+        })
 
-class OrderLogViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'])
+    def release(self, request):
+        """
+        Put orders claimed by the requesting staff member back in their queue.
+        """
+        serializer = OrderReleaseSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        released = release_orders(serializer.validated_data['orders'], self.panel_user_id())
+        return Response({'released': [str(order_id) for order_id in released]})
+
+    def queue_store_ids(self, queue):
+        """
+        Return the stores whose `queue` the user works (None for all):
+        those where they are its assistant, a manager or the owner.
+        """
+        scope = self.tenant_scope
+        if scope is None:
+            return None
+        return {store_id for store_id, roles in scope.roles.items() if not roles.isdisjoint((queue, StaffRole.MANAGER, OWNER))}
+
+    @action(detail=False, methods=['post'], url_path='transition', url_name='bulk-transition')
+    def bulk_transition(self, request):
+        """
+        Move many orders to the same status in one UPDATE; orders that cannot
+        make the transition are reported per id and left untouched.
+        """
+        serializer = BulkOrderTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            updated, errors = bulk_transition_orders(
+                serializer.validated_data['orders'],
+                serializer.validated_data['status'],
+                self.require_panel_user_id(),
+                store_ids=self.tenant_store_ids(),
+            )
+        except StaleOrderError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
+        return Response({
+            'updated': [str(order_id) for order_id in updated],
+            'errors': {str(order_id): message for order_id, message in errors.items()},
+        })
+
+class OrderLogViewSet(PanelModelViewSet):
     queryset = OrderLog.objects.all()
     serializer_class = OrderLogSerializer
     permission_classes = [IsAuthenticated]
+    # The audit trail is written by the transition services only
+    http_method_names = ['get', 'head', 'options']
+    ordering = ('-changed_at', '-id')
+    filterset_class = OrderLogFilter
+    lean_list = True
+    ordering_fields = ('changed_at',)
 
-class PromoCodeViewSet(viewsets.ModelViewSet):
+class PromoCodeViewSet(PanelModelViewSet):
     queryset = PromoCode.objects.all()
     serializer_class = PromoCodeSerializer
-    permission_classes = [IsAuthenticated]
+    # Codes are global: only admins list and manage them, users check and redeem the ones they know
+    permission_classes = [IsAdminUser]
+    ordering = ('-created_at', '-id')
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def validate(self, request):
+        """
+        Check up to 1000 codes with at most one query. Advisory only: usage
+        counts may be a few seconds old, `redeem` is what grants a use.
+        """
+        serializer = PromoValidateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = validate_codes(serializer.validated_data['codes'])
+        return Response({'results': [
+            {
+                'code': code,
+                'valid': reason is None,
+                'reason': reason,
+                'discount_percentage': str(row['discount_percentage']) if row else None,
+            }
+            for code, (row, reason) in results.items()
+        ]})
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def redeem(self, request):
+        """
+        Use a code once; 409 when it is unknown, not valid now or used up.
+        """
+        serializer = PromoRedeemSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        code = serializer.validated_data['code']
+        if not redeem_code(code):
+            return Response({'error': 'Promo code cannot be redeemed.', 'reason': explain_rejection(code)},
+                            status=status.HTTP_409_CONFLICT)
+        return Response({'code': code, 'redeemed': True})
 
-class SubscriptionViewSet(viewsets.ModelViewSet):
+class SubscriptionViewSet(PanelModelViewSet):
     queryset = Subscription.objects.all()
     serializer_class = SubscriptionSerializer
     permission_classes = [IsAuthenticated]
+    filterset_class = SubscriptionFilter
+    ordering = ('-created_at', '-id')
+
+    def get_queryset(self):
+        # Users see their own subscriptions and those of their stores
+        queryset = super().get_queryset()
+        scope = self.tenant_scope
+        if scope is None:
+            return queryset
+        return queryset.filter(Q(user_id=scope.user_id) | Q(store_id__in=scope.store_ids))
+
+    def check_subscriber(self, user_id):
+        # Users only subscribe, change and cancel for themselves
+        if self.tenant_scope is not None and user_id != self.tenant_scope.user_id:
+            raise PermissionDenied('Subscriptions can only be managed by their own user.')
+
+    def perform_update(self, serializer):
+        self.check_subscriber(serializer.instance.user_id)
+        self.check_subscriber(serializer.validated_data.get('user', serializer.instance.user).pk)
+        serializer.save()
+
+    def perform_destroy(self, instance):
+        self.check_subscriber(instance.user_id)
+        instance.delete()
+
+    def perform_create(self, serializer):
+        self.check_subscriber(serializer.validated_data['user'].pk)
+        # The promo code use and the subscription commit or roll back together
+        promo = serializer.validated_data.get('promo_code')
+        with transaction.atomic():
+            if promo is not None and not redeem_code(promo.code):
+                raise serializers.ValidationError({'promo_code': [f'Promo code cannot be redeemed ({explain_rejection(promo.code)}).']})
+            serializer.save()
 
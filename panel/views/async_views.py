@@ -0,0 +1,129 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from ..filters import OrderFilter, ProductFilter
+from ..models import Store, Product, Order
+from ..pagination import StableCursorPagination
+from ..serializers import LeanSerializer, StoreSerializer, ProductSerializer, OrderSerializer, sparse_selection
+from ..services.exports import InvalidCursor, encode_cursor, before_cursor
+from ..tenancy import tenant_scope, scope_queryset
+
+
+def authenticate(request):
+    """
+    Run the API's authentication classes on a plain Django request and
+    return the authenticated user; raises NotAuthenticated or AuthenticationFailed.
+    """
+    request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    if not request.user.is_authenticated:
+        raise exceptions.NotAuthenticated()
+    return request.user
+
+
+class AsyncReadView(View):
+    """
+    Async-native list and retrieve for one model, served under ASGI.
+
+    Rows are read with the async ORM (`aiterator()` / `aget()`), so a slow
+    query does not hold a worker while other requests wait. The JSON matches
+    the sync ViewSet's, including `?fields=` / `?expand=` and the filters;
+    lists are paged newest first with an opaque `?cursor=` and a `next` link.
+    Rows are limited to the user's stores like in the sync ViewSets.
+    Responses carry no ETag and are not cached.
+    """
+    http_method_names = ['get', 'options']
+    queryset = None
+    serializer_class = None
+    filterset_class = None
+    ordering = ('-created_at', '-id')
+    page_size = StableCursorPagination.page_size
+    max_page_size = StableCursorPagination.max_page_size
+
+    async def get(self, request, pk=None):
+        try:
+            user = await sync_to_async(authenticate)(request)
+        except exceptions.APIException as exc:
+            response = self.render({'detail': exc.detail}, exc.status_code)
+            response['WWW-Authenticate'] = 'Token'
+            return response
+
+        fields, expand = sparse_selection(request.GET)
+        queryset = scope_queryset(self.queryset.all(), await sync_to_async(tenant_scope)(user))
+        queryset = self.serializer_class.setup_eager_loading(queryset, fields, expand, ['created_at'])
+        if pk is not None:
+            return await self.retrieve(queryset, pk, fields, expand)
+        return await self.list(request, queryset, fields, expand)
+
+    async def retrieve(self, queryset, pk, fields, expand):
+        model = queryset.model
+        try:
+            instance = await queryset.aget(pk=pk)
+        except model.DoesNotExist:
+            return self.render({'detail': f'No {model._meta.object_name} matches the given query.'}, 404)
+        return self.render(self.serializer_class(instance, fields=fields, expand=expand).data)
+
+    async def list(self, request, queryset, fields, expand):
+        if self.filterset_class is not None:
+            filterset = self.filterset_class(request.GET, queryset=queryset, request=request)
+            if not filterset.is_valid():
+                return self.render(filterset.errors, 400)
+            queryset = filterset.qs
+        if request.GET.get('cursor'):
+            try:
+                queryset = before_cursor(queryset, request.GET['cursor'])
+            except InvalidCursor as exc:
+                return self.render({'cursor': [str(exc)]}, 400)
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+
+        try:
+            lean = LeanSerializer.for_serializer(self.serializer_class, fields, expand)
+        except TypeError:
+            # The selection expands a relation the lean path cannot build
+            lean = None
+        if lean is not None:
+            rows = [row async for row in lean.values(queryset, ['created_at'])[:page_size + 1].aiterator()]
+            results = await lean.aserialize(rows[:page_size])
+            last = rows[page_size - 1] if len(rows) > page_size else None
+            next_cursor = encode_cursor(last['created_at'], last[lean.pk]) if last else None
+        else:
+            instances = [obj async for obj in queryset[:page_size + 1].aiterator(chunk_size=page_size + 1)]
+            results = self.serializer_class(instances[:page_size], many=True, fields=fields, expand=expand).data
+            last = instances[page_size - 1] if len(instances) > page_size else None
+            next_cursor = encode_cursor(last.created_at, last.pk) if last else None
+
+        next_url = None
+        if next_cursor:
+            params = request.GET.copy()
+            params['cursor'] = next_cursor
+            next_url = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+        return self.render({'next': next_url, 'results': results})
+
+    def get_page_size(self, request):
+        try:
+            return max(1, min(int(request.GET['page_size']), self.max_page_size))
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def render(self, data, status=200):
+        return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+class AsyncStoreView(AsyncReadView):
+    queryset = Store.objects.all()
+    serializer_class = StoreSerializer
+
+class AsyncProductView(AsyncReadView):
+    queryset = Product.objects.all()
+    serializer_class = ProductSerializer
+    filterset_class = ProductFilter
+
+class AsyncOrderView(AsyncReadView):
+    queryset = Order.objects.all()
+    serializer_class = OrderSerializer
+    filterset_class = OrderFilter
@@ -1,11 +1,12 @@
 from rest_framework import serializers, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate
 
 from ..models import User  # Import directly from your models
+from ..authentication import token_cache
 
 class UserSignupSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, style={'input_type': 'password'})
@@ -79,7 +80,9 @@ class CustomLoginAPIView(APIView):
         if user:
             # Get or create token for the user
             token, _ = Token.objects.get_or_create(user=user)
-            
+            # Warm the auth cache so the client's first API call skips the token lookup
+            token_cache.set(token.key, (user, token))
+
             return Response({
                 'token': token.key,
                 'user_id': str(user.id),
@@ -88,4 +91,14 @@ class CustomLoginAPIView(APIView):
 
         return Response({
             'error': 'Invalid credentials'
-        }, status=status.HTTP_401_UNAUTHORIZED)
\ No newline at end of file
+        }, status=status.HTTP_401_UNAUTHORIZED)
+
+
+class TokenCacheStatsAPIView(APIView):
+    """
+    API endpoint exposing the token authentication cache counters.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(token_cache.stats(), status=status.HTTP_200_OK)
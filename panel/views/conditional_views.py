@@ -0,0 +1,65 @@
+import hashlib
+from calendar import timegm
+
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+class ConditionalGetMixin:
+    """
+    Adds ETag / Last-Modified validators to list and retrieve.
+
+    ViewSets implement `get_validators()` to return a cheap version token
+    for the data the current request would return (plus an optional
+    last-modified datetime). A matching If-None-Match / If-Modified-Since is
+    answered with 304 before anything is fetched or serialized. With
+    `cache_responses` the serialized payload is also cached under a key that
+    contains the version, so bumping the version invalidates it. The key
+    also contains `get_cache_scope()` (see TenantScopedMixin), so users who
+    see different rows never share a cached payload or an ETag.
+    """
+    cache_responses = False
+    response_cache_timeout = 300
+
+    def get_validators(self):
+        """
+        Return `(version, last_modified)` for the current request, or
+        `(None, None)` to serve it without validators.
+        """
+        return None, None
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, request, *args, **kwargs)
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        version, last_modified = self.get_validators()
+        if version is None:
+            return handler(request, *args, **kwargs)
+
+        key = '|'.join([
+            self.basename, self.action, request.get_full_path(), request.accepted_renderer.format, str(version),
+            self.get_cache_scope(),
+        ])
+        etag = '"%s"' % hashlib.md5(key.encode()).hexdigest()
+        timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+        not_modified = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if not_modified is not None:
+            return not_modified
+
+        cache_key = f'panel:response:{etag}'
+        data = cache.get(cache_key) if self.cache_responses else None
+        if data is not None:
+            response = Response(data)
+        else:
+            response = handler(request, *args, **kwargs)
+            if self.cache_responses and response.status_code == 200:
+                cache.set(cache_key, response.data, self.response_cache_timeout)
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        return response
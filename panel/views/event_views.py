@@ -0,0 +1,129 @@
+import asyncio
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+
+from ..services.events import feed_cache, feed_keys, events_after, alatest_sequence
+from ..tenancy import tenant_scope
+from .async_views import authenticate
+
+
+class OrderEventStreamView(View):
+    """
+    Push feed of order creations and status changes in the user's stores
+    (optionally one `?store=`), so dashboards need not poll the order lists.
+
+    By default the feed is a `text/event-stream` of Server-Sent Events whose
+    `id` is the event sequence; a reconnecting EventSource sends it back as
+    `Last-Event-ID` and resumes after it. With `?since=<id>` the view long-
+    polls instead: it answers as soon as there are events after `id`, or
+    with none after LONG_POLL_TIMEOUT, along with the `last_id` to pass
+    next time (an empty `since=` starts at the current end of the feed).
+
+    With a shared feed cache, waiting costs a cache read per POLL_INTERVAL
+    and the database is only queried when a write signals the watched
+    stores; without one, an indexed query per POLL_INTERVAL (see
+    ORDER_EVENTS). Under ASGI waiting holds no worker; under WSGI the view
+    answers at once with whatever is available.
+    """
+    http_method_names = ['get', 'options']
+
+    async def get(self, request):
+        try:
+            user = await sync_to_async(authenticate)(request)
+        except exceptions.APIException as exc:
+            response = self.render({'detail': exc.detail}, exc.status_code)
+            response['WWW-Authenticate'] = 'Token'
+            return response
+
+        scope = await sync_to_async(tenant_scope)(user)
+        store_ids = None if scope is None else set(scope.store_ids)
+        if request.GET.get('store'):
+            try:
+                store = uuid.UUID(request.GET['store'])
+            except ValueError:
+                return self.render({'store': ['Must be a valid UUID.']}, 400)
+            store_ids = {store} if store_ids is None else {store} & store_ids
+
+        config = settings.ORDER_EVENTS
+        live = isinstance(request, ASGIRequest)
+        if 'since' in request.GET:
+            try:
+                since = int(request.GET['since']) if request.GET['since'] else await alatest_sequence()
+            except ValueError:
+                return self.render({'since': ['A valid integer is required.']}, 400)
+            timeout = config['LONG_POLL_TIMEOUT'] if live else 0
+            events = await self.next_events(store_ids, max(since, 0), timeout)
+            return self.render({'last_id': events[-1]['id'] if events else since, 'events': events})
+
+        try:
+            after = int(request.headers['Last-Event-ID'])
+        except (KeyError, ValueError):
+            after = await alatest_sequence()
+        if not live:
+            events = await self.next_events(store_ids, after, 0)
+            return HttpResponse(''.join(self.format_events(events)), content_type='text/event-stream')
+        response = StreamingHttpResponse(self.stream(store_ids, after), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def stream(self, store_ids, after):
+        config = settings.ORDER_EVENTS
+        deadline = time.monotonic() + config['STREAM_DURATION']
+        yield f'retry: {int(config["POLL_INTERVAL"] * 1000)}\n\n'
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            events = await self.next_events(store_ids, after, min(config['HEARTBEAT'], remaining))
+            if events:
+                after = events[-1]['id']
+                yield ''.join(self.format_events(events))
+            else:
+                yield ': keep-alive\n\n'
+
+    async def next_events(self, store_ids, after, timeout):
+        """
+        Return the events after sequence `after`, waiting up to `timeout`
+        seconds for the first ones.
+
+        The feed counters are read before the database, so an event
+        committed while the query runs changes them and is picked up on
+        the next round. Without a shared feed cache every round queries.
+        """
+        config = settings.ORDER_EVENTS
+        if store_ids is not None and not store_ids:
+            # No store to watch: nothing will ever come
+            await asyncio.sleep(timeout)
+            return []
+        cache, keys = feed_cache(), feed_keys(store_ids)
+        deadline = time.monotonic() + timeout
+        versions, checked = None, None
+        while True:
+            now = time.monotonic()
+            current = None if cache is None else await cache.aget_many(keys)
+            if cache is None or current != versions or now - checked >= config['RECHECK_INTERVAL']:
+                versions, checked = current, now
+                events = [event async for event in events_after(after, store_ids, config['BATCH_SIZE'])]
+                if events:
+                    return events
+            if now >= deadline:
+                return []
+            await asyncio.sleep(min(config['POLL_INTERVAL'], deadline - now))
+
+    def format_events(self, events):
+        for event in events:
+            data = JSONRenderer().render(event).decode()
+            yield f'id: {event["id"]}\nevent: {event["kind"]}\ndata: {data}\n\n'
+
+    def render(self, data, status=200):
+        return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
@@ -0,0 +1,41 @@
+from contextlib import ExitStack
+
+from rest_framework.permissions import SAFE_METHODS
+
+from ..db_routers import choose_replica, reading_from, pin_to_primary, is_pinned_to_primary
+
+
+class ReplicaReadMixin:
+    """
+    Per-action read routing for a ViewSet.
+
+    Safe requests for the actions in `replica_actions` read from a replica
+    (see ReplicaRouter) once the user is authenticated. A successful write
+    pins the user to the primary for READ_YOUR_WRITES_WINDOW seconds, so
+    they read their own writes even while replicas lag.
+    """
+    replica_actions = ('list', 'retrieve', 'export', 'stats')
+
+    def get_read_alias(self, request):
+        """
+        Return the replica alias this request reads from, or None for the primary.
+        """
+        if request.method not in SAFE_METHODS or self.action not in self.replica_actions:
+            return None
+        if request.user.is_authenticated and is_pinned_to_primary(request.user):
+            return None
+        return choose_replica()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.read_scope = ExitStack()
+        self.read_scope.enter_context(reading_from(self.get_read_alias(request)))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        read_scope = getattr(self, 'read_scope', None)
+        if read_scope is not None:
+            read_scope.close()
+            self.read_scope = None
+        if request.method not in SAFE_METHODS and response.status_code < 400 and request.user.is_authenticated:
+            pin_to_primary(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)